@@ -8,7 +8,9 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedIn
 
 from app.services.memory import MemoryService
 from app.services.llm import LLMService
-from app.services.notes import NotesService
+from app.services.notes import NotesService, NotesPage
+from app.services.long_term import LongTermMemory
+from app.jobs.queue import JobQueue
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +49,7 @@ async def cmd_help(message: types.Message):
 <b>📝 Заметки:</b>
 /note &lt;текст&gt; — Создать заметку
 /notes — Показать все заметки
+/findnote &lt;запрос&gt; — Найти заметки
 /delnote &lt;id&gt; — Удалить заметку
 
 <b>🌍 Перевод:</b>
@@ -57,10 +60,12 @@ async def cmd_help(message: types.Message):
 
 # ============ /clear ============
 @router.message(Command("clear"))
-async def cmd_clear(message: types.Message, memory_service: MemoryService):
+async def cmd_clear(message: types.Message, memory_service: MemoryService, long_term_memory: LongTermMemory):
     if not message.from_user:
         return
     await memory_service.clear_history(message.from_user.id)
+    # Архив старых разговоров тоже забываем, заметки остаются
+    await long_term_memory.forget_turns(message.from_user.id)
     await message.answer("История диалога очищена! 🧹")
 
 
@@ -95,7 +100,7 @@ async def callback_mode(callback: types.CallbackQuery, memory_service: MemorySer
 
 # ============ /think ============
 @router.message(Command("think"))
-async def cmd_think(message: types.Message, llm_service: LLMService, memory_service: MemoryService):
+async def cmd_think(message: types.Message, job_queue: JobQueue):
     if not message.from_user or not message.text:
         return
     
@@ -105,18 +110,8 @@ async def cmd_think(message: types.Message, llm_service: LLMService, memory_serv
         await message.answer("Напиши вопрос после /think\nПример: /think Почему небо голубое?")
         return
     
-    await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-    
-    # Используем R1 для глубокого мышления
-    response = await llm_service.generate_response_r1(question)
-    
-    # Форматируем ответ (R1 возвращает теги <think>)
-    formatted = format_r1_response(response)
-    
-    try:
-        await message.answer(formatted, parse_mode="HTML")
-    except Exception:
-        await message.answer(response)
+    # R1 думает долго: запрос выполняется как задача (см. app/jobs/tasks.py: run_think)
+    await job_queue.submit(message.bot, "think", {"chat_id": message.chat.id, "question": question})
 
 
 def format_r1_response(text: str) -> str:
@@ -139,6 +134,13 @@ def format_r1_response(text: str) -> str:
     return html.escape(text)
 
 
+def format_r1_partial(text: str) -> str:
+    """Промежуточный вид ответа R1, пока модель ещё думает."""
+    if "<think>" in text and "</think>" not in text:
+        return "💭 <i>Думаю...</i>"
+    return format_r1_response(text)
+
+
 # ============ /note ============
 @router.message(Command("note"))
 async def cmd_note(message: types.Message, notes_service: NotesService):
@@ -155,23 +157,143 @@ async def cmd_note(message: types.Message, notes_service: NotesService):
 
 
 # ============ /notes ============
+NOTES_PAGE_SIZE = 10
+
+
+def render_notes_page(page: NotesPage):
+    """Текст страницы заметок и кнопки листания."""
+    lines = ["<b>📝 Твои заметки:</b>\n"]
+    for note in page.notes:
+        safe_text = html.escape(note.get("text", ""))[:100]
+        lines.append(f"<b>#{note.get('id')}</b>: {safe_text}")
+
+    buttons = []
+    if page.prev_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data="notes_prev:{}:{}".format(*page.prev_cursor)))
+    if page.next_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="Дальше ➡️", callback_data="notes_next:{}:{}".format(*page.next_cursor)))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(lines), keyboard
+
+
 @router.message(Command("notes"))
 async def cmd_notes(message: types.Message, notes_service: NotesService):
     if not message.from_user:
         return
     
-    notes = await notes_service.get_notes(message.from_user.id)
+    page = await notes_service.get_page(message.from_user.id, limit=NOTES_PAGE_SIZE)
     
-    if not notes:
+    if not page.notes:
         await message.answer("📭 У тебя нет заметок.\nСоздай: /note <текст>")
         return
     
-    lines = ["<b>📝 Твои заметки:</b>\n"]
+    text, keyboard = render_notes_page(page)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(lambda c: c.data and c.data.startswith(("notes_next:", "notes_prev:")))
+async def callback_notes_page(callback: types.CallbackQuery, notes_service: NotesService):
+    if not callback.from_user or not callback.data:
+        return
+
+    direction, cursor = callback.data.split(":", 1)
+    # callback_data приходит от клиента: курсор "время:id" может быть любым
+    try:
+        created, note_id = cursor.split(":")
+        cursor = (int(created), str(int(note_id)))
+    except ValueError:
+        await callback.answer("Список устарел, открой /notes заново")
+        return
+
+    page = await notes_service.get_page(
+        callback.from_user.id,
+        cursor=cursor,
+        backward=direction == "notes_prev",
+        limit=NOTES_PAGE_SIZE
+    )
+
+    if not page.notes:
+        await callback.answer("Здесь заметок больше нет")
+        return
+
+    text, keyboard = render_notes_page(page)
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+# ============ /findnote ============
+FINDNOTE_PAGE_SIZE = 5
+
+
+def findnote_query_key(user_id: int) -> str:
+    # Запрос не влезает в callback_data (64 байта): храним последний в Redis
+    return f"notes:{user_id}:last_query"
+
+
+async def render_findnote_page(notes_service: NotesService, user_id: int, query: str, offset: int):
+    total, notes = await notes_service.search(user_id, query, offset=offset, limit=FINDNOTE_PAGE_SIZE)
+    if not notes:
+        return None, None
+
+    lines = [f"<b>🔎 Заметки по запросу «{html.escape(query)}»</b> ({offset + 1}–{offset + len(notes)} из {total}):\n"]
     for note in notes:
-        safe_text = html.escape(note.get("text", ""))[:100]
+        safe_text = html.escape(note.get("text", ""))[:200]
         lines.append(f"<b>#{note.get('id')}</b>: {safe_text}")
-    
-    await message.answer("\n".join(lines), parse_mode="HTML")
+
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"findnote:{max(offset - FINDNOTE_PAGE_SIZE, 0)}"))
+    if offset + len(notes) < total:
+        buttons.append(InlineKeyboardButton(text="Дальше ➡️", callback_data=f"findnote:{offset + FINDNOTE_PAGE_SIZE}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(lines), keyboard
+
+
+@router.message(Command("findnote"))
+async def cmd_findnote(message: types.Message, notes_service: NotesService, memory_service: MemoryService):
+    if not message.from_user or not message.text:
+        return
+
+    query = message.text.replace("/findnote", "").strip()
+    if not query:
+        await message.answer("Напиши, что искать, после /findnote\nПример: /findnote пароль wifi")
+        return
+
+    user_id = message.from_user.id
+    text, keyboard = await render_findnote_page(notes_service, user_id, query, 0)
+    if text is None:
+        await message.answer("Ничего не нашлось 🤷")
+        return
+
+    await memory_service._redis.set(findnote_query_key(user_id), query, ex=3600)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(lambda c: c.data and c.data.startswith("findnote:"))
+async def callback_findnote_page(callback: types.CallbackQuery, notes_service: NotesService, memory_service: MemoryService):
+    if not callback.from_user or not callback.data:
+        return
+
+    # callback_data приходит от клиента: смещение должно быть целым и неотрицательным
+    try:
+        offset = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        await callback.answer("Поиск устарел, повтори /findnote")
+        return
+
+    user_id = callback.from_user.id
+    query = await memory_service._redis.get(findnote_query_key(user_id))
+    text = None
+    if query:
+        text, keyboard = await render_findnote_page(notes_service, user_id, query, offset)
+    if text is None:
+        await callback.answer("Поиск устарел, повтори /findnote")
+        return
+
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
 
 
 # ============ /delnote ============
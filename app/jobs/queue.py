@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from aiogram import Bot
+from redis.asyncio import Redis
+
+from app.metrics import track
+from app.middlewares.outbound import recording_posts
+from app.jobs.tasks import JOB_HANDLERS, JOB_PRIORITY, JOB_FAILED_TEXT
+from config import JobsConfig
+
+logger = logging.getLogger(__name__)
+
+DELAYED_KEY = "jobs:delayed"
+WORKERS_KEY = "jobs:workers"
+# A worker whose heartbeat is older than this is dead: its jobs go back to the queues
+HEARTBEAT_TTL = 30
+
+# Move the first job of the first non-empty queue (KEYS in priority order)
+# into the worker's processing list, so a crash can't lose it.
+# KEYS: queues..., processing list
+_PULL_SCRIPT = """
+local processing = KEYS[#KEYS]
+for i = 1, #KEYS - 1 do
+    local job = redis.call('LMOVE', KEYS[i], processing, 'LEFT', 'RIGHT')
+    if job then
+        return job
+    end
+end
+return false
+"""
+
+# Put a dead worker's unfinished jobs back at the head of their queues.
+# KEYS: processing list; ARGV: queue key prefix
+_REQUEUE_SCRIPT = """
+local count = 0
+while true do
+    local job = redis.call('RPOP', KEYS[1])
+    if not job then
+        return count
+    end
+    redis.call('LPUSH', ARGV[1] .. cjson.decode(job)['type'], job)
+    count = count + 1
+end
+"""
+
+
+def queue_key(job_type: str) -> str:
+    return f"jobs:queue:{job_type}"
+
+
+def processing_key(worker: str) -> str:
+    return f"jobs:processing:{worker}"
+
+
+def heartbeat_key(worker: str) -> str:
+    return f"jobs:worker:{worker}"
+
+
+class JobQueue:
+    """
+    Redis-backed queue for slow operations (/think, voice, vision).
+
+    Handlers call submit() and return immediately; JobWorker processes pull
+    the jobs. With jobs disabled, submit() runs the job inline instead, so
+    the same code path serves both setups.
+    """
+
+    def __init__(self, redis_client: Redis, config: JobsConfig, deps: Dict[str, Any]):
+        self._redis = redis_client
+        self._config = config
+        self._deps = deps
+
+    async def submit(self, bot: Bot, job_type: str, payload: Dict[str, Any]):
+        if not self._config.enabled:
+            try:
+                await JOB_HANDLERS[job_type](bot, self._deps, payload)
+            except Exception as e:
+                logger.error(f"Inline {job_type} job failed: {e}", exc_info=True)
+                await notify_failure(bot, job_type, payload)
+            return
+
+        job = {"id": uuid.uuid4().hex, "type": job_type, "attempts": 0, "payload": payload}
+        await self._redis.rpush(queue_key(job_type), json.dumps(job, ensure_ascii=False))
+
+
+async def notify_failure(bot: Bot, job_type: str, payload: Dict[str, Any]):
+    try:
+        await bot.send_message(payload["chat_id"], JOB_FAILED_TEXT[job_type])
+    except Exception as e:
+        logger.error(f"Error reporting failed {job_type} job: {e}")
+
+
+class JobWorker:
+    """
+    Pulls jobs by priority (JOB_PRIORITY order) while respecting a
+    concurrency limit per job type: a saturated type is simply not polled,
+    so one class of work can't starve the others.
+
+    A pulled job sits in the worker's processing list until it is done; the
+    lists of workers whose heartbeat expired are put back on the queues, and
+    so is the worker's own list when it starts (a restarted container keeps
+    its hostname and pid, so it comes back under the same name). A
+    failed job is retried with exponential backoff through a delayed set if
+    it hasn't posted anything to the chat yet (a retry would post again),
+    otherwise, or once attempts run out, the failure is reported to the chat.
+    """
+
+    def __init__(self, redis_client: Redis, config: JobsConfig, bot: Bot, deps: Dict[str, Any], name: Optional[str] = None):
+        self._redis = redis_client
+        self._config = config
+        self._bot = bot
+        self._deps = deps
+        self._name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self._processing = processing_key(self._name)
+        self._pull_job = redis_client.register_script(_PULL_SCRIPT)
+        self._requeue = redis_client.register_script(_REQUEUE_SCRIPT)
+        self._running = {job_type: 0 for job_type in JOB_PRIORITY}
+        self._tasks = set()
+
+    def _limit(self, job_type: str) -> int:
+        return self._config.limits.get(job_type, 1)
+
+    async def _heartbeat(self):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(heartbeat_key(self._name), int(time.time()), ex=HEARTBEAT_TTL)
+            pipe.sadd(WORKERS_KEY, self._name)
+            await pipe.execute()
+
+    async def _recover(self):
+        """Requeue the jobs of workers whose heartbeat expired (crashed or restarted)."""
+        for worker in await self._redis.smembers(WORKERS_KEY):
+            if worker == self._name or await self._redis.exists(heartbeat_key(worker)):
+                continue
+            count = await self._requeue(keys=[processing_key(worker)], args=[queue_key("")])
+            if count:
+                logger.warning(f"Requeued {count} unfinished job(s) of worker {worker}")
+            await self._redis.srem(WORKERS_KEY, worker)
+
+    async def _reclaim(self):
+        """Requeue what a previous run under this name left in its processing list."""
+        count = await self._requeue(keys=[self._processing], args=[queue_key("")])
+        if count:
+            logger.warning(f"Requeued {count} unfinished job(s) of the previous run of {self._name}")
+
+    async def _promote_delayed(self):
+        """Move retries whose backoff has expired back to their queues."""
+        due = await self._redis.zrangebyscore(DELAYED_KEY, "-inf", time.time(), start=0, num=100)
+        for raw in due:
+            # ZREM decides which worker owns the retry
+            if await self._redis.zrem(DELAYED_KEY, raw):
+                job = json.loads(raw)
+                await self._redis.rpush(queue_key(job["type"]), raw)
+
+    async def _pull(self) -> Optional[str]:
+        available = [queue_key(t) for t in JOB_PRIORITY if self._running[t] < self._limit(t)]
+        if available:
+            raw = await self._pull_job(keys=available + [self._processing])
+            if raw is not None:
+                return raw
+        # BLMOVE only watches one list: poll the queues instead
+        await asyncio.sleep(0.2)
+        return None
+
+    async def _execute(self, raw: str):
+        job = json.loads(raw)
+        job_type = job["type"]
+        try:
+            with recording_posts() as record, track("job", job_type):
+                await JOB_HANDLERS[job_type](self._bot, self._deps, job["payload"])
+        except Exception as e:
+            job["attempts"] += 1
+            async with self._redis.pipeline(transaction=True) as pipe:
+                if not record.posted and job["attempts"] < self._config.max_attempts:
+                    delay = self._config.backoff * 2 ** (job["attempts"] - 1)
+                    logger.warning(f"Job {job['id']} ({job_type}) failed, retry in {delay:.1f}s: {e}")
+                    pipe.zadd(DELAYED_KEY, {json.dumps(job, ensure_ascii=False): time.time() + delay})
+                else:
+                    logger.error(f"Job {job['id']} ({job_type}) failed for good: {e}", exc_info=True)
+                pipe.lrem(self._processing, 1, raw)
+                await pipe.execute()
+            if record.posted or job["attempts"] >= self._config.max_attempts:
+                await notify_failure(self._bot, job_type, job["payload"])
+        else:
+            await self._redis.lrem(self._processing, 1, raw)
+        finally:
+            self._running[job_type] -= 1
+
+    async def run(self):
+        logger.info(f"Job worker {self._name} started with limits {self._config.limits}")
+        # Before pulling anything: only jobs of a previous run can be in the list yet
+        await self._reclaim()
+        loop = asyncio.get_running_loop()
+        next_promote = next_heartbeat = 0.0
+        while True:
+            try:
+                if loop.time() >= next_heartbeat:
+                    await self._heartbeat()
+                    await self._recover()
+                    next_heartbeat = loop.time() + HEARTBEAT_TTL / 3
+                if loop.time() >= next_promote:
+                    await self._promote_delayed()
+                    next_promote = loop.time() + 1
+
+                raw = await self._pull()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error pulling jobs: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if raw is None:
+                continue
+            self._running[json.loads(raw)["type"]] += 1
+            task = asyncio.create_task(self._execute(raw))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
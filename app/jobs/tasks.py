@@ -0,0 +1,169 @@
+"""
+Slow operations executed as jobs: /think, voice transcription + reply and
+vision analysis. Each takes the bot, the injected services and a JSON payload,
+and delivers its result to the chat itself.
+"""
+import io
+import html
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+from aiogram import Bot
+from aiogram.types import PhotoSize
+
+from app.services.llm import VISION_EMPTY
+from app.services.turns import Turn
+from app.utils.streaming import send_html, stream_reply
+from app.utils.text import format_text_html, split_html
+
+logger = logging.getLogger(__name__)
+
+
+async def run_think(bot: Bot, deps: Dict[str, Any], payload: Dict[str, Any]):
+    """/think: DeepSeek R1, streamed to the chat."""
+    # Imported here: the commands module also registers the /think handler
+    from app.handlers.commands import format_r1_partial, format_r1_response
+
+    llm_service = deps["llm_service"]
+    chat_id = payload["chat_id"]
+
+    await bot.send_chat_action(chat_id=chat_id, action="typing")
+
+    # Используем R1 для глубокого мышления, ответ показываем по мере генерации
+    # Форматируем ответ (R1 возвращает теги <think>)
+    await stream_reply(
+        bot,
+        chat_id,
+        llm_service.stream_response_r1(payload["question"]),
+        render=format_r1_partial,
+        render_final=format_r1_response,
+        edit_interval=deps["config"].llm.stream_edit_interval
+    )
+
+
+async def _transcribe(bot: Bot, deps: Dict[str, Any], payload: Dict[str, Any]) -> str:
+    voice_service = deps["voice_service"]
+    media_cache = deps["media_cache"]
+
+    # Forwarded voice notes keep their file_unique_id: reuse the transcript
+    transcribed_text = await media_cache.get("stt", payload["file_unique_id"], voice_service.model)
+    if transcribed_text is None:
+        # 1. Download voice file into memory
+        buffer = io.BytesIO()
+        await bot.download(payload["file_id"], destination=buffer)
+
+        # 2. Transcribe
+        transcribed_text = await voice_service.transcribe(buffer.getvalue(), duration=payload.get("duration"))
+        if transcribed_text:
+            await media_cache.set("stt", payload["file_unique_id"], voice_service.model, transcribed_text)
+    return transcribed_text
+
+
+async def run_voice(bot: Bot, deps: Dict[str, Any], payload: Dict[str, Any]):
+    """Voice note: transcribe, then answer it like a text message."""
+    turn_pipeline = deps["turn_pipeline"]
+    chat_id = payload["chat_id"]
+    turn = Turn("voice", payload["user_id"])
+
+    # History and settings don't depend on the transcript: load them meanwhile
+    results = await turn.gather(
+        typing=bot.send_chat_action(chat_id=chat_id, action="typing"),
+        transcribe=_transcribe(bot, deps, payload),
+        context=turn_pipeline.load_context(turn.user_id)
+    )
+    transcribed_text = results["transcribe"]
+
+    if not transcribed_text:
+        await bot.send_message(chat_id, "Не удалось распознать голосовое сообщение 😢")
+        return
+
+    # 3. Process as text
+    # Escaping transcribed text just in case
+    safe_transcription = html.escape(transcribed_text)
+
+    # Generate and stream response, then add to history (User + Assistant)
+    await turn_pipeline.answer(
+        bot,
+        chat_id,
+        transcribed_text,
+        turn,
+        context=results["context"],
+        prefix=f"🎤 <i>{safe_transcription}</i>\n\n"
+    )
+
+
+async def _analyze(bot: Bot, deps: Dict[str, Any], photos: List[List[PhotoSize]], caption: str) -> str:
+    llm_service = deps["llm_service"]
+    media_cache = deps["media_cache"]
+    image_service = deps["image_service"]
+
+    # Ключ кэша — фото в максимальном разрешении (последний элемент)
+    cache_id = "+".join(photo[-1].file_unique_id for photo in photos)
+
+    # Пересланное фото уже анализировали: не скачиваем и не вызываем модель
+    analysis = await media_cache.get("vision", cache_id, llm_service.vision_model, caption)
+    if analysis is None:
+        started_at = time.monotonic()
+
+        # Скачиваем в память самый маленький подходящий размер и конвертируем в base64
+        images = await asyncio.gather(*(image_service.prepare(bot, photo) for photo in photos))
+
+        # Анализируем все изображения одним запросом
+        analysis = await llm_service.analyze_images([image.base64 for image in images], caption)
+        logger.info(
+            f"Vision request: {len(images)} image(s), {sum(image.bytes_sent for image in images)} bytes sent, "
+            f"{time.monotonic() - started_at:.2f}s end-to-end"
+        )
+        if analysis != VISION_EMPTY:
+            await media_cache.set("vision", cache_id, llm_service.vision_model, analysis, caption)
+    return analysis
+
+
+async def _send_analysis(bot: Bot, chat_id: int, title: str, analysis: str):
+    # Форматируем и отправляем
+    formatted = format_text_html(analysis)
+    await send_html(bot, chat_id, split_html(f"🖼 <b>{title}:</b>\n\n{formatted}"))
+
+
+async def run_vision(bot: Bot, deps: Dict[str, Any], payload: Dict[str, Any]):
+    """Photo or album: one vision request, one reply."""
+    chat_id = payload["chat_id"]
+    caption = payload.get("caption", "")
+    photos = [[PhotoSize.model_validate(size) for size in photo] for photo in payload["photos"]]
+    turn = Turn("vision", payload["user_id"])
+
+    results = await turn.gather(
+        typing=bot.send_chat_action(chat_id=chat_id, action="typing"),
+        analyze=_analyze(bot, deps, photos, caption)
+    )
+    analysis = results["analyze"]
+
+    title = "Анализ изображения" if len(photos) == 1 else f"Анализ изображений ({len(photos)})"
+    await turn.stage("reply", _send_analysis(bot, chat_id, title, analysis))
+
+    # Добавляем в историю уже после ответа
+    label = "[Фото]" if len(photos) == 1 else f"[Фото x{len(photos)}]"
+    user_msg = label + (f": {caption}" if caption else "")
+    deps["turn_pipeline"].persist(
+        turn,
+        {"role": "user", "content": user_msg},
+        {"role": "assistant", "content": analysis}
+    )
+
+
+JOB_HANDLERS: Dict[str, Callable[[Bot, Dict[str, Any], Dict[str, Any]], Awaitable[None]]] = {
+    "think": run_think,
+    "voice": run_voice,
+    "vision": run_vision,
+}
+
+# Pulled in this order: interactive chat first, batch-like /think last
+JOB_PRIORITY = ["voice", "vision", "think"]
+
+# Sent when a job fails for good
+JOB_FAILED_TEXT = {
+    "think": "Не удалось обработать запрос в режиме мышления...",
+    "voice": "Не удалось распознать голосовое сообщение 😢",
+    "vision": "Произошла ошибка при анализе изображения...",
+}
@@ -0,0 +1,232 @@
+"""
+Prometheus metrics and the local HTTP endpoint that serves them.
+
+    vera_update_seconds{type}                   handling of one Telegram update
+    vera_turn_stage_seconds{kind,stage}         stages of a chat turn (app.services.turns)
+    vera_call_seconds{component,operation}      services and upstream APIs (Redis, Tavily, Groq, ffmpeg, jobs)
+    vera_llm_seconds{model,operation}           OpenRouter requests, plus time to the first streamed token
+    vera_telegram_request_seconds{method}       Bot API requests, plus the send queue
+    ..._errors_total, ..._in_flight             failures by exception type, calls running right now
+
+Recording is a perf_counter pair and an observe on a label child (a few
+microseconds); counters that services already keep (stats()) are read only
+when Prometheus scrapes, on the event loop, before rendering moves to a thread.
+"""
+import time
+import asyncio
+import logging
+import functools
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import Collector
+
+from config import MetricsConfig
+
+logger = logging.getLogger(__name__)
+
+# Seconds: Redis calls sit at the bottom, model replies and voice jobs at the top
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+UPDATE_SECONDS = Histogram("vera_update_seconds", "Time to handle an update", ["type"], buckets=BUCKETS)
+UPDATE_ERRORS = Counter("vera_update_errors_total", "Updates whose handler raised", ["type", "error"])
+UPDATES_IN_FLIGHT = Gauge("vera_updates_in_flight", "Updates being handled")
+
+TURN_STAGE_SECONDS = Histogram("vera_turn_stage_seconds", "Duration of chat turn stages", ["kind", "stage"], buckets=BUCKETS)
+
+CALL_SECONDS = Histogram("vera_call_seconds", "Duration of service and upstream calls", ["component", "operation"], buckets=BUCKETS)
+CALL_ERRORS = Counter("vera_call_errors_total", "Service and upstream calls that raised", ["component", "operation", "error"])
+CALLS_IN_FLIGHT = Gauge("vera_calls_in_flight", "Service and upstream calls running", ["component"])
+
+LLM_SECONDS = Histogram("vera_llm_seconds", "Duration of model requests (streams until the last chunk)", ["model", "operation"], buckets=BUCKETS)
+LLM_FIRST_TOKEN_SECONDS = Histogram("vera_llm_first_token_seconds", "Time to the first streamed token", ["model"], buckets=BUCKETS)
+LLM_ERRORS = Counter("vera_llm_errors_total", "Model requests that failed", ["model", "operation", "error"])
+LLM_IN_FLIGHT = Gauge("vera_llm_in_flight", "Model requests running", ["model"])
+
+TELEGRAM_SECONDS = Histogram("vera_telegram_request_seconds", "Duration of Bot API requests", ["method"], buckets=BUCKETS)
+TELEGRAM_ERRORS = Counter("vera_telegram_errors_total", "Bot API requests that failed", ["method", "error"])
+OUTBOUND_QUEUED = Gauge("vera_outbound_queued", "Requests waiting in the send queue", ["priority"])
+OUTBOUND_LATENCY = Histogram("vera_outbound_latency_seconds", "Send queue wait plus the request itself", ["priority"], buckets=BUCKETS)
+
+
+class _Track:
+    __slots__ = ("_seconds", "_in_flight", "_component", "_operation", "_started_at")
+
+    def __init__(self, component: str, operation: str, seconds=None, in_flight=None):
+        self._component = component
+        self._operation = operation
+        self._seconds = seconds or CALL_SECONDS.labels(component, operation)
+        self._in_flight = in_flight or CALLS_IN_FLIGHT.labels(component)
+
+    def __enter__(self):
+        self._in_flight.inc()
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._seconds.observe(time.perf_counter() - self._started_at)
+        self._in_flight.dec()
+        if exc_type is not None and issubclass(exc_type, Exception):
+            CALL_ERRORS.labels(self._component, self._operation, exc_type.__name__).inc()
+        return False
+
+
+def track(component: str, operation: str) -> _Track:
+    """
+    Time a block as a call of `component`:
+
+        with track("tavily", "search"):
+            ...
+    """
+    return _Track(component, operation)
+
+
+def observed(component: str, operation: Optional[str] = None):
+    """Decorator for async methods: every call is tracked as `component`/`operation` (default: the method name)."""
+    def decorate(func):
+        name = operation or func.__name__
+        # Label lookups take a lock: resolve them once, not per call
+        seconds = CALL_SECONDS.labels(component, name)
+        in_flight = CALLS_IN_FLIGHT.labels(component)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _Track(component, name, seconds, in_flight):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_error(component: str, operation: str, error: Exception):
+    """For calls that catch their own errors (and return a fallback) instead of raising."""
+    CALL_ERRORS.labels(component, operation, type(error).__name__).inc()
+
+
+class LLMCall:
+    """
+    Like track(), for a model request: labelled by model, knows when the first
+    token came. A stream ends at the last chunk() the model returned, not when
+    the block is left: a generator leaves it only after its consumer (Telegram
+    edits, the send queue) is done with the last delta.
+    """
+
+    __slots__ = ("_model", "_operation", "_started_at", "_first_token", "_last_chunk_at")
+
+    def __init__(self, model: str, operation: str):
+        self._model = model
+        self._operation = operation
+        self._first_token = False
+        self._last_chunk_at: Optional[float] = None
+
+    def __enter__(self):
+        LLM_IN_FLIGHT.labels(self._model).inc()
+        self._started_at = time.perf_counter()
+        return self
+
+    def first_token(self):
+        if not self._first_token:
+            self._first_token = True
+            LLM_FIRST_TOKEN_SECONDS.labels(self._model).observe(time.perf_counter() - self._started_at)
+
+    def chunk(self):
+        self._last_chunk_at = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        failed = exc_type is not None and issubclass(exc_type, Exception)
+        ended_at = self._last_chunk_at if self._last_chunk_at is not None and not failed else time.perf_counter()
+        LLM_SECONDS.labels(self._model, self._operation).observe(ended_at - self._started_at)
+        LLM_IN_FLIGHT.labels(self._model).dec()
+        if failed:
+            LLM_ERRORS.labels(self._model, self._operation, exc_type.__name__).inc()
+        return False
+
+
+def observe_turn(kind: str, timings: Dict[str, float]):
+    for stage, seconds in timings.items():
+        TURN_STAGE_SECONDS.labels(kind, stage).observe(seconds)
+
+
+# Run on the event loop before every scrape: services' stats() read structures the loop mutates
+_SNAPSHOTS: List[Callable[[], None]] = []
+
+
+def snapshot_service_stats():
+    for snapshot in _SNAPSHOTS:
+        snapshot()
+
+
+class StatsCollector(Collector):
+    """
+    Exposes integer counters from a stats() dict as vera_<name>_total{event}.
+    stats() is read by snapshot() on the event loop; collect(), which runs in
+    the rendering thread, only reads that copy.
+    """
+
+    def __init__(self, name: str, documentation: str, stats: Callable[[], Dict[str, Any]], keys: Iterable[str]):
+        self._name = name
+        self._documentation = documentation
+        self._stats = stats
+        self._keys = tuple(keys)
+        self._snapshot: Dict[str, Any] = {}
+
+    def snapshot(self):
+        stats = self._stats()
+        self._snapshot = {key: stats.get(key, 0) for key in self._keys}
+
+    def collect(self):
+        family = CounterMetricFamily(f"vera_{self._name}", self._documentation, labels=["event"])
+        stats = self._snapshot
+        for key in self._keys:
+            family.add_metric([key], stats.get(key, 0))
+        yield family
+
+
+def register_service_stats(deps: Dict[str, Any]):
+    """Counters the search cache and the send queue keep (once per process)."""
+    outbound = deps["outbound"]
+    collectors = [
+        StatsCollector(
+            "search_cache", "Search cache lookups by outcome",
+            deps["search_service"].cache_stats, ("local_hits", "redis_hits", "misses", "coalesced")
+        ),
+        StatsCollector(
+            "outbound", "Send queue outcomes",
+            outbound.stats, ("sent", "failed", "retry_after", "superseded", "collapsed_actions")
+        ),
+    ]
+    for collector in collectors:
+        REGISTRY.register(collector)
+        _SNAPSHOTS.append(collector.snapshot)
+
+    def snapshot_queue_depth():
+        for priority, depth in outbound.stats()["queued_by_priority"].items():
+            OUTBOUND_QUEUED.labels(priority).set(depth)
+    _SNAPSHOTS.append(snapshot_queue_depth)
+
+
+class MetricsServer:
+    """Serves GET /metrics in the Prometheus text format on a local port."""
+
+    def __init__(self, config: MetricsConfig, port_offset: int = 0):
+        self._config = config
+        self._port = config.port + port_offset
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        # Reading the services' stats must happen on the loop; rendering walks every series, so it doesn't
+        snapshot_service_stats()
+        body = await asyncio.to_thread(generate_latest, REGISTRY)
+        return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._config.host, self._port).start()
+        logger.info(f"Metrics on http://{self._config.host}:{self._port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,32 @@
+import time
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from aiogram.types.update import UpdateTypeLookupError
+
+from app.metrics import UPDATE_SECONDS, UPDATE_ERRORS, UPDATES_IN_FLIGHT
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: how long each update took to handle, by type, and which ones raised."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        except UpdateTypeLookupError:
+            update_type = "unknown"
+        UPDATES_IN_FLIGHT.inc()
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            UPDATE_ERRORS.labels(update_type, type(e).__name__).inc()
+            raise
+        finally:
+            UPDATE_SECONDS.labels(update_type).observe(time.perf_counter() - started_at)
+            UPDATES_IN_FLIGHT.dec()
@@ -0,0 +1,325 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.metrics import TELEGRAM_SECONDS, TELEGRAM_ERRORS, OUTBOUND_LATENCY
+from config import OutboundConfig
+
+logger = logging.getLogger(__name__)
+
+# Lower goes first within a chat
+PRIORITY_REPLY = 0  # messages, final edits, deletions
+PRIORITY_PREVIEW = 1  # progressive edits of a streamed reply
+PRIORITY_ACTION = 2  # "typing..." and friends
+PRIORITY_NAMES = {PRIORITY_REPLY: "reply", PRIORITY_PREVIEW: "preview", PRIORITY_ACTION: "action"}
+
+# Methods that post to a chat and count against its rate limit
+_QUEUED_PREFIXES = ("Send", "Edit", "Delete", "Copy", "Forward")
+# Telegram shows a chat action for ~5 s or until the bot sends a message
+ACTION_TTL = 4.0
+# Chat states kept before idle ones are dropped
+_MAX_CHATS = 10000
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=PRIORITY_REPLY)
+_posts: ContextVar[Optional["PostRecord"]] = ContextVar("outbound_posts", default=None)
+
+
+@contextmanager
+def previews():
+    """Requests made inside are streaming previews: replies overtake them and a newer edit replaces a queued one."""
+    token = _priority.set(PRIORITY_PREVIEW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class PostRecord:
+    __slots__ = ("posted",)
+
+    def __init__(self):
+        self.posted = False
+
+
+@contextmanager
+def recording_posts():
+    """The yielded record's `posted` turns True once a request made inside posts to a chat (chat actions don't count)."""
+    record = PostRecord()
+    token = _posts.set(record)
+    try:
+        yield record
+    finally:
+        _posts.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= self.burst
+
+
+class _Request:
+    def __init__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod, priority: int, seq: int):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.waiters = 0  # callers awaiting the result (a superseded edit shares it)
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting any more (superseded or cancelled caller)
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+class _Chat:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queue: List[_Request] = []
+        self.paused_until = 0.0
+        self.pump: Optional[asyncio.Task] = None
+        self.last_action: Optional[tuple] = None  # (action, sent at)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Session middleware every Telegram API call goes through.
+
+    Requests that post to a chat are queued per chat and sent one at a time
+    when both the chat's and the bot-wide token bucket allow it, replies
+    first, then streaming previews, then chat actions. RetryAfter pauses the
+    chat and the reply is retried; a preview is dropped instead (the caller
+    gets the exception), an action silently. A queued preview edit is replaced by a
+    newer edit of the same message, and chat actions are collapsed: one
+    queued per chat, none repeated while the previous one is still shown.
+    Other methods (getUpdates, getFile, ...) pass straight through.
+    """
+
+    def __init__(self, config: OutboundConfig):
+        self._config = config
+        self._global = TokenBucket(config.global_rate, config.global_rate)
+        self._chats: Dict[Union[int, str], _Chat] = {}
+        self._seq = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._stats = {"sent": 0, "failed": 0, "retry_after": 0, "superseded": 0, "collapsed_actions": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, current queue depth by priority, and send latency (queue wait included) percentiles."""
+        depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for chat in self._chats.values():
+            for request in chat.queue:
+                depth[PRIORITY_NAMES[request.priority]] += 1
+        latencies = sorted(self._latencies)
+        return dict(
+            self._stats,
+            queued=sum(depth.values()),
+            queued_by_priority=depth,
+            latency_p50=latencies[len(latencies) // 2] if latencies else 0.0,
+            latency_p95=latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        )
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        chat_id = getattr(method, "chat_id", None)
+        posts = chat_id is not None and type(method).__name__.startswith(_QUEUED_PREFIXES)
+        if posts and not isinstance(method, SendChatAction):
+            record = _posts.get()
+            if record is not None:
+                record.posted = True
+        if not self._config.enabled or not posts:
+            return await self._request(make_request, bot, method)
+
+        chat = self._chat(chat_id)
+        if isinstance(method, SendChatAction):
+            priority = PRIORITY_ACTION
+            if self._action_shown(chat, method.action):
+                self._stats["collapsed_actions"] += 1
+                return True
+        else:
+            priority = _priority.get()
+
+        queued = self._queued_match(chat, method, priority)
+        if queued is not None:
+            # The newer content wins; both callers get its result
+            queued.method = method
+            queued.priority = min(queued.priority, priority)
+            self._stats["collapsed_actions" if priority == PRIORITY_ACTION else "superseded"] += 1
+            return await self._wait(chat, queued)
+
+        self._seq += 1
+        request = _Request(make_request, bot, method, priority, self._seq)
+        chat.queue.append(request)
+        if chat.pump is None:
+            chat.pump = asyncio.create_task(self._pump(chat))
+        return await self._wait(chat, request)
+
+    async def _wait(self, chat: _Chat, request: _Request) -> Any:
+        """
+        Await the request's result. If every caller waiting for it is
+        cancelled before it was taken off the queue, it is never sent (a
+        reply cancelled while its first preview is still queued leaves
+        nothing behind); once sending started it can't be taken back.
+        """
+        request.waiters += 1
+        try:
+            return await asyncio.shield(request.future)
+        except asyncio.CancelledError:
+            if request.waiters == 1 and request in chat.queue:
+                chat.queue.remove(request)
+                request.future.cancel()
+            raise
+        finally:
+            request.waiters -= 1
+
+    def _chat(self, chat_id: Union[int, str]) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= _MAX_CHATS:
+                self._drop_idle_chats()
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(
+                self._config.group_rate if group else self._config.chat_rate,
+                self._config.group_burst if group else self._config.chat_burst
+            )
+            chat = self._chats[chat_id] = _Chat(bucket)
+        return chat
+
+    def _drop_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [
+            chat_id for chat_id, chat in self._chats.items()
+            if chat.pump is None and chat.paused_until <= now and chat.bucket.full(now)
+        ]:
+            del self._chats[chat_id]
+
+    def _action_shown(self, chat: _Chat, action: str) -> bool:
+        return (
+            chat.last_action is not None
+            and chat.last_action[0] == action
+            and time.monotonic() - chat.last_action[1] < ACTION_TTL
+        )
+
+    def _queued_match(self, chat: _Chat, method: TelegramMethod, priority: int) -> Optional[_Request]:
+        """A queued request this one makes pointless: any chat action, or an edit of the same message."""
+        for request in chat.queue:
+            if request.attempts:
+                continue
+            if priority == PRIORITY_ACTION:
+                if request.priority == PRIORITY_ACTION:
+                    return request
+            elif (
+                type(request.method) is type(method)
+                and type(method).__name__.startswith("Edit")
+                and getattr(method, "message_id", None) is not None
+                and request.method.message_id == method.message_id
+                and request.priority >= priority
+            ):
+                return request
+        return None
+
+    async def _pump(self, chat: _Chat):
+        try:
+            while chat.queue:
+                await self._wait_for_slot(chat)
+                if not chat.queue:
+                    break  # cancelled while waiting
+                # Pick only now: a reply may have arrived while waiting
+                request = min(chat.queue, key=lambda r: (r.priority, r.seq))
+                chat.queue.remove(request)
+                await self._send(chat, request)
+        finally:
+            chat.pump = None
+
+    async def _wait_for_slot(self, chat: _Chat):
+        while True:
+            now = time.monotonic()
+            delay = max(chat.paused_until - now, chat.bucket.delay(now), self._global.delay(now))
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        chat.bucket.take()
+        self._global.take()
+
+    async def _send(self, chat: _Chat, request: _Request):
+        method = request.method
+        try:
+            response = await self._request(request.make_request, request.bot, method)
+        except TelegramRetryAfter as e:
+            self._stats["retry_after"] += 1
+            chat.paused_until = time.monotonic() + e.retry_after
+            if request.priority == PRIORITY_REPLY and request.attempts < self._config.max_retries:
+                logger.warning(f"Flood control in chat {method.chat_id}: retrying {type(method).__name__} in {e.retry_after}s")
+                request.attempts += 1
+                chat.queue.append(request)
+                return
+            logger.warning(f"Flood control in chat {method.chat_id}: dropping {type(method).__name__}")
+            self._stats["failed"] += 1
+            if request.priority == PRIORITY_ACTION:
+                # Cosmetic: not worth failing the turn that asked for it
+                request.future.set_result(True)
+            else:
+                request.future.set_exception(e)
+            return
+        except Exception as e:
+            self._stats["failed"] += 1
+            request.future.set_exception(e)
+            return
+
+        now = time.monotonic()
+        if isinstance(method, SendChatAction):
+            chat.last_action = (method.action, now)
+        elif type(method).__name__.startswith(("Send", "Copy", "Forward")):
+            # A new message clears the chat action, and makes a queued one pointless
+            chat.last_action = None
+            for action in [r for r in chat.queue if r.priority == PRIORITY_ACTION]:
+                chat.queue.remove(action)
+                self._stats["collapsed_actions"] += 1
+                action.future.set_result(True)
+        self._stats["sent"] += 1
+        self._latencies.append(now - request.enqueued_at)
+        OUTBOUND_LATENCY.labels(PRIORITY_NAMES[request.priority]).observe(now - request.enqueued_at)
+        request.future.set_result(response)
+
+    async def _request(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Any:
+        name = type(method).__name__
+        started_at = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_SECONDS.labels(name).observe(time.perf_counter() - started_at)
@@ -0,0 +1,92 @@
+import logging
+from typing import Any, Dict, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.enums import ParseMode
+from aiogram.client.default import DefaultBotProperties
+
+from app.handlers import commands, messages, voice, photos
+from app.services.memory import MemoryService
+from app.services.llm import LLMService
+from app.services.voice import VoiceService
+from app.services.search import SearchService
+from app.services.notes import NotesService
+from app.services.media_cache import MediaCache
+from app.services.images import ImageService
+from app.services.albums import MediaGroupCollector
+from app.services.coalesce import MessageCoalescer
+from app.services.turns import TurnPipeline
+from app.services.summary import SummaryService
+from app.services.long_term import LongTermMemory
+from app.middlewares.auth import WhitelistMiddleware
+from app.middlewares.outbound import OutboundScheduler
+from app.middlewares.metrics import UpdateMetricsMiddleware
+from app.metrics import register_service_stats
+from app.jobs.queue import JobQueue, JobWorker
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def create_bot(config: Config, outbound: Optional[OutboundScheduler] = None) -> Bot:
+    bot = Bot(
+        token=config.bot.token, 
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    # Every API call of this bot (handlers, jobs, streaming) goes through the send queue
+    if outbound is not None:
+        bot.session.middleware(outbound)
+    return bot
+
+
+def create_dispatcher(config: Config) -> Dispatcher:
+    dp = Dispatcher()
+    
+    # Register Middleware
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(WhitelistMiddleware(config.bot.admin_ids))
+    
+    # Register Routers (order matters: commands first, then specific, then catch-all)
+    dp.include_router(commands.router)
+    dp.include_router(photos.router)
+    dp.include_router(voice.router)
+    dp.include_router(messages.router)  # catch-all for text should be last
+    return dp
+
+
+def create_services(config: Config) -> Dict[str, Any]:
+    """Services injected into handlers (keyword names match handler arguments)."""
+    memory_service = MemoryService(config.redis)
+    long_term_memory = LongTermMemory(memory_service._redis, config.long_term)
+    deps = dict(
+        memory_service=memory_service,
+        llm_service=LLMService(config.llm),
+        voice_service=VoiceService(config.voice),
+        search_service=SearchService(config.search, memory_service._redis),
+        notes_service=NotesService(memory_service._redis, long_term_memory),
+        long_term_memory=long_term_memory,
+        media_cache=MediaCache(memory_service._redis),
+        image_service=ImageService(config.image),
+        media_group_collector=MediaGroupCollector(config.image.album_window),
+        message_coalescer=MessageCoalescer(config.bot.coalesce_window),
+        outbound=OutboundScheduler(config.outbound),
+        config=config
+    )
+    deps["summary_service"] = SummaryService(memory_service._redis, deps["llm_service"], long_term_memory, config.summary)
+    deps["turn_pipeline"] = TurnPipeline(
+        memory_service, deps["llm_service"], deps["search_service"], deps["summary_service"], long_term_memory, config
+    )
+    # Jobs run with the same services the handlers get
+    deps["job_queue"] = JobQueue(memory_service._redis, config.jobs, deps)
+    register_service_stats(deps)
+    return deps
+
+
+def create_job_worker(bot: Bot, deps: Dict[str, Any]) -> JobWorker:
+    config = deps["config"]
+    return JobWorker(deps["memory_service"]._redis, config.jobs, bot, deps)
+
+
+async def close_services(deps: Dict[str, Any]):
+    await deps["search_service"].close()
+    deps["image_service"].close()
+    await deps["memory_service"].close()
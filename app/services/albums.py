@@ -0,0 +1,37 @@
+import asyncio
+from typing import Dict, List, Optional
+from aiogram.types import Message
+
+from app.update_stream import release_chat_order
+
+
+class MediaGroupCollector:
+    """
+    Collects the messages of one album (media_group_id), which Telegram
+    delivers as separate updates, so they can be handled as one request.
+    """
+
+    def __init__(self, window: float = 1.0):
+        self._window = window
+        self._groups: Dict[str, List[Message]] = {}
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        """
+        The first message of an album waits until no new photos arrive for
+        `window` seconds and gets the whole album (in order). Later messages
+        of the same album return None: they are handled by the first one.
+        """
+        group_id = message.media_group_id
+        if group_id in self._groups:
+            self._groups[group_id].append(message)
+            return None
+
+        self._groups[group_id] = [message]
+        # The rest of the album comes in later updates of this chat
+        release_chat_order()
+        seen = 0
+        while seen != len(self._groups[group_id]):
+            seen = len(self._groups[group_id])
+            await asyncio.sleep(self._window)
+
+        return sorted(self._groups.pop(group_id), key=lambda m: m.message_id)
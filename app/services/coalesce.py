@@ -0,0 +1,104 @@
+import asyncio
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from app.update_stream import release_chat_order
+
+T = TypeVar("T")
+
+# Set inside a burst's generation: marks its reply as going out for good
+_commit: ContextVar[Optional[Callable[[], None]]] = ContextVar("coalesce_commit", default=None)
+
+
+def commit_reply():
+    """
+    Called by a generation once its final reply starts going out. From then
+    on newer messages no longer cancel it: they start a burst of their own,
+    so no message is answered or stored in history twice. No-op outside
+    MessageCoalescer.run().
+    """
+    commit = _commit.get()
+    if commit is not None:
+        commit()
+
+
+@dataclass
+class _Burst:
+    texts: List[str] = field(default_factory=list)
+    seq: int = 0
+    generation: Optional[asyncio.Task] = None
+    committed: bool = False
+
+    @property
+    def answered(self) -> bool:
+        return self.committed or (self.generation is not None and self.generation.done() and not self.generation.cancelled())
+
+
+class MessageCoalescer:
+    """
+    Merges a burst of short messages from one user into a single turn.
+
+    Every message restarts a `window`-second timer; only the last message of
+    the burst gets the merged text, the earlier handlers return None. A message
+    that arrives while the burst's reply is still being generated cancels that
+    generation and joins the burst, so one reply goes out per burst - unless
+    the generation already committed its reply (see commit_reply()), then the
+    message starts a new burst.
+    """
+
+    def __init__(self, window: float):
+        self._window = window
+        self._bursts: Dict[int, _Burst] = {}
+
+    async def collect(self, user_id: int, text: str) -> Optional[Tuple[int, str]]:
+        """Returns (burst seq, merged text) for the message that closes the burst, else None."""
+        burst = self._bursts.get(user_id)
+        if burst is None or burst.answered:
+            burst = self._bursts[user_id] = _Burst()
+
+        burst.texts.append(text)
+        burst.seq += 1
+        seq = burst.seq
+        if burst.generation is not None and not burst.generation.done():
+            # Superseded: the reply will be generated again for the whole burst
+            burst.generation.cancel()
+
+        # The next message of the burst must be able to arrive meanwhile
+        release_chat_order()
+        await asyncio.sleep(self._window)
+        if burst.seq != seq:
+            return None
+        return seq, "\n".join(burst.texts)
+
+    async def run(self, user_id: int, seq: int, generation: Awaitable[T]) -> Optional[T]:
+        """
+        Run the burst's generation. Returns None if a newer message of the
+        same user cancelled it.
+        """
+        burst = self._bursts[user_id]
+
+        def commit():
+            burst.committed = True
+            if self._bursts.get(user_id) is burst:
+                del self._bursts[user_id]
+
+        # The task copies the context, so the generation sees its own commit()
+        token = _commit.set(commit)
+        try:
+            task = asyncio.ensure_future(generation)
+        finally:
+            _commit.reset(token)
+        burst.generation = task
+        try:
+            # wait() doesn't propagate the task's own cancellation to us
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        if task.cancelled():
+            return None
+        if self._bursts.get(user_id) is burst and burst.seq == seq:
+            del self._bursts[user_id]
+        return task.result()
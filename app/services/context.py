@@ -0,0 +1,116 @@
+import logging
+from typing import Dict, List, Optional
+
+from app.services.search_cache import SEARCH_FAILED
+from app.utils.tokens import count_tokens, message_tokens, truncate_tokens, MESSAGE_OVERHEAD
+from config import LLMConfig
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TEMPLATE = "{message}\n\n[CONTEXT FROM INTERNET]:\n{results}\n\n[INSTRUCTION]: Use the above context to answer."
+_SEARCH_FRAME_TOKENS = count_tokens(SEARCH_TEMPLATE.format(message="", results=""))
+SUMMARY_TEMPLATE = "Краткое содержание более раннего разговора:\n{summary}"
+MEMORIES_TEMPLATE = "Из долгосрочной памяти (заметки пользователя и прошлые разговоры), используй, если относится к делу:\n{memories}"
+
+
+class ContextBuilder:
+    """
+    Packs a chat prompt into the model's token budget.
+
+    Priority, highest first: the system prompt (always kept whole), the
+    incoming user message (cut only if it alone overflows), the running
+    summary of older turns, recalled notes and archived turns (up to
+    `memory_budget`, best first), web search snippets (up to `search_budget`,
+    whole snippets first) and then history, newest messages first, at most
+    `history_messages` of them. Older history is what gets dropped.
+    """
+
+    def __init__(self, config: LLMConfig):
+        self._default_budget = config.context_budget
+        self._budgets = config.context_budgets
+        self._search_budget = config.search_budget
+        self._memory_budget = config.memory_budget
+        self._history_messages = config.history_messages
+
+    def budget_for(self, model: str) -> int:
+        return self._budgets.get(model, self._default_budget)
+
+    def _pack_search(self, results: str, budget: int) -> str:
+        """Whole snippets while they fit; the first one is cut rather than dropped."""
+        packed, used = [], 0
+        for snippet in results.split("\n\n"):
+            tokens = count_tokens(snippet)
+            if used + tokens > budget:
+                if not packed:
+                    packed.append(truncate_tokens(snippet, budget))
+                break
+            packed.append(snippet)
+            used += tokens
+        return "\n\n".join(packed)
+
+    def build(
+        self,
+        system_prompt: str,
+        history: List[Dict[str, str]],
+        model: str,
+        search_results: Optional[str] = None,
+        summary: Optional[str] = None,
+        memories: Optional[List[str]] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        `history` ends with the incoming user message. Returns the messages
+        to send, without the cached token counts.
+        """
+        budget = self.budget_for(model)
+        system = {"role": "system", "content": system_prompt}
+        used = message_tokens(system)
+        if not history:
+            return [system]
+
+        *past, current = history
+        past = past[-self._history_messages:] if self._history_messages > 0 else []
+        content = current["content"]
+        remaining = budget - used - MESSAGE_OVERHEAD
+        if count_tokens(content) > remaining:
+            content = truncate_tokens(content, max(remaining, 0))
+        used += count_tokens(content) + MESSAGE_OVERHEAD
+
+        # Stands in for the turns folded out of the history
+        earlier = []
+        if summary and budget - used > MESSAGE_OVERHEAD:
+            note = SUMMARY_TEMPLATE.format(summary=summary)
+            earlier.append({"role": "system", "content": truncate_tokens(note, budget - used - MESSAGE_OVERHEAD)})
+            used += message_tokens(earlier[0])
+
+        if memories:
+            memory_budget = min(self._memory_budget, budget - used - MESSAGE_OVERHEAD)
+            recalled, recalled_tokens = [], 0
+            for memory in memories:
+                line = f"- {memory}"
+                tokens = count_tokens(line)
+                if recalled_tokens + tokens > memory_budget:
+                    break
+                recalled.append(line)
+                recalled_tokens += tokens
+            if recalled:
+                earlier.append({"role": "system", "content": MEMORIES_TEMPLATE.format(memories="\n".join(recalled))})
+                used += message_tokens(earlier[-1])
+
+        if search_results and search_results != SEARCH_FAILED:
+            search_budget = min(self._search_budget, budget - used) - _SEARCH_FRAME_TOKENS
+            if search_budget > 0:
+                packed = self._pack_search(search_results, search_budget)
+                content = SEARCH_TEMPLATE.format(message=content, results=packed)
+                used += count_tokens(packed) + _SEARCH_FRAME_TOKENS
+
+        kept: List[Dict[str, str]] = []
+        for message in reversed(past):
+            tokens = message_tokens(message)
+            if used + tokens > budget:
+                break
+            kept.append({"role": message["role"], "content": message["content"]})
+            used += tokens
+        kept.reverse()
+
+        logger.debug(f"Prompt for {model}: ~{used}/{budget} tokens, {len(kept)}/{len(past)} history messages")
+        return [system] + earlier + kept + [{"role": current["role"], "content": content}]
@@ -0,0 +1,80 @@
+import io
+import base64
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+from aiogram import Bot
+from aiogram.types import PhotoSize
+from PIL import Image
+
+from config import ImageConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PreparedImage:
+    base64: str
+    bytes_sent: int
+    width: int
+    height: int
+
+
+def pick_photo_size(sizes: List[PhotoSize], target: int) -> PhotoSize:
+    """Smallest Telegram rendition whose longest side reaches the target, else the largest one."""
+    ordered = sorted(sizes, key=lambda s: s.width * s.height)
+    for size in ordered:
+        if max(size.width, size.height) >= target:
+            return size
+    return ordered[-1]
+
+
+def downscale_jpeg(data: bytes, target: int, quality: int) -> bytes:
+    """Fit the image into target x target and recompress. Runs in a worker process."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((target, target), Image.LANCZOS)
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+
+class ImageService:
+    """Prepares photos for vision requests: right-sized download, optional downscale, base64."""
+
+    def __init__(self, config: ImageConfig):
+        self._target = config.target_size
+        self._quality = config.jpeg_quality
+        self._max_workers = config.max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Started lazily so worker processes are only spawned once a photo arrives
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+        return self._executor
+
+    async def prepare(self, bot: Bot, sizes: List[PhotoSize]) -> PreparedImage:
+        photo = pick_photo_size(sizes, self._target)
+
+        buffer = io.BytesIO()
+        await bot.download(photo, destination=buffer)
+        data = buffer.getbuffer()  # memoryview: no copy of the downloaded bytes
+        width, height = photo.width, photo.height
+
+        # Only the largest renditions exceed the target noticeably: shrink them off the loop
+        if max(width, height) > self._target * 1.25:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                self._get_executor(), downscale_jpeg, bytes(data), self._target, self._quality
+            )
+            scale = self._target / max(width, height)
+            width, height = int(width * scale), int(height * scale)
+
+        encoded = base64.b64encode(data).decode("ascii")
+        return PreparedImage(base64=encoded, bytes_sent=len(data), width=width, height=height)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
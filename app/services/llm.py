@@ -1,13 +1,20 @@
 import logging
 import base64
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
 
+from app.metrics import LLMCall
+from app.services.context import ContextBuilder
 from config import LLMConfig
 
 logger = logging.getLogger(__name__)
 
+# Shown in place of a chat reply when the model request fails
+CHAT_ERROR = "Извини, произошла ошибка при обращении к моему мозгу..."
+# Shown when the vision model answers with nothing (never cached)
+VISION_EMPTY = "Не удалось проанализировать изображение."
+
 
 class LLMService:
     def __init__(self, config: LLMConfig):
@@ -20,11 +27,17 @@ class LLMService:
         self._thinker_model = config.thinker_model
         self._system_prompt_path = config.system_prompt_path
         self._system_prompt = self._load_system_prompt()
+        self._streaming = config.stream
+        self._context = ContextBuilder(config)
         self._headers = {
             "HTTP-Referer": "https://verabot.local",
             "X-Title": "VeraBot"
         }
 
+    @property
+    def vision_model(self) -> str:
+        return self._vision_model
+
     def _load_system_prompt(self) -> str:
         """Load system prompt from file."""
         base_prompt = "You are a helpful assistant."
@@ -39,9 +52,16 @@ class LLMService:
         return base_prompt
 
 
-    async def generate_response(self, history: List[Dict[str, str]], mode: str = "cute", model_override: Optional[str] = None) -> str:
-        """Generate response from LLM based on history."""
-        
+    def _build_messages(
+        self,
+        history: List[Dict[str, str]],
+        mode: str,
+        model: str,
+        search_results: Optional[str] = None,
+        summary: Optional[str] = None,
+        memories: Optional[List[str]] = None,
+    ) -> List[Dict[str, str]]:
+        """System prompt for the given mode + history (ending with the user message), fitted to the model's budget."""
         # Adjust system prompt based on mode
         system_prompt = self._system_prompt
         if mode == "pro":
@@ -50,68 +70,103 @@ class LLMService:
                 "Отвечай кратко, фактами, без эмодзи и ласкательных слов. "
                 "Будь точным и информативным."
             )
-        
-        messages = [{"role": "system", "content": system_prompt}] + history
-        
-        # Determine model to use
-        model_to_use = model_override if model_override else self._model
 
-        try:
-            response: ChatCompletion = await self._client.chat.completions.create(
-                model=model_to_use,
-                messages=messages,
-                extra_headers=self._headers
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Error generating response from LLM: {e}")
-            return "Извини, произошла ошибка при обращении к моему мозгу..."
+        return self._context.build(system_prompt, history, model, search_results, summary, memories)
 
-    async def generate_response_r1(self, question: str) -> str:
-        """Generate response using DeepSeek R1 (thinker model)."""
-        messages = [
+    def _build_r1_messages(self, question: str) -> List[Dict[str, str]]:
+        return [
             {"role": "system", "content": "Ты — умный помощник. Думай шаг за шагом."},
             {"role": "user", "content": question}
         ]
 
-        try:
-            response: ChatCompletion = await self._client.chat.completions.create(
-                model=self._thinker_model,
+    async def _stream(self, model: str, messages: List[Dict[str, str]], operation: str = "chat") -> AsyncIterator[str]:
+        """
+        Yield content deltas of a chat completion.
+        Falls back to a single non-streaming request when streaming is disabled.
+        """
+        if not self._streaming:
+            with LLMCall(model, operation):
+                response: ChatCompletion = await self._client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    extra_headers=self._headers
+                )
+            yield response.choices[0].message.content or ""
+            return
+
+        with LLMCall(model, operation) as call:
+            stream = await self._client.chat.completions.create(
+                model=model,
                 messages=messages,
-                extra_headers=self._headers
+                extra_headers=self._headers,
+                stream=True
             )
-            return response.choices[0].message.content or ""
-        except Exception as e:
-            logger.error(f"Error with R1 model: {e}")
-            return "Не удалось обработать запрос в режиме мышления..."
+            async for chunk in stream:
+                call.chunk()
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    call.first_token()
+                    yield delta
+
+    async def stream_response(
+        self,
+        history: List[Dict[str, str]],
+        mode: str = "cute",
+        model_override: Optional[str] = None,
+        search_results: Optional[str] = None,
+        summary: Optional[str] = None,
+        memories: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream response deltas from LLM based on history, plus (if any) web
+        search results, the running summary and recalled long-term memories.
+        Upstream errors propagate (see with_error_text).
+        """
+        model_to_use = model_override if model_override else self._model
+        messages = self._build_messages(history, mode, model_to_use, search_results, summary, memories)
 
-    async def analyze_image(self, image_base64: str, caption: str = "") -> str:
-        """Analyze image using Vision model."""
-        user_prompt = caption if caption else "Опиши это изображение подробно."
+        async for delta in self._stream(model_to_use, messages):
+            yield delta
+
+    async def stream_response_r1(self, question: str) -> AsyncIterator[str]:
+        """Stream response deltas from DeepSeek R1 (thinker model). Upstream errors propagate."""
+        messages = self._build_r1_messages(question)
+
+        async for delta in self._stream(self._thinker_model, messages, "think"):
+            yield delta
+
+    async def analyze_images(self, images_base64: List[str], caption: str = "") -> str:
+        """Analyze one or several images (an album) in a single Vision request."""
+        if caption:
+            user_prompt = caption
+        elif len(images_base64) > 1:
+            user_prompt = "Опиши эти изображения подробно."
+        else:
+            user_prompt = "Опиши это изображение подробно."
         
         messages = [
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": user_prompt},
+                "content": [{"type": "text", "text": user_prompt}] + [
                     {
                         "type": "image_url",
                         "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
                     }
+                    for image_base64 in images_base64
                 ]
             }
         ]
 
-        try:
+        # Errors propagate: the vision job retries them
+        with LLMCall(self._vision_model, "vision"):
             response: ChatCompletion = await self._client.chat.completions.create(
                 model=self._vision_model,
                 messages=messages,
                 extra_headers=self._headers
             )
-            return response.choices[0].message.content or "Не удалось проанализировать изображение."
-        except Exception as e:
-            logger.error(f"Error analyzing image: {e}")
-            return "Произошла ошибка при анализе изображения..."
+        return response.choices[0].message.content or VISION_EMPTY
 
     async def translate(self, text: str) -> str:
         """Translate text to Russian (or to English if Russian)."""
@@ -130,12 +185,61 @@ class LLMService:
         ]
 
         try:
-            response: ChatCompletion = await self._client.chat.completions.create(
-                model=self._model,
-                messages=messages,
-                extra_headers=self._headers
-            )
+            with LLMCall(self._model, "translate"):
+                response: ChatCompletion = await self._client.chat.completions.create(
+                    model=self._model,
+                    messages=messages,
+                    extra_headers=self._headers
+                )
             return response.choices[0].message.content or text
         except Exception as e:
             logger.error(f"Error translating: {e}")
             return "Ошибка перевода..."
+
+    async def summarize(self, summary: Optional[str], messages: List[Dict[str, str]], model: str, max_tokens: int) -> Optional[str]:
+        """
+        Fold `messages` into the running `summary` and return the updated one.
+        None on errors: the caller keeps the history as it is.
+        """
+        dialog = "\n".join(
+            f"{'Пользователь' if m['role'] == 'user' else 'Ассистент'}: {m['content']}" for m in messages
+        )
+        prompt = (
+            f"Текущее краткое содержание разговора:\n{summary or '(пусто)'}\n\n"
+            f"Новые сообщения:\n{dialog}"
+        )
+        system_prompt = (
+            "Ты ведёшь краткое содержание разговора пользователя с ассистентом. "
+            "Дополни текущее содержание новыми сообщениями: сохрани факты о пользователе, "
+            "его просьбы, договорённости и важные ответы; опусти приветствия и повторы. "
+            f"Пиши сжато, в третьем лице, не длиннее {max_tokens // 2} слов. "
+            "Отвечай ТОЛЬКО обновлённым содержанием."
+        )
+
+        try:
+            with LLMCall(model, "summarize"):
+                response: ChatCompletion = await self._client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens,
+                    extra_headers=self._headers
+                )
+            return (response.choices[0].message.content or "").strip() or None
+        except Exception as e:
+            logger.error(f"Error summarizing history: {e}")
+            return None
+
+
+async def with_error_text(chunks: AsyncIterator[str], error_text: str) -> AsyncIterator[str]:
+    """Pass deltas through; if the stream fails, end the reply with `error_text` instead of raising."""
+    started = False
+    try:
+        async for delta in chunks:
+            started = True
+            yield delta
+    except Exception as e:
+        logger.error(f"Error streaming response from LLM: {e}")
+        yield f"\n\n{error_text}" if started else error_text
@@ -0,0 +1,254 @@
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from redis.asyncio import Redis
+
+from app.utils.vectors import VectorIndex, embed_text, embed_texts
+from config import LongTermConfig
+
+logger = logging.getLogger(__name__)
+
+# Above this many new entries the embedding runs in a thread
+_THREAD_BATCH = 64
+# Log entries that no longer describe a live item (removals, removed or
+# trimmed additions) before the log is rewritten as a snapshot
+_COMPACT_GARBAGE = 200
+
+# Replace the log with a snapshot of its live items, keeping entries appended
+# after the snapshot was computed, and bump the epoch so every process reloads.
+# KEYS: log, epoch; ARGV: epoch the log was read at, entries read, snapshot entries...
+_COMPACT_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return -1
+end
+local tail = redis.call('LRANGE', KEYS[1], tonumber(ARGV[2]), -1)
+redis.call('DEL', KEYS[1])
+for i = 3, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+for i = 1, #tail do
+    redis.call('RPUSH', KEYS[1], tail[i])
+end
+return redis.call('INCR', KEYS[2])
+"""
+
+
+@dataclass
+class Recollection:
+    item_id: str
+    kind: str  # "note" or "turn"
+    text: str
+    score: float
+
+
+class _UserIndex:
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.lock = asyncio.Lock()
+        self.reset(0)
+
+    def reset(self, epoch: int):
+        self.index = VectorIndex(self.dim)
+        self.items: Dict[str, Dict] = {}
+        self.loaded = 0  # log entries applied so far
+        self.epoch = epoch  # compactions of the log seen so far
+
+
+def _replay(entries: Iterable[Dict]) -> Dict[str, Dict]:
+    """Live items (id -> add entry, oldest first) after applying log entries."""
+    items: Dict[str, Dict] = {}
+    for entry in entries:
+        op = entry.get("op")
+        if op == "add":
+            items[entry["id"]] = entry
+        elif op == "del":
+            items.pop(entry["id"], None)
+        elif op == "del_kind":
+            for item_id in [i for i, item in items.items() if item["kind"] == entry["kind"]]:
+                del items[item_id]
+    return items
+
+
+class LongTermMemory:
+    """
+    Notes and archived conversation turns, searchable by similarity.
+
+    Redis keeps an append-only log per user (ltm_log:{user_id}) of item
+    additions and removals; every process replays it into a local
+    VectorIndex and on each lookup only applies the entries it hasn't seen
+    (one LRANGE from its offset). Embeddings are computed locally
+    (app/utils/vectors.py), nothing leaves the bot.
+
+    Once enough entries are dead, or there are more than `max_turns`
+    archived turns, the log is rewritten as a snapshot of its live items
+    (oldest turns dropped) and its epoch (ltm_epoch:{user_id}) is bumped:
+    processes that see a new epoch reload from the start. /clear compacts
+    right away, so forgotten turns don't stay in Redis.
+    """
+
+    def __init__(self, redis_client: Redis, config: LongTermConfig):
+        self._redis = redis_client
+        self._config = config
+        self._users: "OrderedDict[int, _UserIndex]" = OrderedDict()
+        self._compact_log = redis_client.register_script(_COMPACT_SCRIPT)
+        self._compactions: Dict[int, asyncio.Task] = {}
+
+    def _key(self, user_id: int) -> str:
+        return f"ltm_log:{user_id}"
+
+    def _epoch_key(self, user_id: int) -> str:
+        return f"ltm_epoch:{user_id}"
+
+    async def _read_log(self, user_id: int, start: int = 0) -> Tuple[int, List[str]]:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.get(self._epoch_key(user_id))
+            pipe.lrange(self._key(user_id), start, -1)
+            epoch, raw_entries = await pipe.execute()
+        return int(epoch or 0), raw_entries
+
+    async def _log(self, user_id: int, *entries: Dict):
+        if not self._config.enabled or not entries:
+            return
+        try:
+            await self._redis.rpush(self._key(user_id), *(json.dumps(e, ensure_ascii=False) for e in entries))
+        except Exception as e:
+            logger.error(f"Error writing long-term memory log: {e}")
+
+    async def add(self, user_id: int, item_id: str, kind: str, text: str):
+        await self._log(user_id, {"op": "add", "id": item_id, "kind": kind, "text": text, "ts": int(time.time())})
+
+    async def add_turns(self, user_id: int, messages: List[Dict[str, str]]):
+        """Archive messages leaving the chat history, one item per user+assistant exchange."""
+        exchanges, exchange = [], []
+        for message in messages:
+            exchange.append(f"{'Пользователь' if message['role'] == 'user' else 'Ассистент'}: {message['content']}")
+            if message["role"] == "assistant":
+                exchanges.append("\n".join(exchange))
+                exchange = []
+        if exchange:
+            exchanges.append("\n".join(exchange))
+
+        batch = time.time_ns()
+        await self._log(user_id, *(
+            {"op": "add", "id": f"turn:{batch}:{i}", "kind": "turn", "text": text, "ts": batch // 10**9}
+            for i, text in enumerate(exchanges)
+        ))
+
+    async def remove(self, user_id: int, item_id: str):
+        await self._log(user_id, {"op": "del", "id": item_id})
+
+    async def forget_turns(self, user_id: int):
+        """Drop all archived turns (notes stay), and their text from Redis."""
+        await self._log(user_id, {"op": "del_kind", "kind": "turn"})
+        await self.compact(user_id)
+
+    async def sync_notes(self, user_id: int, notes: List[Tuple[int, str]]) -> int:
+        """
+        Backfill: log the (id, text) notes the log doesn't have, e.g. written
+        before it existed or while it was disabled. Returns how many.
+        """
+        _, raw_entries = await self._read_log(user_id)
+        live = _replay(json.loads(raw) for raw in raw_entries)
+        missing = [(note_id, text) for note_id, text in notes if f"note:{note_id}" not in live]
+        for note_id, text in missing:
+            await self.add(user_id, f"note:{note_id}", "note", text)
+        return len(missing)
+
+    async def compact(self, user_id: int) -> bool:
+        """Rewrite the log as a snapshot of its live items. False if another process compacted it meanwhile."""
+        try:
+            epoch, raw_entries = await self._read_log(user_id)
+            live = _replay(json.loads(raw) for raw in raw_entries)
+            turns = [item_id for item_id, item in live.items() if item["kind"] == "turn"]
+            for item_id in turns[:max(len(turns) - self._config.max_turns, 0)]:
+                del live[item_id]
+            result = await self._compact_log(
+                keys=[self._key(user_id), self._epoch_key(user_id)],
+                args=[epoch, len(raw_entries), *(json.dumps(e, ensure_ascii=False) for e in live.values())]
+            )
+        except Exception as e:
+            logger.error(f"Error compacting long-term memory log: {e}")
+            return False
+        if result == -1:
+            return False
+        logger.info(f"Compacted long-term memory log of user {user_id}: {len(raw_entries)} -> {len(live)} entries")
+        return True
+
+    def _schedule_compaction(self, user_id: int):
+        if user_id in self._compactions:
+            return
+        task = self._compactions[user_id] = asyncio.create_task(self.compact(user_id))
+        task.add_done_callback(lambda _: self._compactions.pop(user_id, None))
+
+    def _user(self, user_id: int) -> _UserIndex:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserIndex(self._config.dim)
+            while len(self._users) > self._config.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return user
+
+    def _apply(self, user: _UserIndex, entries: List[Dict]):
+        added: Dict[str, Dict] = {}
+        for entry in entries:
+            op = entry.get("op")
+            if op == "add":
+                added[entry["id"]] = entry
+                user.items[entry["id"]] = entry
+            elif op == "del":
+                added.pop(entry["id"], None)
+                user.items.pop(entry["id"], None)
+                user.index.remove(entry["id"])
+            elif op == "del_kind":
+                for item_id in [i for i, item in user.items.items() if item["kind"] == entry["kind"]]:
+                    added.pop(item_id, None)
+                    del user.items[item_id]
+                    user.index.remove(item_id)
+        if added:
+            ids = list(added)
+            user.index.add(ids, embed_texts([added[i]["text"] for i in ids], self._config.dim))
+
+    async def _sync(self, user_id: int, user: _UserIndex):
+        """Apply the log entries this process hasn't seen yet (call under user.lock)."""
+        epoch, raw_entries = await self._read_log(user_id, user.loaded)
+        if epoch != user.epoch:
+            if user.loaded:
+                # Compacted: offsets changed, rebuild from the snapshot
+                user.reset(epoch)
+                epoch, raw_entries = await self._read_log(user_id)
+            user.epoch = epoch
+        if not raw_entries:
+            return
+        entries = [json.loads(raw) for raw in raw_entries]
+        if len(entries) > _THREAD_BATCH:
+            await asyncio.to_thread(self._apply, user, entries)
+        else:
+            self._apply(user, entries)
+        user.loaded += len(raw_entries)
+
+        turns = sum(1 for item in user.items.values() if item["kind"] == "turn")
+        if user.loaded - len(user.items) >= _COMPACT_GARBAGE or turns > self._config.max_turns + _COMPACT_GARBAGE:
+            self._schedule_compaction(user_id)
+
+    async def recall(self, user_id: int, query: str, k: Optional[int] = None) -> List[Recollection]:
+        """Best matches for the query above `min_score`; empty on errors."""
+        if not self._config.enabled:
+            return []
+        try:
+            user = self._user(user_id)
+            async with user.lock:
+                await self._sync(user_id, user)
+                hits = user.index.search(embed_text(query, self._config.dim), k or self._config.top_k)
+            return [
+                Recollection(item_id, user.items[item_id]["kind"], user.items[item_id]["text"], score)
+                for item_id, score in hits
+                if score >= self._config.min_score
+            ]
+        except Exception as e:
+            logger.error(f"Error recalling long-term memory: {e}")
+            return []
@@ -0,0 +1,66 @@
+import json
+import hashlib
+import logging
+from typing import Optional
+from redis.asyncio import Redis
+
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """
+    Results of expensive media calls (vision analysis, transcription) keyed by
+    Telegram's file_unique_id, which stays the same when a file is forwarded.
+
+    The model name is part of the key, so when the configured vision or STT
+    model changes, entries produced by the old model are never served again
+    and simply age out by TTL. Empty results are not cached, and an entry
+    that can't be decoded counts as a miss.
+    """
+
+    def __init__(self, redis_client: Redis, ttl: int = 7 * 86400, max_items: int = 512):
+        self._redis = redis_client
+        self._ttl = ttl
+        self._local: TTLCache[str] = TTLCache(max_items)
+
+    def _key(self, kind: str, file_unique_id: str, model: str, caption: str) -> str:
+        digest = hashlib.sha1(f"{file_unique_id}|{model}|{caption}".encode("utf-8")).hexdigest()
+        return f"media_cache:{kind}:{digest}"
+
+    async def get(self, kind: str, file_unique_id: str, model: str, caption: str = "") -> Optional[str]:
+        key = self._key(kind, file_unique_id, model, caption)
+        value = self._local.get(key)
+        if value is not None:
+            return value
+
+        try:
+            raw = await self._redis.get(key)
+        except Exception as e:
+            logger.error(f"Error reading media cache from Redis: {e}")
+            return None
+        if raw is None:
+            return None
+
+        try:
+            result = json.loads(raw)["result"]
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Ignoring corrupt media cache entry {key}: {e}")
+            return None
+        if not isinstance(result, str) or not result.strip():
+            return None
+        self._local.set(key, result, self._ttl)
+        return result
+
+    async def set(self, kind: str, file_unique_id: str, model: str, result: str, caption: str = ""):
+        """Cache a successful result; empty ones are skipped so the next request retries."""
+        if not result or not result.strip():
+            return
+        key = self._key(kind, file_unique_id, model, caption)
+        self._local.set(key, result, self._ttl)
+        try:
+            entry = json.dumps({"model": model, "result": result}, ensure_ascii=False)
+            await self._redis.set(key, entry, ex=self._ttl)
+        except Exception as e:
+            logger.error(f"Error writing media cache to Redis: {e}")
@@ -1,53 +1,95 @@
 import json
 import logging
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 import redis.asyncio as redis
 
+from app.metrics import observed, count_error
+from app.utils.tokens import count_tokens
 from config import RedisConfig
 
 logger = logging.getLogger(__name__)
 
+
+def summary_key(user_id: int) -> str:
+    """Running summary of the turns folded out of the history (see SummaryService)."""
+    return f"chat_summary:{user_id}"
+
+
+@dataclass
+class TurnContext:
+    """Everything a chat turn needs from Redis, loaded in one round trip."""
+    history: List[Dict[str, str]] = field(default_factory=list)
+    model_override: Optional[str] = None
+    mode: Optional[str] = None
+    summary: Optional[str] = None
+
+
 class MemoryService:
     def __init__(self, config: RedisConfig):
         self._redis = redis.from_url(config.url, decode_responses=True)
         self._ttl = 86400  # 24 hours
+        self._max_messages = 20
 
-    async def add_message(self, user_id: int, message: Dict[str, str]):
-        """Add a message to the user's chat history."""
+    async def _append(self, user_id: int, messages: List[Dict[str, str]]):
+        """
+        Append messages, trim to the last N and reset TTL atomically in one round trip.
+        Each message is stored with its token count, so prompts are budgeted without recounting.
+        """
         key = f"chat_history:{user_id}"
-        try:
-            await self._redis.rpush(key, json.dumps(message))
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(json.dumps(dict(msg, tokens=count_tokens(msg["content"]))) for msg in messages))
             # Build-in logic: keep only last 20 messages
-            list_len = await self._redis.llen(key)
-            if list_len > 20:
-                await self._redis.lpop(key)
-            
-            # Reset TTL
-            await self._redis.expire(key, self._ttl)
+            pipe.ltrim(key, -self._max_messages, -1)
+            # Reset TTL (the summary lives as long as the history)
+            pipe.expire(key, self._ttl)
+            pipe.expire(summary_key(user_id), self._ttl)
+            await pipe.execute()
+
+    @observed("memory")
+    async def add_turn(self, user_id: int, user_message: Dict[str, str], assistant_message: Dict[str, str]):
+        """Add a user message and the assistant reply to history in one round trip."""
+        try:
+            await self._append(user_id, [user_message, assistant_message])
         except Exception as e:
-            logger.error(f"Error adding message to Redis: {e}")
+            logger.error(f"Error adding turn to Redis: {e}")
+            count_error("memory", "add_turn", e)
 
-    async def get_history(self, user_id: int, limit: int = 5) -> List[Dict[str, str]]:
-        """Get the last N messages from the user's chat history."""
-        key = f"chat_history:{user_id}"
+    @observed("memory")
+    async def load_turn_context(self, user_id: int, limit: Optional[int] = None) -> TurnContext:
+        """
+        Get the last N messages (all stored by default), the running summary
+        and per-user settings (model, mode) in one round trip. How much history
+        fits into the prompt is decided later by the token budget (see ContextBuilder).
+        """
         try:
-            # Get all messages first to check length, or just get slice
-            # lrange parameters are start, end (inclusive)
-            # To get last N: start = -N, end = -1
-            raw_messages = await self._redis.lrange(key, -limit, -1)
-            messages = [json.loads(msg) for msg in raw_messages]
-            return messages
+            # MULTI: history and summary must come from the same side of a fold
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(f"chat_history:{user_id}", -(limit or self._max_messages), -1)
+                pipe.get(summary_key(user_id))
+                pipe.get(f"user_model:{user_id}")
+                pipe.get(f"user_mode:{user_id}")
+                raw_messages, summary, model_override, mode = await pipe.execute()
+            return TurnContext(
+                history=[json.loads(msg) for msg in raw_messages],
+                model_override=model_override,
+                mode=mode,
+                summary=summary
+            )
         except Exception as e:
-            logger.error(f"Error getting history from Redis: {e}")
-            return []
+            logger.error(f"Error loading turn context from Redis: {e}")
+            count_error("memory", "load_turn_context", e)
+            return TurnContext()
 
+    @observed("memory")
     async def clear_history(self, user_id: int):
-        """Clear the user's chat history."""
+        """Clear the user's chat history and its summary."""
         key = f"chat_history:{user_id}"
         try:
-            await self._redis.delete(key)
+            await self._redis.delete(key, summary_key(user_id))
         except Exception as e:
             logger.error(f"Error clearing history in Redis: {e}")
+            count_error("memory", "clear_history", e)
 
     async def close(self):
         await self._redis.aclose()
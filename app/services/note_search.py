@@ -0,0 +1,124 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from app.utils.text import stem_token
+
+# Words that carry no meaning for finding a note
+STOPWORDS = {
+    # RU
+    "а", "в", "во", "на", "по", "о", "об", "у", "к", "с", "со", "из", "за", "для", "до", "от",
+    "и", "или", "ли", "же", "бы", "не", "но", "что", "как", "это", "то", "так",
+    # EN
+    "the", "a", "an", "in", "on", "at", "of", "for", "to", "is", "are", "and", "or", "it",
+}
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+# A query reads at most this many postings per term, highest term frequency first
+MAX_POSTINGS = 256
+
+
+def index_terms(text: str) -> List[str]:
+    """Lowercased, stemmed tokens without stopwords: "Купить билеты" -> ["куп", "билет"]."""
+    words = re.findall(r"\w+", text.lower().replace("ё", "е"))
+    return [stem_token(word) for word in words if word not in STOPWORDS]
+
+
+@dataclass
+class NoteHits:
+    total: int = 0
+    hits: List[Tuple[int, float]] = field(default_factory=list)  # (note id, score), best first
+
+
+class NoteSearchIndex:
+    """
+    Inverted index of a user's notes in Redis, ranked with BM25.
+
+    notes:{user_id}:term:{term}  sorted set: note id -> term frequency
+    notes:{user_id}:lengths      hash: note id -> length in terms
+    notes:{user_id}:stats        hash: docs, terms (totals for the average length)
+
+    Updates are queued on the caller's pipeline, so a note and its postings
+    change in one MULTI. A query reads only the top MAX_POSTINGS postings of
+    each of its terms (by term frequency; the document frequency still comes
+    from the full posting), so its cost is bounded by the number of query
+    terms, however many notes match a common word. Notes that contain a
+    common term only once may then be missing from its results; a rarer term
+    next to it still finds them.
+    """
+
+    def __init__(self, redis_client: Redis):
+        self._redis = redis_client
+
+    def _term_key(self, user_id: int, term: str) -> str:
+        return f"notes:{user_id}:term:{term}"
+
+    def _lengths_key(self, user_id: int) -> str:
+        return f"notes:{user_id}:lengths"
+
+    def _stats_key(self, user_id: int) -> str:
+        return f"notes:{user_id}:stats"
+
+    def add(self, pipe: Pipeline, user_id: int, note_id: int, text: str):
+        terms = index_terms(text)
+        for term, count in Counter(terms).items():
+            pipe.zadd(self._term_key(user_id, term), {str(note_id): count})
+        pipe.hset(self._lengths_key(user_id), str(note_id), len(terms))
+        pipe.hincrby(self._stats_key(user_id), "docs", 1)
+        pipe.hincrby(self._stats_key(user_id), "terms", len(terms))
+
+    def remove(self, pipe: Pipeline, user_id: int, note_id: int, text: str):
+        terms = index_terms(text)
+        for term in set(terms):
+            pipe.zrem(self._term_key(user_id, term), str(note_id))
+        pipe.hdel(self._lengths_key(user_id), str(note_id))
+        pipe.hincrby(self._stats_key(user_id), "docs", -1)
+        pipe.hincrby(self._stats_key(user_id), "terms", -len(terms))
+
+    def clear(self, pipe: Pipeline, user_id: int, texts: List[str]):
+        for term in {term for text in texts for term in index_terms(text)}:
+            pipe.delete(self._term_key(user_id, term))
+        pipe.delete(self._lengths_key(user_id), self._stats_key(user_id))
+
+    async def search(self, user_id: int, query: str, offset: int = 0, limit: int = 5) -> NoteHits:
+        terms = list(dict.fromkeys(index_terms(query)))
+        if not terms:
+            return NoteHits()
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(self._stats_key(user_id), "docs", "terms")
+            for term in terms:
+                pipe.zcard(self._term_key(user_id, term))
+                pipe.zrevrange(self._term_key(user_id, term), 0, MAX_POSTINGS - 1, withscores=True)
+            (docs, total_terms), *results = await pipe.execute()
+        frequencies, postings = results[0::2], results[1::2]
+
+        docs = int(docs or 0)
+        if not docs:
+            return NoteHits()
+        avg_length = int(total_terms or 0) / docs or 1.0
+
+        candidates = sorted({note_id for posting in postings for note_id, _ in posting})
+        if not candidates:
+            return NoteHits()
+        lengths = dict(zip(candidates, await self._redis.hmget(self._lengths_key(user_id), candidates)))
+
+        scores: Dict[str, float] = {}
+        for frequency, posting in zip(frequencies, postings):
+            idf = math.log(1 + (docs - frequency + 0.5) / (frequency + 0.5))
+            for note_id, tf in posting:
+                norm = K1 * (1 - B + B * int(lengths.get(note_id) or 0) / avg_length)
+                scores[note_id] = scores.get(note_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], int(item[0])))
+        return NoteHits(
+            total=len(ranked),
+            hits=[(int(note_id), score) for note_id, score in ranked[offset:offset + limit]]
+        )
@@ -1,62 +1,239 @@
 import json
+import time
 import logging
-from typing import List, Dict, Optional
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Tuple
 from redis.asyncio import Redis
+from redis.exceptions import WatchError
+
+from app.metrics import observed
+from app.services.long_term import LongTermMemory
+from app.services.note_search import NoteSearchIndex, NoteHits
 
 logger = logging.getLogger(__name__)
 
 
+# Курсор листания: (время создания в мс, id) — заметки с одинаковым временем различает id
+NotesCursor = Tuple[int, str]
+
+
+@dataclass
+class NotesPage:
+    """Страница заметок (по времени создания) и курсоры соседних страниц."""
+    notes: List[Dict] = field(default_factory=list)
+    next_cursor: Optional[NotesCursor] = None
+    prev_cursor: Optional[NotesCursor] = None
+
+
 class NotesService:
-    """CRUD операции для заметок пользователя в Redis."""
-    
-    def __init__(self, redis_client: Redis):
+    """
+    CRUD операции для заметок пользователя в Redis (и их индексация в долгосрочной памяти).
+
+    Заметки лежат в хэше notes:{user_id}:items (id -> JSON), порядок задаёт
+    sorted set notes:{user_id}:by_time (id со временем создания в мс):
+    получение и удаление по id — O(1), листание — курсором по времени.
+    Полнотекстовый индекс (NoteSearchIndex) обновляется в той же транзакции.
+    """
+
+    def __init__(self, redis_client: Redis, long_term_memory: Optional[LongTermMemory] = None):
         self._redis = redis_client
+        self._long_term = long_term_memory
+        self._index = NoteSearchIndex(redis_client)
+
+    def _items_key(self, user_id: int) -> str:
+        return f"notes:{user_id}:items"
 
-    def _key(self, user_id: int) -> str:
+    def _index_key(self, user_id: int) -> str:
+        return f"notes:{user_id}:by_time"
+
+    def _legacy_key(self, user_id: int) -> str:
+        # До хэша заметки хранились JSON-списком
         return f"notes:{user_id}"
 
+    @observed("notes")
     async def add_note(self, user_id: int, text: str) -> int:
         """Добавить заметку. Возвращает ID заметки."""
-        key = self._key(user_id)
-        
         # Получить текущий counter
         counter_key = f"notes_counter:{user_id}"
         note_id = await self._redis.incr(counter_key)
-        
-        note = {"id": note_id, "text": text}
-        await self._redis.rpush(key, json.dumps(note, ensure_ascii=False))
-        
+
+        created = int(time.time() * 1000)
+        note = {"id": note_id, "text": text, "created": created}
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._items_key(user_id), str(note_id), json.dumps(note, ensure_ascii=False))
+            pipe.zadd(self._index_key(user_id), {str(note_id): created})
+            self._index.add(pipe, user_id, note_id, text)
+            await pipe.execute()
+        if self._long_term:
+            await self._long_term.add(user_id, f"note:{note_id}", "note", text)
+
         return note_id
 
-    async def get_notes(self, user_id: int) -> List[Dict]:
-        """Получить все заметки пользователя."""
-        key = self._key(user_id)
-        raw_notes = await self._redis.lrange(key, 0, -1)
-        
+    @observed("notes")
+    async def get_note(self, user_id: int, note_id: int) -> Optional[Dict]:
+        raw = await self._redis.hget(self._items_key(user_id), str(note_id))
+        return json.loads(raw) if raw else None
+
+    async def _load(self, user_id: int, note_ids: List[str]) -> List[Dict]:
+        if not note_ids:
+            return []
+        raw_notes = await self._redis.hmget(self._items_key(user_id), note_ids)
         notes = []
         for raw in raw_notes:
+            if raw is None:
+                continue
             try:
                 notes.append(json.loads(raw))
             except json.JSONDecodeError:
                 continue
-        
         return notes
 
+    @observed("notes")
+    async def get_notes(self, user_id: int) -> List[Dict]:
+        """Получить все заметки пользователя (от старых к новым)."""
+        note_ids = await self._redis.zrange(self._index_key(user_id), 0, -1)
+        return await self._load(user_id, note_ids)
+
+    @observed("notes")
+    async def get_page(self, user_id: int, cursor: Optional[NotesCursor] = None, backward: bool = False, limit: int = 10) -> NotesPage:
+        """
+        Страница заметок после `cursor` (последней показанной заметки),
+        а с backward=True — перед ним. Без курсора — первая страница.
+        """
+        key = self._index_key(user_id)
+        if cursor is None:
+            # Лишний элемент показывает, есть ли ещё страница
+            entries = await self._redis.zrange(key, 0, limit, withscores=True)
+            has_next, has_prev = len(entries) > limit, False
+            entries = entries[:limit]
+        else:
+            # Равные времена Redis упорядочивает по id (как строки): границу
+            # берём включительно, с запасом на заметки с тем же временем, и
+            # отбрасываем всё до курсора включительно
+            score, note_id = cursor
+            ties = 1  # обычно это сама заметка курсора
+            while True:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.zcount(key, score, score)
+                    if backward:
+                        pipe.zrevrangebyscore(key, score, "-inf", start=0, num=limit + 1 + ties, withscores=True)
+                    else:
+                        pipe.zrangebyscore(key, score, "+inf", start=0, num=limit + 1 + ties, withscores=True)
+                    found_ties, entries = await pipe.execute()
+                if found_ties <= ties:
+                    break
+                ties = found_ties
+
+            if backward:
+                entries = [(member, created) for member, created in entries if (int(created), member) < (score, note_id)]
+                has_next, has_prev = True, len(entries) > limit
+                entries = entries[:limit][::-1]
+            else:
+                entries = [(member, created) for member, created in entries if (int(created), member) > (score, note_id)]
+                has_next, has_prev = len(entries) > limit, True
+                entries = entries[:limit]
+
+        if not entries:
+            return NotesPage()
+        notes = await self._load(user_id, [member for member, _ in entries])
+        return NotesPage(
+            notes=notes,
+            next_cursor=(int(entries[-1][1]), entries[-1][0]) if has_next else None,
+            prev_cursor=(int(entries[0][1]), entries[0][0]) if has_prev else None
+        )
+
+    @observed("notes")
     async def delete_note(self, user_id: int, note_id: int) -> bool:
         """Удалить заметку по ID. Возвращает True если удалена."""
-        key = self._key(user_id)
-        notes = await self.get_notes(user_id)
-        
-        # Найти и удалить
-        for note in notes:
-            if note.get("id") == note_id:
-                await self._redis.lrem(key, 1, json.dumps(note, ensure_ascii=False))
-                return True
-        
-        return False
+        # Текст нужен, чтобы убрать заметку из постингов её слов; WATCH не даёт
+        # двум одновременным удалениям дважды вычесть её из статистики индекса
+        items_key = self._items_key(user_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(items_key)
+                    raw = await pipe.hget(items_key, str(note_id))
+                    if raw is None:
+                        return False
+                    note = json.loads(raw)
 
+                    pipe.multi()
+                    pipe.hdel(items_key, str(note_id))
+                    pipe.zrem(self._index_key(user_id), str(note_id))
+                    self._index.remove(pipe, user_id, note_id, note.get("text", ""))
+                    deleted = (await pipe.execute())[0]
+                    break
+                except WatchError:
+                    continue
+
+        if deleted and self._long_term:
+            await self._long_term.remove(user_id, f"note:{note_id}")
+        return bool(deleted)
+
+    @observed("notes")
+    async def search(self, user_id: int, query: str, offset: int = 0, limit: int = 5) -> Tuple[int, List[Dict]]:
+        """Заметки по запросу, лучшие по BM25 первыми. Возвращает (всего найдено, страница)."""
+        found: NoteHits = await self._index.search(user_id, query, offset, limit)
+        notes = await self._load(user_id, [str(note_id) for note_id, _ in found.hits])
+        return found.total, notes
+
+    @observed("notes")
     async def clear_notes(self, user_id: int) -> None:
         """Удалить все заметки пользователя."""
-        key = self._key(user_id)
         counter_key = f"notes_counter:{user_id}"
-        await self._redis.delete(key, counter_key)
+        notes = await self.get_notes(user_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._items_key(user_id), self._index_key(user_id), counter_key)
+            self._index.clear(pipe, user_id, [note.get("text", "") for note in notes])
+            await pipe.execute()
+        if self._long_term:
+            for note in notes:
+                await self._long_term.remove(user_id, f"note:{note.get('id')}")
+
+    async def reindex(self, user_id: int) -> int:
+        """
+        Перестроить полнотекстовый индекс заметок пользователя и дописать в
+        долговременную память заметки, которых там нет. Возвращает число заметок.
+        """
+        notes = await self.get_notes(user_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            self._index.clear(pipe, user_id, [note.get("text", "") for note in notes])
+            for note in notes:
+                self._index.add(pipe, user_id, note["id"], note.get("text", ""))
+            await pipe.execute()
+        if self._long_term:
+            await self._long_term.sync_notes(user_id, [(note["id"], note.get("text", "")) for note in notes])
+        return len(notes)
+
+    async def migrate_legacy(self, user_id: int) -> int:
+        """
+        Перенести заметки из старого списка notes:{user_id} в хэш + sorted set.
+        Время создания в старом формате не хранилось: порядок сохраняется по позиции.
+        Возвращает число перенесённых заметок.
+        """
+        legacy_key = self._legacy_key(user_id)
+        if await self._redis.type(legacy_key) != "list":
+            return 0
+
+        raw_notes = await self._redis.lrange(legacy_key, 0, -1)
+        base = int(time.time() * 1000) - len(raw_notes)
+        migrated = []
+        for position, raw in enumerate(raw_notes):
+            try:
+                note = json.loads(raw)
+                migrated.append({"id": int(note["id"]), "text": note.get("text", ""), "created": base + position})
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                logger.warning(f"Skipping malformed legacy note of user {user_id}: {raw!r}")
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for note in migrated:
+                pipe.hset(self._items_key(user_id), str(note["id"]), json.dumps(note, ensure_ascii=False))
+                pipe.zadd(self._index_key(user_id), {str(note["id"]): note["created"]})
+                self._index.add(pipe, user_id, note["id"], note["text"])
+            pipe.delete(legacy_key)
+            await pipe.execute()
+
+        if self._long_term:
+            for note in migrated:
+                await self._long_term.add(user_id, f"note:{note['id']}", "note", note["text"])
+        return len(migrated)
@@ -1,45 +1,103 @@
 import logging
-import datetime
-from tavily import TavilyClient
+from typing import Dict, Optional
+import aiohttp
+from redis.asyncio import Redis
+
+from app.metrics import observed
+from app.services.search_cache import SearchCache, SEARCH_FAILED, strip_current_year
+from app.services.search_trigger import needs_search
 from config import SearchConfig
 
 logger = logging.getLogger(__name__)
 
+
+class TavilyAsyncClient:
+    """
+    Minimal async client for the Tavily REST API.
+    Keeps one aiohttp session (persistent connection pool) for the bot's lifetime.
+    """
+
+    def __init__(self, api_key: str, base_url: str, timeout: float, pool_size: int):
+        self._api_key = api_key
+        self._base_url = base_url.rstrip("/")
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily: a ClientSession must be bound to the running loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=60),
+                headers={"Authorization": f"Bearer {self._api_key}"},
+                timeout=self._timeout
+            )
+        return self._session
+
+    @observed("tavily")
+    async def search(self, query: str, search_depth: str = "basic", max_results: int = 3) -> Dict:
+        payload = {"query": query, "search_depth": search_depth, "max_results": max_results}
+        async with self._get_session().post(f"{self._base_url}/search", json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
 class SearchService:
-    def __init__(self, config: SearchConfig):
+    def __init__(self, config: SearchConfig, redis_client: Optional[Redis] = None):
         # Handle empty key gracefully if needed, or fail fast
-        self._client = TavilyClient(api_key=config.api_key) if config.api_key else None
+        self._client = TavilyAsyncClient(
+            api_key=config.api_key,
+            base_url=config.base_url,
+            timeout=config.timeout,
+            pool_size=config.pool_size
+        ) if config.api_key else None
         self._enabled = bool(config.api_key)
+        self._cache = SearchCache(redis_client, max_items=config.cache_size)
 
+    @observed("search")
     async def search(self, query: str, max_results: int = 3) -> str:
         """
         Search Tavily and return context string.
         Returns "SEARCH_FAILED" if error or no results.
+        Results are cached by normalized query; identical concurrent searches share one request.
         """
         if not self._enabled:
-            return "SEARCH_FAILED"
+            return SEARCH_FAILED
+
+        return await self._cache.get_or_fetch(
+            query,
+            lambda: self._search_upstream(query, max_results),
+            namespace=str(max_results)
+        )
 
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit/miss counters of the search cache."""
+        return self._cache.stats()
+
+    async def _search_upstream(self, query: str, max_results: int) -> str:
         try:
             # OPTIMIZATION: Clean query
             # 1. Remove current year to avoid stale SEO results like "Weather 2024" if we are in 2026?
             # Or user means "don't include 2025 if today is 2026". 
             # Safe logic: Remove current year string.
-            current_year = str(datetime.datetime.now().year)
-            query = query.replace(current_year, "")
+            query = strip_current_year(query)
             
             # 2. Add 'current' for weather/news
             if "погода" in query.lower() or "weather" in query.lower():
                 query += " current"
 
-            # Tavily is sync by default (python sdk). 
-            # For async, we should use run_in_executor or verify if they added async support.
-            # Assuming sync:
-            response = self._client.search(query=query, search_depth="basic", max_results=max_results)
+            # Native async request: the event loop keeps serving other updates meanwhile.
+            # Timeouts surface as exceptions below; cancellation propagates to the caller.
+            response = await self._client.search(query=query, search_depth="basic", max_results=max_results)
             logger.info(f"DEBUG TAVILY RESPONSE: {response}")
             
             results = response.get("results", [])
             if not results:
-                return "SEARCH_FAILED"
+                return SEARCH_FAILED
             
             content_list = []
             for r in results:
@@ -50,19 +108,15 @@ class SearchService:
             
             return "\n\n".join(content_list)
         except Exception as e:
-            logger.error(f"Error searching Tavily: {e}")
-            return "SEARCH_FAILED"
+            logger.error(f"Error searching Tavily: {e!r}")
+            return SEARCH_FAILED
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
 
     def needs_search(self, text: str) -> bool:
         """
-        Simple keyword detection to decide if search is needed.
+        Whether the message needs fresh data from the web (see app/services/search_trigger.py).
         """
-        triggers = [
-            "погода", "новости", "курс", "цена", "кто такой", 
-            "что такое", "когда", "где", "weather", "news", 
-            "price", "who is", "what is", "when", "where",
-            "прогноз", "найди", "факты о", "сколько стоит",
-            "bitcoin", "usd", "euro", "рубль"
-        ]
-        text_lower = text.lower()
-        return any(t in text_lower for t in triggers)
+        return needs_search(text)
@@ -0,0 +1,128 @@
+import re
+import asyncio
+import hashlib
+import logging
+import datetime
+from typing import Awaitable, Callable, Dict, Optional
+from redis.asyncio import Redis
+
+from app.utils.cache import TTLCache
+from app.utils.text import stem_token
+
+logger = logging.getLogger(__name__)
+
+# Never cached: the caller should be able to retry a failed search
+SEARCH_FAILED = "SEARCH_FAILED"
+
+STOPWORDS = {
+    # RU
+    "а", "в", "во", "на", "по", "о", "об", "у", "к", "с", "со", "из", "за", "для", "до", "от",
+    "и", "или", "ли", "же", "бы", "это", "мне", "меня", "я", "ты", "мы",
+    "какая", "какой", "какое", "какие", "каков", "сейчас", "скажи", "подскажи",
+    "пожалуйста", "плиз", "там", "тут", "будет", "есть",
+    # EN
+    "the", "a", "an", "in", "on", "at", "of", "for", "to", "is", "are",
+    "please", "tell", "me", "now",
+}
+
+# (trigger substrings, ttl seconds); first match wins
+TOPIC_TTLS = [
+    (("погод", "weather", "прогноз", "температур", "forecast"), 15 * 60),
+    (("курс", "цена", "цены", "стоит", "price", "usd", "euro", "евро", "доллар", "рубл", "bitcoin", "биткоин"), 10 * 60),
+    (("новост", "news", "сегодня", "today", "вчера"), 30 * 60),
+    (("кто такой", "кто такая", "что такое", "who is", "what is", "история", "history"), 7 * 86400),
+]
+DEFAULT_TTL = 6 * 3600
+
+
+def strip_current_year(query: str) -> str:
+    """Remove the current year to avoid stale SEO results like "Weather 2024"."""
+    return query.replace(str(datetime.datetime.now().year), "")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key for a query: lowercase, no punctuation, no stopwords, stemmed.
+    "какая погода в Минске?" and "погода минск" both give "погод минск".
+    Word order, repeated words and negations ("не") are kept: "москва
+    берлин рейс" and "берлин москва рейс" are different questions.
+    """
+    tokens = re.findall(r"\w+", strip_current_year(query).lower().replace("ё", "е"))
+    return " ".join(stem_token(t) for t in tokens if t not in STOPWORDS)
+
+
+def topic_ttl(query: str) -> int:
+    """Short TTL for volatile topics (weather, currency), long for encyclopedic ones."""
+    text = query.lower()
+    for triggers, ttl in TOPIC_TTLS:
+        if any(t in text for t in triggers):
+            return ttl
+    return DEFAULT_TTL
+
+
+class SearchCache:
+    """
+    Two-tier cache for search results: in-process LRU with TTL in front of
+    a shared Redis cache. Concurrent lookups of the same key are coalesced
+    into one upstream request.
+    """
+
+    def __init__(self, redis_client: Optional[Redis] = None, max_items: int = 256):
+        self._redis = redis_client
+        self._local: TTLCache[str] = TTLCache(max_items)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "coalesced": 0}
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def _redis_key(self, key: str) -> str:
+        # v2: keys keep word order and negations; v1 entries just expire
+        return "search_cache:v2:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[str]], namespace: str = "") -> str:
+        key = f"{namespace}|{normalize_query(query)}"
+
+        value = self._local.get(key)
+        if value is not None:
+            self._stats["local_hits"] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            task = asyncio.create_task(self._load(key, topic_ttl(query), fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shield: a cancelled caller must not cancel the lookup other callers wait for
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, ttl: int, fetch: Callable[[], Awaitable[str]]) -> str:
+        redis_key = self._redis_key(key)
+        if self._redis is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.get(redis_key)
+                    pipe.ttl(redis_key)
+                    cached, remaining = await pipe.execute()
+                if cached is not None:
+                    self._stats["redis_hits"] += 1
+                    self._local.set(key, cached, remaining if remaining > 0 else ttl)
+                    return cached
+            except Exception as e:
+                logger.error(f"Error reading search cache from Redis: {e}")
+
+        self._stats["misses"] += 1
+        value = await fetch()
+        if value == SEARCH_FAILED:
+            return value
+
+        self._local.set(key, value, ttl)
+        if self._redis is not None:
+            try:
+                await self._redis.set(redis_key, value, ex=ttl)
+            except Exception as e:
+                logger.error(f"Error writing search cache to Redis: {e}")
+        return value
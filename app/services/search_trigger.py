@@ -0,0 +1,105 @@
+"""
+Decides whether a message needs a web search.
+
+All trigger phrases live in one precompiled regex with a named group per
+feature and word boundaries on both sides, so "где" no longer fires inside
+"везде" and "курс" only counts next to a currency. The features found in a
+message are summed with fixed weights; the message goes to search when the
+score reaches SEARCH_THRESHOLD. Tune against benchmarks/search_trigger.py (its
+tuning corpus; judge by the held-out one).
+"""
+import re
+from typing import Dict, Set
+
+# Feature -> alternatives. Stems end in \w* so inflected forms match
+FEATURES: Dict[str, str] = {
+    # The user asks for a search explicitly
+    "explicit": r"найди|найти|поищи|поищите|загугли|погугли|гугл\w*|в интернете|в сети|search(?: for)?|google|look up|browse",
+    # Data that changes all the time
+    "live": (
+        r"погод\w*|прогноз\w*|температур\w*|weather|forecast|новост\w*|news|headlines?"
+        r"|курс\w* (?:\w+ )?(?:валют|доллар|евро|рубл|юан|биткоин|крипт|акци|бирж)\w*|exchange rates?"
+        r"|котировк\w*|stock market|stock prices?"
+        r"|который (?:сейчас )?час|сколько (?:сейчас )?времени в|what time is it|time in|time zone|часов\w* пояс\w*"
+    ),
+    "price": r"сколько стоит|сколько стоят|цен[аыуе]?(?: на)?|стоимост\w*|prices?|how much (?:is|are|does|do)|costs?",
+    "currency": r"доллар\w*|евро|рубл\w*|юан\w*|биткоин\w*|bitcoin|btc|usd|eur|euro|dollars?",
+    # Events and schedules
+    "events": (
+        r"что нового|матч\w*|сч[её]т игры|выиграл\w*|победил\w*|выбор\w*|результат\w*|расписани\w*|рейс\w*|пробк\w*"
+        r"|matche?s?|score|won|wins|winner|elections?|results?|schedule|flights?|traffic|open now"
+    ),
+    "release": r"выйдет|выходит|вышел|вышла|вышли|релиз\w*|анонс\w*|премьер\w*|releases?d?|launch\w*|announced|premiere",
+    "recency": (
+        r"сегодня|сейчас|вчера|завтра|на этой неделе|в этом году|последн\w*|свеж\w*|актуальн\w*|текущ\w*|нынешн\w*"
+        r"|today|tonight|yesterday|tomorrow|now|currently|current|latest|recent\w*|this (?:week|month|year)|20[2-3]\d"
+    ),
+    # Questions about a person are usually about a real one
+    "who_is": r"кто так(?:ой|ая|ие)|who (?:is|was|are)",
+    "what_is": r"что так(?:ое|ие)|what (?:is|are)",
+    # Reference facts: dates, places, numbers
+    "facts": (
+        r"родил(?:ся|ась|ись)|умер(?:ла|ли)?|основан\w*|столиц\w*|населени\w*"
+        r"|born|died|founded|capital of|population"
+    ),
+    # Chat with the bot itself: answerable without the internet
+    "personal": r"я|мне|меня|мой|моя|мои|мы|нам|ты|тебя|тебе|твой|твоя|i|me|my|you|your",
+    "task": (
+        r"напиши|придумай|сочини|переведи|объясни|помоги|расскажи (?:сказку|историю|анекдот|шутку)|исправь|перепиши"
+        r"|посоветуй|write|compose|translate|explain|joke|poem|story|rewrite|summari[sz]e"
+    ),
+    "smalltalk": (
+        r"привет\w*|здравствуй\w*|спасибо|пока|доброе утро|спокойной ночи|как дела|люблю|скучаю|грустно"
+        r"|hello|hi|hey|thanks|thank you|good (?:morning|night)|how are you|love|miss you"
+    ),
+}
+
+WEIGHTS: Dict[str, float] = {
+    "explicit": 3.0,
+    "live": 2.5,
+    "price": 2.0,
+    "currency": 1.5,
+    "events": 1.5,
+    "release": 1.5,
+    "recency": 1.0,
+    "who_is": 2.0,
+    "what_is": 1.0,
+    "facts": 1.5,
+    "question": 0.5,
+    "entity": 0.5,
+    "personal": -1.0,
+    "task": -2.5,
+    "smalltalk": -2.0,
+}
+
+SEARCH_THRESHOLD = 2.0
+
+# (?<!\w) / (?!\w) instead of \b: also correct next to digits and underscores
+_TRIGGERS = re.compile(
+    "|".join(rf"(?<!\w)(?P<{name}>{pattern})(?!\w)" for name, pattern in FEATURES.items())
+)
+_QUESTION_START = re.compile(
+    r"\s*(?:кто|что|где|когда|сколько|какой|какая|какое|какие|почему|зачем|как|ли"
+    r"|who|what|where|when|how|which|why|is|are|does|do|did|can|will)(?!\w)"
+)
+# A capitalized word in the middle of a sentence: a name, place, brand...
+_ENTITY = re.compile(r"(?<=[\w,;:] )[A-ZА-ЯЁ]\w+|(?<!\w)[A-Za-z]+\d+\w*")
+
+
+def trigger_features(text: str) -> Set[str]:
+    """Features present in the message (each counted once)."""
+    lowered = text.lower()
+    features = {match.lastgroup for match in _TRIGGERS.finditer(lowered)}
+    if lowered.rstrip().endswith("?") or _QUESTION_START.match(lowered):
+        features.add("question")
+    if _ENTITY.search(text):
+        features.add("entity")
+    return features
+
+
+def search_score(text: str) -> float:
+    return sum(WEIGHTS[feature] for feature in trigger_features(text))
+
+
+def needs_search(text: str) -> bool:
+    return search_score(text) >= SEARCH_THRESHOLD
@@ -0,0 +1,101 @@
+import json
+import asyncio
+import logging
+from typing import Set
+from redis.asyncio import Redis
+
+from app.services.llm import LLMService
+from app.services.memory import summary_key
+from app.services.long_term import LongTermMemory
+from config import SummaryConfig
+
+logger = logging.getLogger(__name__)
+
+# Drop the folded head of the history and store the new summary, but only if
+# the head is still exactly what was summarized: a concurrent append may have
+# trimmed it, or another worker may have folded it already.
+# KEYS: history, summary; ARGV: ttl, summary, folded messages...
+_FOLD_SCRIPT = """
+local count = #ARGV - 2
+local head = redis.call('LRANGE', KEYS[1], 0, count - 1)
+if #head ~= count then
+    return 0
+end
+for i = 1, count do
+    if head[i] ~= ARGV[i + 2] then
+        return 0
+    end
+end
+redis.call('LTRIM', KEYS[1], count, -1)
+redis.call('SET', KEYS[2], ARGV[2], 'EX', tonumber(ARGV[1]))
+return 1
+"""
+
+
+class SummaryService:
+    """
+    Rolling summary of the conversation, stored next to the history list.
+
+    Once the history is longer than `threshold`, everything but the last
+    `keep_recent` messages is folded into the summary by a cheap model and
+    removed from the list. The summary is only ever extended with the new
+    messages, never rebuilt from the full dialog. Runs in the background
+    after a reply was sent. The folded turns are archived in long-term memory.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        llm_service: LLMService,
+        long_term_memory: LongTermMemory,
+        config: SummaryConfig,
+        ttl: int = 86400,
+    ):
+        self._redis = redis_client
+        self._llm = llm_service
+        self._long_term = long_term_memory
+        self._config = config
+        self._ttl = ttl
+        self._fold = redis_client.register_script(_FOLD_SCRIPT)
+        self._running: Set[int] = set()
+        self._tasks = set()
+
+    def schedule(self, user_id: int):
+        """Compact the user's history in the background (once at a time per user)."""
+        if not self._config.enabled or user_id in self._running:
+            return
+        self._running.add(user_id)
+        task = asyncio.create_task(self.compact(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._running.discard(user_id))
+
+    async def compact(self, user_id: int) -> bool:
+        history_key = f"chat_history:{user_id}"
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(history_key, 0, -1)
+                pipe.get(summary_key(user_id))
+                raw_messages, summary = await pipe.execute()
+            if len(raw_messages) <= self._config.threshold:
+                return False
+
+            folded = raw_messages[:len(raw_messages) - self._config.keep_recent]
+            messages = [json.loads(raw) for raw in folded]
+            updated = await self._llm.summarize(
+                summary,
+                messages,
+                self._config.model,
+                self._config.max_tokens
+            )
+            if not updated:
+                return False
+
+            done = await self._fold(keys=[history_key, summary_key(user_id)], args=[self._ttl, updated, *folded])
+            if done:
+                logger.info(f"Folded {len(folded)} messages of user {user_id} into the summary")
+                await self._long_term.add_turns(user_id, messages)
+            return bool(done)
+        except Exception as e:
+            logger.error(f"Error compacting history of user {user_id}: {e}")
+            return False
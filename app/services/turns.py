@@ -0,0 +1,170 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, List, Optional
+from aiogram import Bot
+
+from app.metrics import observe_turn
+from app.services.memory import MemoryService, TurnContext
+from app.services.llm import LLMService, with_error_text
+from app.services.search import SearchService
+from app.services.summary import SummaryService
+from app.services.long_term import LongTermMemory
+from app.utils.streaming import stream_reply
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Turn:
+    """
+    One chat turn split into named stages.
+
+    gather() runs independent stages concurrently, later() schedules work that
+    doesn't affect the reply (persistence) to run after it was sent. Every
+    stage's duration is recorded in `timings` and logged once the turn is over.
+    """
+
+    def __init__(self, kind: str, user_id: int):
+        self.kind = kind
+        self.user_id = user_id
+        self.timings: Dict[str, float] = {}
+        self._started_at = time.monotonic()
+        self._later: List[asyncio.Task] = []
+
+    async def stage(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        started_at = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.timings[name] = time.monotonic() - started_at
+
+    async def gather(self, **stages: Awaitable[Any]) -> Dict[str, Any]:
+        """Run the stages concurrently; returns their results by name."""
+        results = await asyncio.gather(*(self.stage(name, aw) for name, aw in stages.items()))
+        return dict(zip(stages, results))
+
+    def later(self, name: str, awaitable: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.create_task(self._run_later(name, awaitable))
+        self._later.append(task)
+        return task
+
+    async def _run_later(self, name: str, awaitable: Awaitable[Any]):
+        try:
+            await self.stage(name, awaitable)
+        except Exception as e:
+            logger.error(f"Post-reply stage {name} of {self.kind} turn failed: {e}")
+
+    async def finish(self):
+        """Wait for the post-reply stages, then log the timings."""
+        await asyncio.gather(*self._later, return_exceptions=True)
+        self.timings["total"] = time.monotonic() - self._started_at
+        observe_turn(self.kind, self.timings)
+        stages = " ".join(f"{name}={seconds:.3f}s" for name, seconds in self.timings.items())
+        logger.info(f"Turn {self.kind} user={self.user_id}: {stages}")
+
+
+class TurnPipeline:
+    """
+    Answers a user message with the chat model: history, settings, web search,
+    long-term memories and the typing action are fetched concurrently, the reply is streamed, and
+    the turn is saved to history after the reply is out (and long histories
+    are then folded into the running summary).
+    """
+
+    def __init__(
+        self,
+        memory_service: MemoryService,
+        llm_service: LLMService,
+        search_service: SearchService,
+        summary_service: SummaryService,
+        long_term_memory: LongTermMemory,
+        config: Config,
+    ):
+        self._memory = memory_service
+        self._llm = llm_service
+        self._search = search_service
+        self._summary = summary_service
+        self._long_term = long_term_memory
+        self._config = config
+        # Per-user history writes still running: the next turn must see them
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._tasks = set()
+
+    async def load_context(self, user_id: int) -> TurnContext:
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            await asyncio.wait([pending])
+        return await self._memory.load_turn_context(user_id)
+
+    async def answer(
+        self,
+        bot: Bot,
+        chat_id: int,
+        user_text: str,
+        turn: Turn,
+        context: Optional[TurnContext] = None,
+        prefix: str = "",
+        error_text: Optional[str] = None,
+    ) -> str:
+        """
+        Stream the reply to `user_text` into the chat and return it.
+        `context` may be preloaded by the caller (e.g. alongside transcription,
+        with its own typing action). A failing model request raises, unless
+        `error_text` is given to be shown instead.
+        """
+        searching = self._search.needs_search(user_text)
+        stages = dict(recall=self._long_term.recall(turn.user_id, user_text))
+        if searching:
+            stages.update(search=self._search.search(user_text))
+        if context is None:
+            stages.update(context=self.load_context(turn.user_id))
+        if context is None or searching:
+            # One chat action per turn: a second one would just replace the first
+            action = "find_location" if searching else "typing"  # Fun visual for a search
+            stages.update(typing=bot.send_chat_action(chat_id=chat_id, action=action))
+        results = await turn.gather(**stages)
+        context = results.get("context", context)
+
+        history = context.history + [{"role": "user", "content": user_text}]
+
+        chunks = self._llm.stream_response(
+            history,
+            mode=context.mode or "cute",
+            model_override=context.model_override,
+            search_results=results.get("search"),
+            summary=context.summary,
+            memories=[recollection.text for recollection in results["recall"]]
+        )
+        if error_text is not None:
+            chunks = with_error_text(chunks, error_text)
+
+        response_text = await turn.stage("reply", stream_reply(
+            bot,
+            chat_id,
+            chunks,
+            prefix=prefix,
+            edit_interval=self._config.llm.stream_edit_interval
+        ))
+
+        # Only the final raw text is stored
+        self.persist(turn, {"role": "user", "content": user_text}, {"role": "assistant", "content": response_text})
+        return response_text
+
+    def persist(self, turn: Turn, user_message: Dict[str, str], assistant_message: Dict[str, str]):
+        """Save the turn to history after the reply, then report the turn's timings."""
+        task = turn.later("persist", self._save(turn.user_id, user_message, assistant_message))
+        self._pending[turn.user_id] = task
+        task.add_done_callback(lambda _: self._forget(turn.user_id, task))
+
+        finish = asyncio.create_task(turn.finish())
+        self._tasks.add(finish)
+        finish.add_done_callback(self._tasks.discard)
+
+    async def _save(self, user_id: int, user_message: Dict[str, str], assistant_message: Dict[str, str]):
+        await self._memory.add_turn(user_id, user_message, assistant_message)
+        self._summary.schedule(user_id)
+
+    def _forget(self, user_id: int, task: asyncio.Task):
+        if self._pending.get(user_id) is task:
+            del self._pending[user_id]
@@ -1,67 +1,188 @@
+import asyncio
 import logging
-import os
-import subprocess
-from typing import BinaryIO
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 from openai import AsyncOpenAI
 
+from app.metrics import observed
+from app.utils.audio import (
+    SAMPLE_RATE, pcm_duration, pcm_slice, trim_silence,
+    plan_segments, stitch_transcripts,
+)
 from config import VoiceConfig
 
 logger = logging.getLogger(__name__)
 
+# ffmpeg arguments for the raw PCM produced by the decode step
+PCM_INPUT = ["-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE)]
+
+# Stands in for a long-audio segment that failed every attempt
+SEGMENT_GAP = "[…]"
+
+
+@dataclass
+class PreprocessStats:
+    """What the preprocessing stage saved on one voice note."""
+    bytes_in: int
+    bytes_out: int
+    seconds_in: float
+    seconds_out: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.bytes_in} -> {self.bytes_out} bytes ({self.bytes_in - self.bytes_out} saved), "
+            f"{self.seconds_in:.1f} -> {self.seconds_out:.1f}s ({self.seconds_in - self.seconds_out:.1f}s saved)"
+        )
+
+
 class VoiceService:
     def __init__(self, config: VoiceConfig):
         self._client = AsyncOpenAI(
             api_key=config.api_key,
-            base_url="https://api.groq.com/openai/v1",
+            base_url=config.base_url,
         )
         self._model = config.model
+        self._preprocess = config.preprocess
+        self._bitrate = config.bitrate
+        # Bound concurrent ffmpeg processes so a burst of voice notes can't exhaust the CPU
+        self._ffmpeg_slots = asyncio.Semaphore(config.max_conversions)
+        # Long-audio mode
+        self._long_audio_threshold = config.long_audio_threshold
+        self._segment_max = config.segment_max_seconds
+        self._segment_min = config.segment_min_seconds
+        self._segment_overlap = config.segment_overlap_seconds
+        self._segment_retries = config.segment_retries
+        self._segment_slots = asyncio.Semaphore(config.max_parallel_segments)
+
+    @property
+    def model(self) -> str:
+        return self._model
 
-    async def transcribe(self, audio_path: str) -> str:
+    @observed("voice")
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg", duration: Optional[float] = None) -> str:
         """
-        Transcribe audio file to text using Groq.
-        Converts .ogg to .mp3 using ffmpeg first if needed.
+        Transcribe in-memory audio to text using Groq.
+        Audio is decoded, stripped of silence and re-encoded to low-bitrate
+        Opus before upload; voice notes longer than the threshold are split at
+        pauses and transcribed in parallel. Nothing is written to disk.
+        Upload errors propagate: the voice job retries them.
         """
-        mp3_path = audio_path.replace(".ogg", ".mp3")
-        
-        try:
-            # 1. Convert OGG to MP3 using ffmpeg
-            # Groq supports: flac, mp3, mp4, mpeg, mpga, m4a, ogg, wav, webm.
-            # But documentation often recommends standard formats. 
-            # If input is .ogg (Telegram voice), let's ensure it's standard Opus/Vorbis.
-            # Usually simple conversion ensures compatibility.
-            
-            # -y : overwrite output
-            # -i : input
-            # -vn : no video
-            # -acodec libmp3lame : force mp3
-            process = subprocess.run(
-                ["ffmpeg", "-y", "-i", audio_path, "-vn", "-acodec", "libmp3lame", "-q:a", "4", mp3_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+        long_audio = bool(duration and duration > self._long_audio_threshold)
+        if self._preprocess or long_audio:
+            text = await self._transcribe_preprocessed(audio)
+            if text is not None:
+                return text
+            # Decoding or re-encoding failed: fall back to uploading the original
+
+        return await self._upload(audio, filename)
+
+    @observed("groq", "transcribe")
+    async def _upload(self, audio: bytes, filename: str) -> str:
+        transcript = await self._client.audio.transcriptions.create(
+            model=self._model,
+            file=(filename, audio),
+            response_format="text"
+        )
+        return transcript
+
+    @observed("ffmpeg", "run")
+    async def _run_ffmpeg(self, input_args: List[str], output_args: List[str], audio: bytes) -> Tuple[int, bytes, bytes]:
+        """Pipe audio through ffmpeg (stdin -> stdout) without touching the disk."""
+        async with self._ffmpeg_slots:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                *input_args, "-i", "pipe:0", *output_args, "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
-            
-            if process.returncode != 0:
-                logger.error(f"FFmpeg conversion failed: {process.stderr.decode()}")
-                # Try sending original file as fallback
-                mp3_path = audio_path
-            
-            # 2. Transcribe
-            with open(mp3_path, "rb") as audio_file:
-                transcript = await self._client.audio.transcriptions.create(
-                    model=self._model,
-                    file=audio_file,
-                    response_format="text"
-                )
-            
-            return transcript
-
-        except Exception as e:
-            logger.error(f"Error transcribing audio: {e}", exc_info=True)
-            return ""
-        finally:
-            # Cleanup mp3 file if it was created and is different from input
-            if mp3_path != audio_path and os.path.exists(mp3_path):
-                try:
-                    os.remove(mp3_path)
-                except:
-                    pass
+            try:
+                stdout, stderr = await process.communicate(audio)
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+        return process.returncode, stdout, stderr
+
+    async def _decode(self, audio: bytes) -> bytes:
+        """Decode any input to 16 kHz mono PCM. Returns empty bytes on failure."""
+        returncode, pcm, stderr = await self._run_ffmpeg([], ["-vn", *PCM_INPUT], audio)
+        if returncode != 0:
+            logger.error(f"FFmpeg decoding failed: {stderr.decode(errors='replace')}")
+            return b""
+        return pcm
+
+    async def _encode(self, pcm: bytes) -> bytes:
+        """Encode PCM to compact speech Opus (OGG container, accepted by Groq)."""
+        returncode, ogg, stderr = await self._run_ffmpeg(
+            PCM_INPUT,
+            ["-c:a", "libopus", "-b:a", self._bitrate, "-application", "voip", "-f", "ogg"],
+            pcm
+        )
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg encoding failed: {stderr.decode(errors='replace')}")
+        return ogg
+
+    async def _transcribe_preprocessed(self, audio: bytes) -> Optional[str]:
+        """
+        Decode to PCM, cut silences with the NumPy VAD, re-encode and upload.
+        Long results are split at the remaining pauses into bounded segments
+        that are transcribed concurrently and stitched back in order; a
+        segment that keeps failing shows up as SEGMENT_GAP, and if all of
+        them fail the error propagates. Returns None if the audio could not
+        be decoded or re-encoded.
+        """
+        pcm = await self._decode(audio)
+        if not pcm:
+            return None
+
+        seconds_in = pcm_duration(pcm)
+        # VAD is vectorized but still CPU work: keep it off the event loop
+        pcm, pauses = await asyncio.to_thread(trim_silence, pcm)
+        duration = pcm_duration(pcm)
+
+        if duration > self._long_audio_threshold:
+            segments = plan_segments(duration, pauses, self._segment_max, self._segment_min, self._segment_overlap)
+        else:
+            segments = [(0.0, duration)]
+
+        try:
+            encoded = await asyncio.gather(*(self._encode(pcm_slice(pcm, start, end)) for start, end in segments))
+        except RuntimeError as e:
+            logger.error(str(e))
+            return None
+        stats = PreprocessStats(len(audio), sum(len(e) for e in encoded), seconds_in, duration)
+        logger.info(f"Voice preprocessing: {stats}, {len(segments)} segment(s)")
+
+        if len(segments) == 1:
+            return await self._upload(encoded[0], "voice.ogg")
+
+        results = await asyncio.gather(*(
+            self._transcribe_segment(data, index) for index, data in enumerate(encoded)
+        ), return_exceptions=True)
+        failed = [result for result in results if isinstance(result, Exception)]
+        if len(failed) == len(results):
+            raise failed[0]
+        if failed:
+            logger.error(f"{len(failed)} of {len(results)} segments failed, marked as gaps")
+
+        parts = [SEGMENT_GAP if isinstance(result, Exception) else result for result in results]
+        overlapped = [False] + [segments[i][0] < segments[i - 1][1] for i in range(1, len(segments))]
+        return stitch_transcripts(parts, overlapped)
+
+    async def _transcribe_segment(self, audio: bytes, index: int) -> str:
+        """
+        Transcribe one segment, retrying it on its own with exponential
+        backoff. The parallel slot is held only while uploading, not while
+        waiting to retry. Raises the last error once the attempts run out.
+        """
+        for attempt in range(self._segment_retries):
+            try:
+                async with self._segment_slots:
+                    transcript = await self._upload(audio, f"segment_{index}.ogg")
+                return transcript.strip()
+            except Exception as e:
+                logger.warning(f"Segment {index} transcription failed (attempt {attempt + 1}): {e}")
+                if attempt + 1 == self._segment_retries:
+                    raise
+            await asyncio.sleep(2 ** attempt)
@@ -0,0 +1,221 @@
+import os
+import socket
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from config import StreamConfig
+
+logger = logging.getLogger(__name__)
+
+# Set by UpdateWorker while it handles an update: lets the chat's next update start
+_release_chat: ContextVar[Optional[Callable[[], None]]] = ContextVar("release_chat", default=None)
+
+
+def release_chat_order():
+    """
+    Let the next update of this chat start now. For handlers that register
+    their update and then wait for later ones (album and debounce windows):
+    with the chat's order lock held through the wait, those later updates
+    would only arrive once the window is over. No-op outside stream workers.
+    """
+    release = _release_chat.get()
+    if release is not None:
+        release()
+
+
+def shard_key(update: Update) -> int:
+    """Chat (or user) the update belongs to: all its updates go to one shard, in order."""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class UpdateStream:
+    """
+    Receiver side: appends raw updates to one of N Redis Streams
+    (updates:{shard}), sharded by chat so every chat keeps its order.
+    """
+
+    def __init__(self, redis_client: Redis, config: StreamConfig):
+        self._redis = redis_client
+        self._config = config
+
+    def stream_name(self, shard: int) -> str:
+        return f"{self._config.prefix}:{shard}"
+
+    async def publish(self, update: Update):
+        key = shard_key(update)
+        await self._redis.xadd(
+            self.stream_name(key % self._config.shards),
+            {"update_id": update.update_id, "chat": key, "update": update.model_dump_json(exclude_none=True)},
+            maxlen=self._config.maxlen,
+            approximate=True
+        )
+
+
+async def poll_into(bot: Bot, stream: UpdateStream, allowed_updates: Optional[List[str]] = None):
+    """Long-poll Telegram and hand every update to the stream instead of the dispatcher."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"Error polling updates: {e}")
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            try:
+                await stream.publish(update)
+            except Exception as e:
+                # offset stays put: Telegram hands this update (and the rest) out again
+                logger.error(f"Error publishing update {update.update_id}: {e}")
+                await asyncio.sleep(1)
+                break
+            offset = update.update_id + 1
+
+
+class UpdateWorker:
+    """
+    Consumer side: worker `index` of `total` owns shards where shard % total == index
+    and reads each of them through a consumer group. Updates of one chat are
+    handled strictly in order (a FIFO lock per chat; a handler waiting for
+    the chat's later updates gives it up early, see release_chat_order),
+    different chats run concurrently up to `concurrency` updates per worker.
+
+    Updates are processed once per update_id (a done-marker in Redis), and
+    entries left pending by a dead worker are reclaimed after `claim_idle_ms`.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        config: StreamConfig,
+        dp: Dispatcher,
+        bot: Bot,
+        deps: Dict[str, Any],
+        index: int = 0,
+        total: int = 1,
+    ):
+        self._redis = redis_client
+        self._config = config
+        self._dp = dp
+        self._bot = bot
+        self._deps = deps
+        self._stream = UpdateStream(redis_client, config)
+        self._shards = [s for s in range(config.shards) if s % total == index]
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}-{index}"
+        self._slots = asyncio.Semaphore(config.concurrency)
+        self._chat_locks: Dict[str, List] = {}  # chat -> [lock, users]
+        self._tasks = set()
+        self._in_flight = set()  # entry ids being handled here, never reclaimed twice
+
+    async def _ensure_group(self, stream: str):
+        try:
+            await self._redis.xgroup_create(stream, self._config.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _handle(self, stream: str, entry_id: str, fields: Dict[str, str]):
+        done_key = f"update_done:{fields.get('update_id')}"
+        try:
+            if not await self._redis.exists(done_key):
+                update = Update.model_validate_json(fields["update"], context={"bot": self._bot})
+                await self._dp.feed_update(self._bot, update, **self._deps)
+        except Exception as e:
+            # Not retried: a broken update must not block the rest of the chat
+            logger.error(f"Error processing stream entry {entry_id}: {e}", exc_info=True)
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(done_key, 1, ex=86400)
+            pipe.xack(stream, self._config.group, entry_id)
+            await pipe.execute()
+
+    async def _handle_in_order(self, stream: str, entry_id: str, fields: Dict[str, str]):
+        chat = fields.get("chat", "")
+        entry = self._chat_locks.setdefault(chat, [asyncio.Lock(), 0])
+        entry[1] += 1
+        lock = entry[0]
+        held = False
+
+        def release():
+            nonlocal held
+            if held:
+                held = False
+                lock.release()
+
+        try:
+            await lock.acquire()
+            held = True
+            _release_chat.set(release)
+            try:
+                await self._handle(stream, entry_id, fields)
+            finally:
+                release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat]
+            self._slots.release()
+
+    async def _dispatch(self, stream: str, entry_id: str, fields: Dict[str, str]):
+        """Start handling an entry; blocks only while the worker is at its concurrency limit."""
+        if entry_id in self._in_flight:
+            return
+        await self._slots.acquire()
+        self._in_flight.add(entry_id)
+        task = asyncio.create_task(self._handle_in_order(stream, entry_id, fields))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._in_flight.discard(entry_id))
+
+    async def _reclaim(self, stream: str):
+        """Take over entries another (dead) consumer received but never acknowledged."""
+        start = "0-0"
+        while True:
+            result = await self._redis.xautoclaim(
+                stream, self._config.group, self._consumer,
+                min_idle_time=self._config.claim_idle_ms, start_id=start, count=100
+            )
+            start, entries = result[0], result[1]
+            for entry_id, fields in entries:
+                if fields:
+                    logger.info(f"Reclaimed stream entry {entry_id} from {stream}")
+                    await self._dispatch(stream, entry_id, fields)
+            if start in ("0-0", b"0-0"):
+                return
+
+    async def _consume(self, shard: int):
+        stream = self._stream.stream_name(shard)
+        await self._ensure_group(stream)
+        loop = asyncio.get_running_loop()
+        next_reclaim = 0.0
+
+        while True:
+            if loop.time() >= next_reclaim:
+                await self._reclaim(stream)
+                next_reclaim = loop.time() + self._config.claim_idle_ms / 1000
+
+            response = await self._redis.xreadgroup(
+                self._config.group, self._consumer, {stream: ">"},
+                count=10, block=self._config.block_ms
+            )
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    await self._dispatch(stream, entry_id, fields)
+
+    async def run(self):
+        logger.info(f"Worker {self._consumer} consuming shards {self._shards}")
+        await asyncio.gather(*(self._consume(shard) for shard in self._shards))
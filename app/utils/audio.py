@@ -0,0 +1,146 @@
+import re
+from typing import List, Tuple
+import numpy as np
+
+# Decoded audio format used for splitting: 16 kHz mono signed 16-bit PCM
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+# VAD frame: 30 ms
+FRAME_SECONDS = 0.03
+FRAME_LEN = int(SAMPLE_RATE * FRAME_SECONDS)
+
+
+def pcm_duration(pcm: bytes) -> float:
+    return len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH)
+
+
+def pcm_slice(pcm: bytes, start: float, end: float) -> bytes:
+    """Cut [start, end) seconds out of PCM, aligned to whole samples."""
+    first = int(start * SAMPLE_RATE) * SAMPLE_WIDTH
+    last = int(end * SAMPLE_RATE) * SAMPLE_WIDTH
+    return pcm[first:last]
+
+
+def frame_energy_db(samples: np.ndarray) -> np.ndarray:
+    """RMS energy of every 30 ms frame in dBFS."""
+    count = len(samples) // FRAME_LEN
+    frames = samples[:count * FRAME_LEN].reshape(count, FRAME_LEN).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) + 1e-9
+    return 20 * np.log10(rms / 32768.0)
+
+
+def _fill_short_runs(mask: np.ndarray, value: bool, max_len: int) -> np.ndarray:
+    """Flip runs of `value` shorter than `max_len` frames."""
+    # Sentinels of the opposite value: edges alternate run start / run end
+    padded = np.concatenate(([not value], mask, [not value]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    result = mask.copy()
+    for start, end in zip(edges[0::2], edges[1::2]):
+        if end - start < max_len:
+            result[start:end] = not value
+    return result
+
+
+def detect_speech(samples: np.ndarray, min_silence: float = 0.5, padding: float = 0.2) -> np.ndarray:
+    """
+    Energy-based VAD: per-frame speech mask.
+    The threshold adapts to the recording: 10 dB above the noise floor,
+    but never more than 10 dB below the loudest frame. Speech is padded by
+    `padding` seconds and pauses shorter than `min_silence` are kept.
+    """
+    db = frame_energy_db(samples)
+    if not len(db):
+        return np.zeros(0, dtype=bool)
+    floor, peak = np.percentile(db, 10), db.max()
+    threshold = min(max(floor + 10, -50.0), peak - 10)
+    mask = db > threshold
+
+    pad = int(padding / FRAME_SECONDS)
+    if pad:
+        mask = np.convolve(mask, np.ones(2 * pad + 1), mode="same") > 0
+    return _fill_short_runs(mask, False, int(min_silence / FRAME_SECONDS))
+
+
+def trim_silence(pcm: bytes, keep_pause: float = 0.3) -> Tuple[bytes, List[Tuple[float, float]]]:
+    """
+    Cut silent spans out of 16 kHz mono PCM.
+    Long pauses are shortened to `keep_pause` seconds of silence; returns the
+    trimmed PCM and the (start, end) of those pauses in the trimmed timeline,
+    which are the natural cut points for segmenting.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    mask = detect_speech(samples)
+    if not mask.any():
+        return pcm, []
+
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1]) * FRAME_LEN
+    spans = [(int(start), int(end)) for start, end in zip(edges[0::2], edges[1::2])]
+
+    pause = np.zeros(int(keep_pause * SAMPLE_RATE), dtype=np.int16)
+    pieces, pauses = [], []
+    position = 0
+    for index, (start, end) in enumerate(spans):
+        if index:
+            pieces.append(pause)
+            pauses.append((position / SAMPLE_RATE, (position + len(pause)) / SAMPLE_RATE))
+            position += len(pause)
+        pieces.append(samples[start:end])
+        position += end - start
+    return np.concatenate(pieces).tobytes(), pauses
+
+
+def plan_segments(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    max_len: float,
+    min_len: float,
+    overlap: float,
+) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into segments of at most `max_len` seconds.
+
+    Cuts go to the middle of the latest silence that keeps the segment within
+    bounds. When there is no silence to cut at, the audio is cut hard and the
+    next segment starts `overlap` seconds earlier so no word is lost.
+    """
+    cut_points = [(start + end) / 2 for start, end in silences]
+    segments = []
+    start = 0.0
+    while duration - start > max_len:
+        candidates = [p for p in cut_points if start + min_len <= p <= start + max_len]
+        if candidates:
+            end = candidates[-1]
+            next_start = end
+        else:
+            end = start + max_len
+            next_start = end - overlap
+        segments.append((start, end))
+        start = next_start
+    segments.append((start, duration))
+    return segments
+
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r"\W+", "", w.lower()) for w in text.split()]
+
+
+def stitch_transcripts(parts: List[str], overlapped: List[bool], max_overlap_words: int = 8) -> str:
+    """
+    Join segment transcripts in order.
+    Where two segments overlapped, the words repeated at the start of the
+    next one are dropped (longest matching tail/head run wins).
+    """
+    result: List[str] = []
+    for text, has_overlap in zip(parts, overlapped):
+        words = text.split()
+        if has_overlap and result:
+            tail = _words(" ".join(result[-max_overlap_words:]))
+            head = _words(" ".join(words[:max_overlap_words]))
+            for k in range(min(len(tail), len(head)), 0, -1):
+                if tail[-k:] == head[:k]:
+                    words = words[k:]
+                    break
+        result.extend(words)
+    return " ".join(result)
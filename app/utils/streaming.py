@@ -0,0 +1,124 @@
+import time
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from app.middlewares.outbound import previews
+from app.services.coalesce import commit_reply
+from app.utils.text import format_text_html, split_html, html_to_text, IncrementalHTMLRenderer
+
+logger = logging.getLogger(__name__)
+
+# Keep progressive previews well below the limit: escaping and tags add length
+PREVIEW_LIMIT = 3500
+
+
+async def stream_reply(
+    bot: Bot,
+    chat_id: int,
+    chunks: AsyncIterator[str],
+    render: Optional[Callable[[str], str]] = None,
+    render_final: Callable[[str], str] = format_text_html,
+    prefix: str = "",
+    edit_interval: float = 1.0,
+) -> str:
+    """
+    Send a reply as soon as the first tokens arrive and keep editing it
+    while the rest of the stream comes in.
+
+    Edits are throttled to one per `edit_interval` seconds (Telegram allows
+    roughly one message update per second in a chat) and go out as previews:
+    the send queue may replace or drop them. Returns the full raw
+    text so the caller can persist it. If the task is cancelled mid-stream,
+    the partial message is deleted; once the stream is complete the reply is
+    committed and a newer message no longer cancels it.
+    """
+    if render is None:
+        render = IncrementalHTMLRenderer().render
+
+    text = ""
+    sent: Optional[Message] = None
+    last_shown = ""
+    next_edit_at = 0.0
+    started_at = time.monotonic()
+
+    try:
+        async for delta in chunks:
+            text += delta
+            if not text.strip():
+                continue
+
+            now = time.monotonic()
+            if sent is not None and now < next_edit_at:
+                continue
+
+            preview = prefix + render(text[:PREVIEW_LIMIT])
+            if preview == last_shown:
+                continue
+
+            try:
+                # Previews yield to final replies in the send queue
+                with previews():
+                    if sent is None:
+                        sent = await bot.send_message(chat_id, preview, parse_mode="HTML")
+                        logger.info(f"First visible token in chat {chat_id} after {now - started_at:.2f}s")
+                    else:
+                        await bot.edit_message_text(preview, chat_id=chat_id, message_id=sent.message_id, parse_mode="HTML")
+                last_shown = preview
+                next_edit_at = time.monotonic() + edit_interval
+            except TelegramRetryAfter as e:
+                next_edit_at = time.monotonic() + e.retry_after
+            except TelegramBadRequest as e:
+                # Broken preview markup is not fatal: the final edit fixes it
+                logger.debug(f"Skipping streaming edit: {e}")
+                next_edit_at = time.monotonic() + edit_interval
+    except asyncio.CancelledError:
+        # Superseded reply: don't leave a half-written message behind
+        if sent is not None:
+            try:
+                await bot.delete_message(chat_id, sent.message_id)
+            except Exception as e:
+                logger.debug(f"Could not delete cancelled reply: {e}")
+        raise
+
+    commit_reply()
+    await _finalize(bot, chat_id, sent, text, prefix + render_final(text), last_shown)
+    return text
+
+
+async def _finalize(bot: Bot, chat_id: int, sent: Optional[Message], text: str, final_html: str, last_shown: str):
+    """Replace the preview with the fully formatted reply."""
+    if not text.strip() or final_html == last_shown:
+        return
+
+    # Long replies go out as several messages, each with balanced tags
+    await send_html(bot, chat_id, split_html(final_html), edit_message_id=sent.message_id if sent is not None else None)
+
+
+async def send_html(bot: Bot, chat_id: int, parts: List[str], edit_message_id: Optional[int] = None):
+    """
+    Send split HTML parts in order; the first one replaces message
+    `edit_message_id` if given. A part Telegram rejects goes out as plain
+    text in its place, so nothing is sent twice and every part stays
+    within the limit.
+    """
+    for index, part in enumerate(parts):
+        message_id = edit_message_id if index == 0 else None
+        try:
+            await _send_part(bot, chat_id, part, message_id, "HTML")
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                continue
+            logger.warning(f"HTML part {index + 1}/{len(parts)} rejected, sending plain text: {e}")
+            await _send_part(bot, chat_id, html_to_text(part), message_id, None)
+
+
+async def _send_part(bot: Bot, chat_id: int, text: str, message_id: Optional[int], parse_mode: Optional[str]):
+    if message_id is None:
+        await bot.send_message(chat_id, text, parse_mode=parse_mode)
+    else:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, parse_mode=parse_mode)
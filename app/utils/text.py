@@ -1,44 +1,299 @@
 import re
 import html
 
+# Telegram rejects messages longer than this
+MESSAGE_LIMIT = 4096
+
+# One pass over the reply: fenced code, headings, inline code, links, emphasis
+# markers, line breaks; the rest is plain text. The lookahead lets the scan
+# skip plain text without trying every alternative at each character.
+_MARKDOWN = re.compile(
+    r"(?=[`\[*_\n#])(?:"
+    r"(?P<fence>```(?P<lang>[\w+#.-]*)[^\S\n]*\n?(?P<code>(?:[^`]+|`(?!``))*)(?:```|\Z))"
+    r"|(?P<heading>^#{1,6}[^\S\n]+(?P<title>[^\n]*))"
+    r"|(?P<inline>`(?P<inline_code>[^`\n]+)`)"
+    r"|(?P<link>\[(?P<label>[^\]\n]+)\]\((?P<url>[^)\s]+)\))"
+    r"|(?P<marker>\*\*\*|\*\*|__|\*|_)"
+    r"|(?P<newline>\n))",
+    re.MULTILINE
+)
+_BOLD_TAGS = re.compile(r"</?b>")
+_LINK_SCHEMES = ("http://", "https://", "tg://", "mailto:")
+_OPEN_TAGS = {"***": "<b><i>", "**": "<b>", "__": "<b>", "*": "<i>", "_": "<i>"}
+_CLOSE_TAGS = {"***": "</i></b>", "**": "</b>", "__": "</b>", "*": "</i>", "_": "</i>"}
+
+
+def _escape(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def _marker_roles(text: str, start: int, end: int, marker: str):
+    """(can open, can close) by the usual flanking rules; _ never works inside a word."""
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    can_open = not after.isspace()
+    can_close = not before.isspace()
+    if marker[0] == "_":
+        can_open = can_open and not before.isalnum()
+        can_close = can_close and not after.isalnum()
+    return can_open, can_close
+
+
+def _render_line(pieces: list, markers: list) -> str:
+    """
+    Render one line: `pieces` are HTML strings with a None slot for every
+    marker, `markers` are (slot, marker, can open, can close). Markers are
+    paired on a stack: a closing marker pairs with the nearest open one of
+    its kind and any markers opened after it stay plain text, so tags can
+    never overlap or stay open.
+    """
+    opened = []  # indexes into markers
+    for index, (_, marker, can_open, can_close) in enumerate(markers):
+        match = None
+        if can_close:
+            for depth in range(len(opened) - 1, -1, -1):
+                if markers[opened[depth]][1] == marker:
+                    match = depth
+                    break
+        if match is not None:
+            slot = markers[opened[match]][0]
+            pieces[slot] = _OPEN_TAGS[marker]
+            pieces[markers[index][0]] = _CLOSE_TAGS[marker]
+            del opened[match:]
+        elif can_open:
+            opened.append(index)
+
+    for slot, marker, _, _ in markers:
+        if pieces[slot] is None:
+            pieces[slot] = marker  # "*" and "_" need no escaping
+    return "".join(pieces)
+
+
 def format_text_html(text: str) -> str:
     """
-    Format text for Telegram HTML parse mode.
-    Correct Logic:
-    1. Escape ENTIRE text first (so User's <script> becomes &lt;script&gt;).
-    2. THEN restore/convert Markdown patterns to validated HTML tags.
+    Render an LLM's markdown reply as Telegram HTML in one pass.
+
+    Everything is escaped; code blocks and inline code are emitted verbatim
+    (no markdown inside), headings become bold lines, links are kept only
+    for safe schemes, and emphasis markers turn into tags only when they
+    pair up on the same line. The output is always balanced.
     """
     if not text:
         return ""
-        
-    # 1. Escape everything first
-    text = html.escape(text, quote=False)
-    
-    # 2. Bold: **text** or __text__ -> <b>text</b>
-    # Note: re.sub will operate on the escaped string.
-    # Markdown usually doesn't care about &lt; inside logic unless strictly defined.
-    # We match **...**
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
-    
-    # 3. Italic: *text* or _text_ -> <i>text</i>
-    # Avoid matching inside words if possible, but basic * logic:
-    text = re.sub(r'(?<!\w)\*([^\s][^*]*[^\s])\*(?!\w)', r'<i>\1</i>', text)
-    text = re.sub(r'(?<!\w)_([^\s][^_]*[^\s])_(?!\w)', r'<i>\1</i>', text)
-    
-    # 4. Monospace: `text` -> <code>text</code>
-    text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
-    
-    # 5. Preformatted: ```code``` -> <pre>code</pre>
-    text = re.sub(r'```(.+?)```', r'<pre>\1</pre>', text, flags=re.DOTALL)
-    
-    # 6. Links: [text](url) -> <a href="url">text</a>
-    # Note: URL might be escaped! e.g. foo&amp;bar
-    # We should match parentheses carefully.
-    text = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', text)
-    
-    # 7. Headers: ### Header -> <b>Header</b>
-    # Header usually implies new line.
-    text = re.sub(r'^#{1,6}\s+(.*)$', r'<b>\1</b>', text, flags=re.MULTILINE)
-    
+
+    out = []
+    line: list = []  # HTML of the current line, None where a marker goes
+    markers: list = []  # markers of the current line, see _render_line
+    position = 0
+
+    def flush_line():
+        if markers:
+            out.append(_render_line(line, markers))
+            markers.clear()
+        else:
+            out.extend(line)
+        line.clear()
+
+    for match in _MARKDOWN.finditer(text):
+        start = match.start()
+        if start > position:
+            line.append(_escape(text[position:start]))
+        position = match.end()
+        kind = match.lastgroup
+
+        if kind == "newline":
+            flush_line()
+            out.append("\n")
+        elif kind == "marker":
+            marker = match.group(0)
+            markers.append((len(line), marker, *_marker_roles(text, start, position, marker)))
+            line.append(None)
+        elif kind == "inline":
+            line.append(f"<code>{_escape(match.group('inline_code'))}</code>")
+        elif kind == "link":
+            url = match.group("url")
+            if url.startswith(_LINK_SCHEMES):
+                line.append(f'<a href="{html.escape(url, quote=True)}">{_escape(match.group("label"))}</a>')
+            else:
+                line.append(_escape(match.group(0)))
+        elif kind == "heading":
+            title = match.group("title").strip()
+            if title.startswith("**") and title.endswith("**") and len(title) > 4:
+                title = title[2:-2]
+            # Already bold: drop bold inside the title rather than nest it
+            line.append("<b>" + _BOLD_TAGS.sub("", format_text_html(title)) + "</b>")
+        else:
+            flush_line()
+            code = _escape(match.group("code").rstrip("\n"))
+            lang = match.group("lang")
+            out.append(f'<pre><code class="language-{lang}">{code}</code></pre>' if lang else f"<pre>{code}</pre>")
+
+    if position < len(text):
+        line.append(_escape(text[position:]))
+    flush_line()
+    return "".join(out)
+
+
+_HTML_PIECES = re.compile(r"<[^>]*>|&#?\w+;|\n|[^<&\n]+|[<&]")
+_TAG_NAME = re.compile(r"</?([a-zA-Z-]+)")
+
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Split Telegram HTML into messages of at most `limit` characters.
+
+    Never cuts inside a tag or an entity; tags open at a cut are closed at
+    the end of one part and reopened at the start of the next. Prefers to
+    cut at a line break in the second half of a part, then at a space.
+    Tags too long to be reopened in every part (a link with a huge URL)
+    are dropped and their text is kept, so every part makes progress.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    parts = []
+    stack = []  # (name, opening tag or None if dropped)
+    current = []
+    size = 0
+    break_point = None  # (index in current, size there, stack there) right after a line break
+
+    def closers(tags) -> str:
+        return "".join(f"</{name}>" for name, opening in reversed(tags) if opening)
+
+    def emit() -> bool:
+        """Close the part; True if text after its line break is left over."""
+        nonlocal current, size, break_point
+        if break_point is not None and break_point[1] >= limit // 2:
+            index, _, tags = break_point
+            head, tail = current[:index], current[index:]
+        else:
+            head, tail, tags = current, [], list(stack)
+        part = "".join(head) + closers(tags)
+        if re.sub(r"<[^>]*>", "", part).strip():
+            parts.append(part)
+        current = [opening for _, opening in tags if opening] + tail
+        size = sum(len(piece) for piece in current)
+        break_point = None
+        return bool(tail)
+
+    for piece in _HTML_PIECES.findall(text):
+        if piece.startswith("</"):
+            if stack and stack[-1][1] is None:
+                stack.pop()
+                continue
+        closer = 0  # an opening tag also needs room for its closing tag
+        if not piece.startswith("</") and piece.startswith("<") and len(piece) > 1:
+            name = _TAG_NAME.match(piece).group(1)
+            closer = len(name) + 3
+            overhead = sum(len(opening) for _, opening in stack if opening) + len(closers(stack))
+            if overhead + len(piece) + closer > limit // 2:
+                stack.append((name, None))
+                continue
+
+        while piece:
+            room = limit - size - len(closers(stack))
+            if len(piece) + closer <= room:
+                current.append(piece)
+                size += len(piece)
+                if piece.startswith("</"):
+                    if stack:
+                        stack.pop()
+                elif piece.startswith("<") and len(piece) > 1:
+                    stack.append((_TAG_NAME.match(piece).group(1), piece))
+                elif piece == "\n":
+                    break_point = (len(current), size, list(stack))
+                break
+
+            if piece[0] not in "<&\n" and room > 0:
+                # Long plain text: take what fits, ending at a space if there is one
+                cut = piece.rfind(" ", 0, room)
+                cut = cut + 1 if cut > room // 2 else room
+                current.append(piece[:cut])
+                size += cut
+                piece = piece[cut:]
+            emit()
+
+    # A part cut at a line break leaves the rest of the buffer for the next one
+    while emit():
+        pass
+    return parts
+
+
+def html_to_text(markup: str) -> str:
+    """Plain text of Telegram HTML, for sending with parse_mode=None."""
+    return html.unescape(re.sub(r"<[^>]*>", "", markup))
+
+
+def close_open_markdown(text: str) -> str:
+    """
+    Close markdown constructs left open by a partial (still streaming) reply,
+    so that format_text_html never produces half-open markup.
+    """
+    if text.count("```") % 2:
+        return text + "\n```"
+
+    # Inline markers are only meaningful outside code fences
+    outside = re.sub(r'```.*?```', '', text, flags=re.DOTALL)
+    if outside.count("`") % 2:
+        text += "`"
+    if outside.count("**") % 2:
+        text += "**"
+    if outside.count("__") % 2:
+        text += "__"
+    # Unfinished link: [text](ur... -> drop it until it is complete
+    text = re.sub(r'\[[^\]\n]*(\]\([^)\n]*)?$', '', text)
     return text
+
+
+class IncrementalHTMLRenderer:
+    """
+    Render a growing markdown reply to Telegram HTML.
+
+    Completed paragraphs (separated by a blank line outside code fences) are
+    rendered once and cached; only the unfinished tail is re-rendered on
+    every call.
+    """
+
+    def __init__(self):
+        self._stable_len = 0
+        self._stable_html = ""
+
+    def _stable_boundary(self, text: str) -> int:
+        boundary = self._stable_len
+        pos = text.find("\n\n", self._stable_len)
+        while pos != -1:
+            if text.count("```", 0, pos) % 2 == 0:
+                boundary = pos + 2
+            pos = text.find("\n\n", pos + 2)
+        return boundary
+
+    def render(self, text: str) -> str:
+        boundary = self._stable_boundary(text)
+        if boundary > self._stable_len:
+            self._stable_html += format_text_html(text[self._stable_len:boundary])
+            self._stable_len = boundary
+
+        return self._stable_html + format_text_html(close_open_markdown(text[self._stable_len:]))
+
+
+# Longest endings first; only used for matching/normalization, never for display
+_RU_ENDINGS = (
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие", "ов", "ев",
+    "ах", "ях", "ам", "ям", "ом", "ем", "ую", "юю",
+    "а", "я", "о", "е", "у", "ю", "ы", "и", "ь", "й",
+)
+_EN_ENDINGS = ("ing", "ed", "es", "s")
+
+
+def stem_token(token: str) -> str:
+    """
+    Very light RU/EN stemmer: strips one common inflection ending
+    ("минске" -> "минск", "prices" -> "price") keeping a stem of 3+ chars.
+    """
+    token = token.lower().replace("ё", "е")
+    endings = _EN_ENDINGS if token.isascii() else _RU_ENDINGS
+    for ending in endings:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
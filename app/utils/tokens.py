@@ -0,0 +1,46 @@
+"""
+Local token estimate for prompt budgeting.
+
+No tokenizer round trip and no model-specific vocabulary: BPE tokenizers
+spend about one token per 4 Latin letters and per 3 Cyrillic letters, one
+per short number and one per punctuation mark. Close enough to budget a
+prompt, and cheap enough to run on every stored message.
+"""
+import re
+from typing import Dict
+
+# Latin word | other letters (Cyrillic...) | up to 3 digits | punctuation/symbol
+_PIECES = re.compile(r"([A-Za-z]+)|([^\W\d_A-Za-z]+)|(\d{1,3})|([^\w\s]|_)")
+
+# Role, separators and framing the API adds around every message
+MESSAGE_OVERHEAD = 4
+
+
+def _piece_tokens(match: re.Match) -> int:
+    if match.group(1):
+        return -(-len(match.group(1)) // 4)
+    if match.group(2):
+        return -(-len(match.group(2)) // 3)
+    return 1
+
+
+def count_tokens(text: str) -> int:
+    return sum(_piece_tokens(match) for match in _PIECES.finditer(text))
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """Tokens of a chat message; uses the count cached in the message when present."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message.get("content", ""))
+    return tokens + MESSAGE_OVERHEAD
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text` that fits into `max_tokens`."""
+    used = 0
+    for match in _PIECES.finditer(text):
+        used += _piece_tokens(match)
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + "…"
+    return text
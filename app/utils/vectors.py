@@ -0,0 +1,124 @@
+"""
+Local text embeddings and an in-memory vector index.
+
+Embeddings are hashed features: word stems plus character trigrams of every
+word, hashed into `dim` buckets with a hash-derived sign and L2-normalized.
+No model and no API call, so they capture lexical similarity (shared words
+and word forms) rather than meaning, which is what recalling notes and past
+turns by a few keywords needs.
+"""
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+from app.utils.text import stem_token
+
+DEFAULT_DIM = 256
+
+_WORDS = re.compile(r"\w+")
+STEM_WEIGHT = 2.0
+TRIGRAM_WEIGHT = 1.0
+
+
+def _features(text: str) -> List[Tuple[str, float]]:
+    features = []
+    for word in _WORDS.findall(text.lower()):
+        features.append((stem_token(word), STEM_WEIGHT))
+        padded = f"<{word}>"
+        features.extend((padded[i:i + 3], TRIGRAM_WEIGHT) for i in range(len(padded) - 2))
+    return features
+
+
+def embed_texts(texts: Sequence[str], dim: int = DEFAULT_DIM) -> np.ndarray:
+    """(len(texts), dim) float32 matrix of unit vectors (zero rows for texts without words)."""
+    rows, cols, values = [], [], []
+    for row, text in enumerate(texts):
+        for feature, weight in _features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            rows.append(row)
+            cols.append(h % dim)
+            values.append(weight if h & 0x80000000 else -weight)
+
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    np.add.at(matrix, (rows, cols), values)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def embed_text(text: str, dim: int = DEFAULT_DIM) -> np.ndarray:
+    return embed_texts([text], dim)[0]
+
+
+class VectorIndex:
+    """
+    Unit vectors in one contiguous float32 array that grows by doubling.
+
+    Inserts are amortized O(1), removal swaps the last row into the hole, and
+    a query is one matrix-vector product plus argpartition for the top k.
+    """
+
+    def __init__(self, dim: int = DEFAULT_DIM, capacity: int = 64):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the vector array (including spare capacity)."""
+        return self._vectors.nbytes
+
+    def _reserve(self, count: int):
+        capacity = len(self._vectors)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._ids)] = self._vectors[:len(self._ids)]
+        self._vectors = vectors
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray):
+        """Insert rows (an existing id is overwritten in place)."""
+        self._reserve(len(self._ids) + len(ids))
+        for item_id, vector in zip(ids, vectors):
+            row = self._rows.get(item_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(item_id)
+                self._rows[item_id] = row
+            self._vectors[row] = vector
+
+    def remove(self, item_id: str) -> bool:
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return False
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._vectors[row] = self._vectors[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+        return True
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """Top-k ids by cosine similarity, best first."""
+        count = len(self._ids)
+        if not count or k <= 0:
+            return []
+        scores = self._vectors[:count] @ query
+        if count > k:
+            top = np.argpartition(scores, count - k)[count - k:]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(self._ids[row], float(scores[row])) for row in top]
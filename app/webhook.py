@@ -0,0 +1,100 @@
+import hmac
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from aiohttp import web
+from aiogram import Bot
+from aiogram.types import Update
+
+from config import WebhookConfig
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Receives Telegram updates over HTTP.
+
+    Every request is acknowledged as soon as the update is queued; a pool of
+    workers feeds the queue to `process`. When the bounded queue is full the
+    server answers 503 and Telegram redelivers the update later.
+    """
+
+    def __init__(self, bot: Bot, process: Callable[[Update], Awaitable], config: WebhookConfig):
+        self._bot = bot
+        self._process = process
+        self._config = config
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=config.queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._config.path, self._handle)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        secret = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(secret, self._config.secret):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self._bot})
+        except Exception as e:
+            logger.warning(f"Rejected malformed update: {e}")
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning("Update queue is full, asking Telegram to retry")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._process(update)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def start(self, allowed_updates: Optional[List[str]] = None):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._config.workers)]
+
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._config.host, self._config.port).start()
+        logger.info(f"Webhook server listening on {self._config.host}:{self._config.port}{self._config.path}")
+
+        if self._config.url:
+            await self._bot.set_webhook(
+                url=self._config.url.rstrip("/") + self._config.path,
+                secret_token=self._config.secret,
+                allowed_updates=allowed_updates
+            )
+        else:
+            logger.warning("WEBHOOK_URL is empty: setWebhook skipped, only locally posted updates arrive")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+        # Let queued updates finish before shutting the workers down
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=30)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} queued updates on shutdown")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def serve_forever(self, allowed_updates: Optional[List[str]] = None):
+        await self.start(allowed_updates)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
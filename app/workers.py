@@ -0,0 +1,77 @@
+"""
+Update workers: consume updates that the receiver (bot.py with
+BOT_PROCESSING=stream) appended to Redis Streams, and the slow jobs
+(/think, voice, vision) handlers put on the job queue.
+
+    python -m app.workers --workers 4
+"""
+import asyncio
+import logging
+import argparse
+import multiprocessing
+
+from app.runtime import create_bot, create_dispatcher, create_services, create_job_worker, close_services
+from app.update_stream import UpdateWorker
+from app.metrics import MetricsServer
+from config import load_config
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(index: int, total: int):
+    config = load_config()
+    deps = create_services(config)
+    bot = create_bot(config, deps["outbound"])
+    dp = create_dispatcher(config)
+    worker = UpdateWorker(deps["memory_service"]._redis, config.stream, dp, bot, deps, index, total)
+    runners = [worker.run()]
+    if config.jobs.enabled:
+        runners.append(create_job_worker(bot, deps).run())
+    # Each process has its own registry: next port after the receiver's
+    metrics_server = None
+    if config.metrics.enabled:
+        metrics_server = MetricsServer(config.metrics, port_offset=index + 1)
+        await metrics_server.start()
+    try:
+        await asyncio.gather(*runners)
+    finally:
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await bot.session.close()
+        await close_services(deps)
+
+
+def _worker_process(index: int, total: int):
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run_worker(index, total))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run update worker processes")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--index", type=int, help="run only this worker (e.g. one per container)")
+    args = parser.parse_args()
+
+    if args.index is not None:
+        _worker_process(args.index, args.workers)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(index, args.workers), name=f"worker-{index}")
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Cost and correctness of the Markdown -> Telegram HTML formatter on LLM replies.
+
+    python benchmarks/html_formatter.py [--corpus benchmarks/llm_replies.jsonl] [--repeat 200] [--errors]
+
+"legacy" is the escape-then-eight-re.sub formatter used before; "single-pass"
+is app.utils.text.format_text_html. A reply counts as broken when its HTML
+has unbalanced or crossed tags (Telegram rejects those, and the reply falls
+back to plain text) or a link to a non-web scheme. split_html is checked on
+the long replies: every part within the limit and balanced on its own.
+"""
+import os
+import re
+import sys
+import html
+import json
+import time
+import argparse
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.text import format_text_html, split_html, MESSAGE_LIMIT  # noqa: E402
+
+
+def legacy_format_text_html(text: str) -> str:
+    text = html.escape(text, quote=False)
+    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
+    text = re.sub(r'(?<!\w)\*([^\s][^*]*[^\s])\*(?!\w)', r'<i>\1</i>', text)
+    text = re.sub(r'(?<!\w)_([^\s][^_]*[^\s])_(?!\w)', r'<i>\1</i>', text)
+    text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
+    text = re.sub(r'```(.+?)```', r'<pre>\1</pre>', text, flags=re.DOTALL)
+    text = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', text)
+    text = re.sub(r'^#{1,6}\s+(.*)$', r'<b>\1</b>', text, flags=re.MULTILINE)
+    return text
+
+
+class _TagChecker(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[str] = []
+        self.problem: Optional[str] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href") or ""
+            if not re.match(r"(https?|tg|mailto):", href):
+                self._fail(f"unsafe link {href!r}")
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack[-1] != tag:
+            self._fail(f"unexpected </{tag}>")
+        else:
+            self.stack.pop()
+
+    def _fail(self, problem: str):
+        if self.problem is None:
+            self.problem = problem
+
+
+def html_problem(markup: str) -> Optional[str]:
+    """None for well-formed Telegram HTML, otherwise what is wrong with it."""
+    checker = _TagChecker()
+    checker.feed(markup)
+    checker.close()
+    if checker.problem is None and checker.stack:
+        checker.problem = f"unclosed <{checker.stack[-1]}>"
+    return checker.problem
+
+
+def evaluate(render: Callable[[str], str], corpus: List[str], repeat: int) -> Dict:
+    broken = []
+    for text in corpus:
+        problem = html_problem(render(text))
+        if problem:
+            broken.append((problem, text))
+
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            render(text)
+    per_reply = (time.perf_counter() - started_at) / (repeat * len(corpus))
+    return {"broken": broken, "us_per_reply": per_reply * 1e6}
+
+
+def check_split(corpus: List[str]) -> Dict:
+    long_replies = parts = bad_parts = 0
+    for text in corpus:
+        markup = format_text_html(text)
+        if len(markup) <= MESSAGE_LIMIT:
+            continue
+        long_replies += 1
+        for part in split_html(markup):
+            parts += 1
+            if len(part) > MESSAGE_LIMIT or html_problem(part):
+                bad_parts += 1
+    return {"long_replies": long_replies, "parts": parts, "bad_parts": bad_parts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(__file__), "llm_replies.jsonl"))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--errors", action="store_true", help="print the replies each formatter breaks")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [json.loads(line)["text"] for line in f if line.strip()]
+
+    print(f"{len(corpus)} replies, {sum(map(len, corpus))} chars\n")
+    print(f"{'formatter':<12} {'broken':>8} {'us/reply':>10}")
+    for name, render in (("legacy", legacy_format_text_html), ("single-pass", format_text_html)):
+        result = evaluate(render, corpus, args.repeat)
+        print(f"{name:<12} {len(result['broken']):>8} {result['us_per_reply']:>10.1f}")
+        if args.errors:
+            for problem, text in result["broken"]:
+                print(f"    {problem}: {text[:70]!r}")
+
+    split = check_split(corpus)
+    print(
+        f"\nsplit_html: {split['long_replies']} replies over {MESSAGE_LIMIT} chars -> "
+        f"{split['parts']} parts, {split['bad_parts']} oversized or unbalanced"
+    )
+
+
+if __name__ == "__main__":
+    main()
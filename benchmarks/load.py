@@ -0,0 +1,417 @@
+"""
+End-to-end load test: synthetic Telegram updates (text, voice, photos,
+albums, commands) go through the real Dispatcher via feed_update, with all
+services wired as in production, against local stand-ins for OpenRouter,
+Groq, Tavily and the Bot API (benchmarks/mock_servers.py) and Redis.
+
+    python benchmarks/load.py --fake --users 20 --turns 10
+    python benchmarks/load.py --redis-url redis://localhost:6379/15 --users 100 --duration 60 --llm-first-token-ms 800
+    python benchmarks/load.py --fake --compare benchmarks/results/load-20261016-120000.json
+
+Every virtual user is its own private chat and sends one update (or album)
+at a time, waiting for the handler to finish plus `--think-ms` before the
+next one. Slow jobs run inline (JOBS_ENABLED=0), so a handler's latency is
+the whole turn: debounce window, search, model stream, Telegram edits.
+Reported: throughput, p50/p95/p99 per handler and per turn stage, mean time
+per service/upstream call (from app.metrics), Bot API calls by method. The
+run is saved as JSON (--output, default benchmarks/results/) for comparing.
+
+Without --fake it needs an explicit --redis-url (never the bot's REDIS_URL
+from .env; use a spare database). Benchmark users get ids from 990000000
+upward and their keys (exactly *:<id> and *:<id>:*) are deleted afterwards.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+
+from mock_servers import MockServers, MockLatency  # noqa: E402
+
+USER_BASE = 990_000_000
+TEXTS = [
+    "Привет! Как дела?",
+    "Какая погода в Минске сегодня?",
+    "Придумай план на выходные, чтобы отдохнуть",
+    "Какой сейчас курс доллара?",
+    "Объясни, как работает кэширование в Redis",
+    "Напиши короткое стихотворение про осень",
+    "Что приготовить на ужин из курицы и риса?",
+    "Кто такой Никола Тесла?",
+]
+COMMANDS = [
+    "/start",
+    "/help",
+    "/note Купить молоко, хлеб и кофе",
+    "/notes",
+    "/findnote молоко",
+    "/translate Hello, how are you doing today?",
+    "/think Почему небо синее?",
+]
+STATS_FAMILIES = (
+    "vera_call_seconds", "vera_llm_seconds", "vera_llm_first_token_seconds",
+    "vera_telegram_request_seconds", "vera_outbound_latency_seconds",
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))]
+
+
+def summarize(samples: List[float], errors: int = 0) -> Dict:
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {"text", "voice", "photo", "album", "command"}
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s) in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self._bot = bot
+        self._update_id = 0
+        self._message_id = 0
+
+    def _update(self, user_id: int, **content) -> Update:
+        self._update_id += 1
+        self._message_id += 1
+        data = {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "language_code": "ru"},
+                **content,
+            },
+        }
+        return Update.model_validate(data, context={"bot": self._bot})
+
+    def text(self, user_id: int, text: str) -> Update:
+        return self._update(user_id, text=text)
+
+    def voice(self, user_id: int) -> Update:
+        # Unique file ids: forwarded (cached) voice notes would skip the transcription
+        file_id = f"voice_{self._update_id + 1}"
+        return self._update(user_id, voice={
+            "file_id": file_id, "file_unique_id": file_id, "duration": 8, "mime_type": "audio/ogg", "file_size": 24000
+        })
+
+    def photo(self, user_id: int, caption: str = "", media_group_id: Optional[str] = None) -> Update:
+        file_id = f"photo_{self._update_id + 1}"
+        sizes = [
+            {"file_id": f"{file_id}_{w}", "file_unique_id": f"{file_id}_{w}", "width": w, "height": h, "file_size": w * h // 10}
+            for w, h in ((320, 240), (800, 600), (1280, 960))
+        ]
+        content = {"photo": sizes}
+        if caption:
+            content["caption"] = caption
+        if media_group_id:
+            content["media_group_id"] = media_group_id
+        return self._update(user_id, **content)
+
+
+class LoadRun:
+    def __init__(self, args, dp, bot, deps):
+        self._args = args
+        self._dp = dp
+        self._bot = bot
+        self._deps = deps
+        self._random = random.Random(args.seed)
+        self._updates = UpdateFactory(bot)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.updates_fed = 0
+
+    async def _feed(self, update: Update):
+        self.updates_fed += 1
+        await self._dp.feed_update(self._bot, update, **self._deps)
+
+    async def _scenario(self, user_id: int, kind: str):
+        if kind == "text":
+            await self._feed(self._updates.text(user_id, self._random.choice(TEXTS)))
+        elif kind == "command":
+            await self._feed(self._updates.text(user_id, self._random.choice(COMMANDS)))
+        elif kind == "voice":
+            await self._feed(self._updates.voice(user_id))
+        elif kind == "photo":
+            await self._feed(self._updates.photo(user_id, caption=self._random.choice(["", "Что на фото?"])))
+        elif kind == "album":
+            group = f"album_{user_id}_{self._updates._update_id}"
+            photos = [self._updates.photo(user_id, "Сравни эти фото" if i == 0 else "", group) for i in range(3)]
+            # Telegram delivers an album as separate updates a few ms apart
+            await asyncio.gather(*(self._feed(update) for update in photos))
+
+    async def user(self, user_id: int, mix: Dict[str, float], deadline: Optional[float]):
+        kinds, weights = list(mix), list(mix.values())
+        for _ in range(self._args.turns):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            kind = self._random.choices(kinds, weights)[0]
+            started_at = time.perf_counter()
+            try:
+                await self._scenario(user_id, kind)
+            except Exception as e:
+                self.errors[kind] += 1
+                logging.getLogger(__name__).warning(f"{kind} scenario of user {user_id} failed: {e!r}")
+                continue
+            self.latencies[kind].append(time.perf_counter() - started_at)
+            await asyncio.sleep(self._random.uniform(0.5, 1.5) * self._args.think_ms / 1000)
+
+
+async def delete_user_keys(client, user_ids: List[int]):
+    """Keys of exactly these users: <name>:<id> and <name>:<id>:..., never ids that merely contain them."""
+    for user_id in user_ids:
+        keys = set()
+        for pattern in (f"*:{user_id}", f"*:{user_id}:*"):
+            keys.update([key async for key in client.scan_iter(match=pattern, count=1000)])
+        if keys:
+            await client.delete(*keys)
+
+
+def registry_means() -> Dict[str, Dict]:
+    """count/mean of every labelled series of the histograms in STATS_FAMILIES."""
+    totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(dict)
+    for family in REGISTRY.collect():
+        if family.name not in STATS_FAMILIES:
+            continue
+        for sample in family.samples:
+            if sample.name.endswith(("_count", "_sum")):
+                labels = ",".join(f"{k}={v}" for k, v in sorted(sample.labels.items()))
+                totals[(family.name, labels)][sample.name.rsplit("_", 1)[1]] = sample.value
+    return {
+        f"{name}{{{labels}}}": {"count": int(values["count"]), "mean": values["sum"] / values["count"]}
+        for (name, labels), values in sorted(totals.items())
+        if values.get("count")
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_table(title: str, rows: Dict[str, Dict]):
+    print(f"\n{title:<28} {'n':>6} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, row in rows.items():
+        print(
+            f"{name:<28} {row['count']:>6} {row['errors']:>5} "
+            f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['p99']:>8.3f} {row['max']:>8.3f}"
+        )
+
+
+def print_comparison(result: Dict, baseline: Dict):
+    print(f"\nvs {baseline.get('started_at', '?')} ({baseline.get('git_commit') or 'no commit'}):")
+    old, new = baseline["totals"]["throughput"], result["totals"]["throughput"]
+    print(f"  throughput {old:.2f} -> {new:.2f} scenarios/s ({(new - old) / old * 100 if old else 0:+.1f}%)")
+    for section in ("handlers", "stages"):
+        for name, row in result[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            deltas = " ".join(
+                f"{q} {before[q]:.3f}->{row[q]:.3f}" for q in ("p50", "p95", "p99")
+            )
+            print(f"  {name:<26} {deltas}")
+
+
+async def run(args) -> Dict:
+    latency = MockLatency(
+        llm_first_token=args.llm_first_token_ms / 1000,
+        llm_token_interval=args.llm_token_ms / 1000,
+        llm_tokens=args.llm_tokens,
+        transcription=args.transcription_ms / 1000,
+        tavily=args.tavily_ms / 1000,
+        telegram=args.telegram_ms / 1000,
+    )
+    mocks = MockServers(latency, seed=args.seed)
+    base_url = await mocks.start()
+
+    user_ids = [USER_BASE + i for i in range(args.users)]
+    os.environ.update(
+        BOT_TOKEN="123456:benchmark",
+        OPENROUTER_API_KEY="benchmark",
+        GROQ_API_KEY="benchmark",
+        TAVILY_API_KEY="benchmark",
+        TAVILY_BASE_URL=f"{base_url}/tavily",
+        ADMIN_IDS=",".join(map(str, user_ids)),
+        JOBS_ENABLED="0",
+        METRICS_ENABLED="0",
+        COALESCE_WINDOW_MS=str(args.coalesce_ms),
+    )
+    if not args.fake:
+        os.environ["REDIS_URL"] = args.redis_url
+    os.environ.setdefault("LLM_STREAM", "1")
+
+    if args.fake:
+        import fakeredis
+        import redis.asyncio
+        redis.asyncio.from_url = lambda url, **kwargs: fakeredis.FakeAsyncRedis(**kwargs)
+
+    # Imported after the environment is set up
+    from config import load_config
+    from app.runtime import create_bot, create_dispatcher, create_services, close_services
+    import app.services.turns as turns
+
+    config = load_config()
+    config.llm.base_url = f"{base_url}/openai/v1"
+    config.voice.base_url = f"{base_url}/openai/v1"
+    config.voice.preprocess = bool(shutil.which("ffmpeg"))
+    config.image.album_window = args.album_window_ms / 1000
+
+    stages: Dict[str, List[float]] = defaultdict(list)
+    observe_turn = turns.observe_turn
+
+    def record_turn(kind: str, timings: Dict[str, float]):
+        for stage, seconds in timings.items():
+            stages[f"{kind}.{stage}"].append(seconds)
+        observe_turn(kind, timings)
+    turns.observe_turn = record_turn
+
+    deps = create_services(config)
+    bot = create_bot(config, deps["outbound"])
+    bot.session.api = TelegramAPIServer.from_base(f"{base_url}/telegram")
+    dp = create_dispatcher(config)
+
+    load = LoadRun(args, dp, bot, deps)
+    mix = parse_mix(args.mix)
+    deadline = time.monotonic() + args.duration if args.duration else None
+    print(
+        f"{args.users} users x {'%d turns' % args.turns if not args.duration else '%ss' % args.duration}, "
+        f"mix {args.mix}, redis {'fakeredis' if args.fake else config.redis.url}, "
+        f"voice preprocessing {'on' if config.voice.preprocess else 'off (no ffmpeg)'}"
+    )
+
+    started_at = datetime.now()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(load.user(user_id, mix, deadline) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+        # Post-reply stages (history writes, summaries) finish in the background
+        await asyncio.sleep(args.drain_ms / 1000)
+    finally:
+        if not args.fake:
+            await delete_user_keys(deps["memory_service"]._redis, user_ids)
+        await bot.session.close()
+        await close_services(deps)
+        await mocks.stop()
+
+    scenarios = sum(len(samples) for samples in load.latencies.values())
+    return {
+        "benchmark": "load",
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "params": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare")
+        } | {"voice_preprocess": config.voice.preprocess, "outbound_queue": config.outbound.enabled},
+        "totals": {
+            "scenarios": scenarios,
+            "updates": load.updates_fed,
+            "errors": sum(load.errors.values()),
+            "seconds": elapsed,
+            "throughput": scenarios / elapsed if elapsed else 0.0,
+            "updates_per_second": load.updates_fed / elapsed if elapsed else 0.0,
+        },
+        "handlers": {
+            kind: summarize(load.latencies.get(kind, []), load.errors.get(kind, 0))
+            for kind in sorted(set(load.latencies) | set(load.errors))
+        },
+        "stages": {name: summarize(samples) for name, samples in sorted(stages.items())},
+        "calls": registry_means(),
+        "telegram_calls": dict(mocks.telegram_calls.most_common()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent conversations")
+    parser.add_argument("--turns", type=int, default=10, help="scenarios per user")
+    parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds instead (0: off)")
+    parser.add_argument("--mix", default="text=60,voice=10,photo=10,album=5,command=15")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between a user's scenarios")
+    parser.add_argument("--coalesce-ms", type=int, default=800, help="text debounce window (COALESCE_WINDOW_MS)")
+    parser.add_argument("--album-window-ms", type=int, default=1000)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=20)
+    parser.add_argument("--llm-tokens", type=int, default=120)
+    parser.add_argument("--transcription-ms", type=float, default=400)
+    parser.add_argument("--tavily-ms", type=float, default=300)
+    parser.add_argument("--telegram-ms", type=float, default=30)
+    parser.add_argument("--drain-ms", type=float, default=1000, help="wait for background stages after the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fake", action="store_true", help="use in-process fakeredis")
+    parser.add_argument("--redis-url", help="Redis to run against, required without --fake (use a spare database)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", help="previous result file to compare with")
+    args = parser.parse_args()
+    if not args.fake and not args.redis_url:
+        parser.error("pass --redis-url (a database the bot doesn't use) or --fake")
+
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(ROOT)  # persona_prompt.md is read relative to the working directory
+    result = asyncio.run(run(args))
+
+    totals = result["totals"]
+    print(
+        f"\n{totals['scenarios']} scenarios ({totals['updates']} updates) in {totals['seconds']:.1f}s: "
+        f"{totals['throughput']:.2f} scenarios/s, {totals['updates_per_second']:.2f} updates/s, {totals['errors']} errors"
+    )
+    print_table("handler (s)", result["handlers"])
+    print_table("turn stage (s)", result["stages"])
+    print(f"\n{'call':<70} {'n':>6} {'mean s':>8}")
+    for name, row in result["calls"].items():
+        print(f"{name:<70} {row['count']:>6} {row['mean']:>8.4f}")
+    print("\nBot API calls: " + ", ".join(f"{method}={count}" for method, count in result["telegram_calls"].items()))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(result, json.load(f))
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Local stand-ins for the bot's upstreams, served by one aiohttp app:
+
+    /openai/v1/chat/completions        OpenRouter (streaming and not), vision included
+    /openai/v1/audio/transcriptions    Groq Whisper
+    /tavily/search                     Tavily
+    /telegram/bot<token>/<method>      Bot API (sendMessage, editMessageText, getFile, ...)
+    /telegram/file/bot<token>/<path>   Bot API file downloads
+
+Each answers after a configurable latency with plausible payloads, and the
+Telegram stand-in counts the calls it gets per method.
+"""
+import io
+import json
+import time
+import random
+import asyncio
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional
+from aiohttp import web
+from PIL import Image
+
+REPLY_WORDS = (
+    "конечно", "вот", "что", "можно", "сделать", "**важно**", "*немного*", "шаг", "список",
+    "идея", "пример", "`код`", "день", "погода", "план", "совет", "\n\n", "\n- пункт", "и", "это"
+)
+TRANSCRIPT = "Привет! Подскажи, какая сегодня погода в Минске и что надеть?"
+
+
+@dataclass
+class MockLatency:
+    llm_first_token: float = 0.3  # seconds until the first streamed token (or the whole non-streamed reply)
+    llm_token_interval: float = 0.02
+    llm_tokens: int = 120
+    transcription: float = 0.4
+    tavily: float = 0.3
+    telegram: float = 0.03
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    image = Image.new("RGB", (width, height))
+    image.putdata([((x * 7) % 256, (y * 5) % 256, (x + y) % 256) for y in range(height) for x in range(width)])
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=80)
+    return output.getvalue()
+
+
+class MockServers:
+    def __init__(self, latency: MockLatency, host: str = "127.0.0.1", port: int = 0, seed: int = 1):
+        self.latency = latency
+        self._host = host
+        self._port = port
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+        self.telegram_calls: Counter = Counter()
+        self._message_ids: Dict[str, int] = {}
+        self._photo = _jpeg(800, 600)
+        self._voice = bytes(self._random.getrandbits(8) for _ in range(24000))  # ~8 s of Opus, as far as size goes
+
+    # --- OpenAI-compatible API ---
+
+    def _reply_text(self) -> list:
+        return [self._random.choice(REPLY_WORDS) + " " for _ in range(self.latency.llm_tokens)]
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "mock")
+        tokens = self._reply_text()
+        await asyncio.sleep(self.latency.llm_first_token)
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(self.latency.llm_token_interval)
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _transcriptions(self, request: web.Request) -> web.Response:
+        await request.read()
+        await asyncio.sleep(self.latency.transcription)
+        return web.Response(text=TRANSCRIPT)
+
+    # --- Tavily ---
+
+    async def _tavily_search(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(self.latency.tavily)
+        return web.json_response({"results": [
+            {
+                "title": f"Result {i} for {body.get('query', '')[:40]}",
+                "content": "Сегодня в Минске от +3 до +7, облачно, местами небольшой дождь. " * 3,
+                "url": f"https://example.com/{i}",
+            }
+            for i in range(body.get("max_results", 3))
+        ]})
+
+    # --- Bot API ---
+
+    def _message(self, chat_id: str, text: str = "") -> Dict:
+        self._message_ids[chat_id] = self._message_ids.get(chat_id, 1000) + 1
+        return {
+            "message_id": self._message_ids[chat_id],
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Vera", "username": "vera_bot"},
+            "text": text or "…",
+        }
+
+    async def _telegram_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        self.telegram_calls[method] += 1
+        await asyncio.sleep(self.latency.telegram)
+
+        chat_id = str(data.get("chat_id", "0"))
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Vera", "username": "vera_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, str(data.get("text", "")))
+            if method == "editMessageText":
+                result["message_id"] = int(data.get("message_id", result["message_id"]))
+        elif method == "getFile":
+            file_id = str(data.get("file_id", ""))
+            folder, extension = ("voice", "ogg") if file_id.startswith("voice") else ("photos", "jpg")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_path": f"{folder}/{file_id}.{extension}"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _telegram_file(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency.telegram)
+        path = request.match_info["path"]
+        return web.Response(body=self._voice if path.startswith("voice/") else self._photo)
+
+    # --- lifecycle ---
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post("/openai/v1/chat/completions", self._chat_completions)
+        app.router.add_post("/openai/v1/audio/transcriptions", self._transcriptions)
+        app.router.add_post("/tavily/search", self._tavily_search)
+        app.router.add_post("/telegram/bot{token}/{method}", self._telegram_method)
+        app.router.add_get("/telegram/file/bot{token}/{path:.+}", self._telegram_file)
+        return app
+
+    async def start(self) -> str:
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{self._host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
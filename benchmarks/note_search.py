@@ -0,0 +1,122 @@
+"""
+/findnote latency as a user's note count grows: BM25 over the inverted index
+vs. the old way (load every note and scan it).
+
+    python benchmarks/note_search.py --redis-url redis://localhost:6379/15 [--sizes 100 1000 5000]
+    python benchmarks/note_search.py --fake   # in-process fakeredis, no server needed
+
+Notes are synthetic, with words drawn from a Zipf-like vocabulary so that
+query terms have realistic document frequencies. Queries are timed twice:
+with specific words only, and with one of the most common words added (the
+worst case for an inverted index). The benchmark writes to a
+dedicated user id and deletes its keys afterwards; without --fake it needs an
+explicit --redis-url (use a database the bot doesn't use).
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.notes import NotesService  # noqa: E402
+from app.services.note_search import index_terms  # noqa: E402
+
+BENCH_USER_ID = 999000111
+
+SYLLABLES = ["ка", "ро", "ми", "ту", "ле", "на", "вы", "за", "по", "ши", "ко", "ла", "ре", "ду", "со"]
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_note(vocabulary, weights, rng: random.Random) -> str:
+    return " ".join(rng.choices(vocabulary, weights=weights, k=rng.randint(5, 25)))
+
+
+async def naive_search(notes_service: NotesService, user_id: int, query: str):
+    """What finding a note took before the index: fetch everything, scan."""
+    terms = set(index_terms(query))
+    notes = await notes_service.get_notes(user_id)
+    return [note for note in notes if terms & set(index_terms(note["text"]))][:5]
+
+
+async def measure(func, queries):
+    latencies = []
+    for query in queries:
+        started_at = time.perf_counter()
+        await func(query)
+        latencies.append(time.perf_counter() - started_at)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+async def cleanup(client):
+    keys = set()
+    # Exactly this user's keys: notes:<id>, notes:<id>:..., never ids that merely contain it
+    for pattern in (f"*:{BENCH_USER_ID}", f"*:{BENCH_USER_ID}:*"):
+        keys.update([key async for key in client.scan_iter(match=pattern, count=1000)])
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        await client.delete(*keys[start:start + 500])
+
+
+async def run(client, sizes, queries_per_size: int, seed: int):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(3000, rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    notes_service = NotesService(client)
+
+    await cleanup(client)
+    print(f"{'notes':>8}{'rare p50':>10}{'rare p95':>10}{'common p50':>12}{'common p95':>12}{'scan p50':>10}{'scan p95':>10}  ms")
+    count = 0
+    try:
+        for size in sorted(sizes):
+            while count < size:
+                await notes_service.add_note(BENCH_USER_ID, make_note(vocabulary, weights, rng))
+                count += 1
+
+            # Specific words only, and the same queries with one of the 50 most common words added
+            rare = [rng.choices(vocabulary[50:], k=rng.randint(1, 3)) for _ in range(queries_per_size)]
+            common = [" ".join(words + [rng.choice(vocabulary[:50])]) for words in rare]
+            rare = [" ".join(words) for words in rare]
+            search = lambda q: notes_service.search(BENCH_USER_ID, q, limit=5)  # noqa: E731
+            rare_p50, rare_p95 = await measure(search, rare)
+            common_p50, common_p95 = await measure(search, common)
+            scan_p50, scan_p95 = await measure(
+                lambda q: naive_search(notes_service, BENCH_USER_ID, q), rare[:max(queries_per_size // 10, 5)]
+            )
+            print(f"{size:>8}{rare_p50:>10.2f}{rare_p95:>10.2f}{common_p50:>12.2f}{common_p95:>12.2f}{scan_p50:>10.2f}{scan_p95:>10.2f}")
+    finally:
+        await cleanup(client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fake", action="store_true", help="use in-process fakeredis")
+    parser.add_argument("--redis-url", help="Redis to run against, required without --fake (use a spare database)")
+    args = parser.parse_args()
+    if not args.fake and not args.redis_url:
+        parser.error("pass --redis-url (a database the bot doesn't use) or --fake")
+
+    if args.fake:
+        import fakeredis
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        import redis.asyncio as redis
+        client = redis.from_url(args.redis_url, decode_responses=True)
+    asyncio.run(run(client, args.sizes, args.queries, args.seed))
+
+
+if __name__ == "__main__":
+    main()
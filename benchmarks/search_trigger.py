@@ -0,0 +1,107 @@
+"""
+Precision/recall and per-call cost of the search trigger on labelled corpora.
+
+    python benchmarks/search_trigger.py [--corpus tuning.jsonl] [--heldout heldout.jsonl] [--errors]
+
+"legacy" is the substring matcher SearchService used before; "classifier" is
+app.services.search_trigger. A false positive costs a needless Tavily round
+trip, a false negative an answer without fresh data.
+
+The weights and patterns are tuned against search_trigger_corpus.jsonl, so
+its numbers are optimistic; search_trigger_heldout.jsonl is never used for
+tuning and is what the trigger's quality should be judged by. Messages found
+misclassified in the held-out set move to the tuning corpus, and fresh ones
+replace them.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.search_trigger import needs_search  # noqa: E402
+
+LEGACY_TRIGGERS = [
+    "погода", "новости", "курс", "цена", "кто такой",
+    "что такое", "когда", "где", "weather", "news",
+    "price", "who is", "what is", "when", "where",
+    "прогноз", "найди", "факты о", "сколько стоит",
+    "bitcoin", "usd", "euro", "рубль"
+]
+
+
+def legacy_needs_search(text: str) -> bool:
+    text_lower = text.lower()
+    return any(t in text_lower for t in LEGACY_TRIGGERS)
+
+
+def evaluate(predict: Callable[[str], bool], corpus: List[Dict], repeat: int) -> Dict:
+    tp = fp = fn = 0
+    errors = []
+    for sample in corpus:
+        predicted = predict(sample["text"])
+        if predicted and sample["search"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+            errors.append(("false positive", sample["text"]))
+        elif sample["search"]:
+            fn += 1
+            errors.append(("false negative", sample["text"]))
+
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for sample in corpus:
+            predict(sample["text"])
+    per_call = (time.perf_counter() - started_at) / (repeat * len(corpus))
+
+    return {
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "searches": tp + fp,
+        "needless": fp,
+        "missed": fn,
+        "us_per_call": per_call * 1e6,
+        "errors": errors,
+    }
+
+
+def load_corpus(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def report(title: str, corpus: List[Dict], repeat: int, show_errors: bool):
+    positives = sum(sample["search"] for sample in corpus)
+    print(f"{title}: {len(corpus)} messages, {positives} need a search")
+    print(f"{'':12}{'precision':>10}{'recall':>8}{'searches':>10}{'needless':>10}{'missed':>8}{'us/call':>9}")
+    for name, predict in (("legacy", legacy_needs_search), ("classifier", needs_search)):
+        result = evaluate(predict, corpus, repeat)
+        print(
+            f"{name:12}{result['precision']:>10.2f}{result['recall']:>8.2f}{result['searches']:>10}"
+            f"{result['needless']:>10}{result['missed']:>8}{result['us_per_call']:>9.1f}"
+        )
+        if show_errors:
+            for kind, text in result["errors"]:
+                print(f"    {kind}: {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument("--corpus", default=os.path.join(here, "search_trigger_corpus.jsonl"), help="tuning corpus")
+    parser.add_argument("--heldout", default=os.path.join(here, "search_trigger_heldout.jsonl"), help="never used for tuning")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--errors", action="store_true", help="print misclassified messages")
+    args = parser.parse_args()
+
+    report("tuning", load_corpus(args.corpus), args.repeat, args.errors)
+    print()
+    report("held-out", load_corpus(args.heldout), args.repeat, args.errors)
+
+
+if __name__ == "__main__":
+    main()
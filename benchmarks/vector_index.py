@@ -0,0 +1,84 @@
+"""
+Build time, memory per item and query latency of the long-term memory index.
+
+    python benchmarks/vector_index.py [--sizes 10000 100000] [--queries 200]
+
+Items are synthetic notes/turns made of words from a fixed vocabulary, so
+runs are reproducible (--seed). Embedding time is reported separately from
+index inserts: a per-user index embeds only what is new in its log.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.vectors import DEFAULT_DIM, VectorIndex, embed_text, embed_texts  # noqa: E402
+
+VOCABULARY = (
+    "купить молоко хлеб врач встреча понедельник вторник пароль дача мама папа день рождения подарок "
+    "книга фильм сериал кроссовки отпуск море билеты самолёт поезд работа проект дедлайн отчёт зарплата "
+    "спорт бег зал тренировка рецепт борщ пицца кофе чай кошка собака ветеринар машина ремонт шины "
+    "meeting doctor password birthday gift book movie flight ticket project deadline report coffee "
+    "running gym recipe pizza cat dog car repair tires vacation beach hotel python code bug release"
+).split()
+
+
+def make_texts(count: int, rng: random.Random):
+    return [" ".join(rng.choices(VOCABULARY, k=rng.randint(4, 16))) for _ in range(count)]
+
+
+def run(size: int, queries: int, dim: int, rng: random.Random):
+    texts = make_texts(size, rng)
+    ids = [f"note:{i}" for i in range(size)]
+
+    started_at = time.perf_counter()
+    vectors = embed_texts(texts, dim)
+    embed_seconds = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    index = VectorIndex(dim)
+    for start in range(0, size, 100):
+        # Incremental inserts in small batches, like a log being replayed
+        index.add(ids[start:start + 100], vectors[start:start + 100])
+    insert_seconds = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    for text in make_texts(queries, rng):
+        started_at = time.perf_counter()
+        index.search(embed_text(text, dim), 5)
+        latencies.append(time.perf_counter() - started_at)
+    latencies = np.array(latencies) * 1000
+
+    print(
+        f"{size:>8}{embed_seconds:>10.2f}{insert_seconds:>10.3f}"
+        f"{index.nbytes / size:>12.0f}{current / size:>14.0f}{peak / 2**20:>10.1f}"
+        f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"dim={args.dim}, top-5 queries, {args.queries} per size")
+    print(f"{'items':>8}{'embed s':>10}{'insert s':>10}{'vec B/item':>12}{'total B/item':>14}{'peak MB':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for size in args.sizes:
+        run(size, args.queries, args.dim, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,13 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
-from aiogram.client.default import DefaultBotProperties
+from aiogram import Bot
 from aiogram.types import BotCommand
 
 from config import load_config
-from app.handlers import commands, messages, voice, photos
-from app.services.memory import MemoryService
-from app.services.llm import LLMService
-from app.services.voice import VoiceService
-from app.services.search import SearchService
-from app.services.notes import NotesService
-from app.middlewares.auth import WhitelistMiddleware
+from app.runtime import create_bot, create_dispatcher, create_services, create_job_worker, close_services
+from app.webhook import WebhookServer
+from app.metrics import MetricsServer
+from app.update_stream import UpdateStream, poll_into
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,6 +24,7 @@ async def set_bot_commands(bot: Bot):
         BotCommand(command="setmodel", description="⚙️ Выбрать модель ИИ"),
         BotCommand(command="note", description="📝 Создать заметку"),
         BotCommand(command="notes", description="📋 Показать заметки"),
+        BotCommand(command="findnote", description="🔎 Найти заметку"),
         BotCommand(command="delnote", description="🗑 Удалить заметку"),
         BotCommand(command="translate", description="🌍 Перевести текст"),
     ]
@@ -44,52 +40,58 @@ async def main():
         logger.error(f"Failed to load configuration: {e}")
         return
 
-    # Initialize Services
-    memory_service = MemoryService(config.redis)
-    llm_service = LLMService(config.llm)
-    voice_service = VoiceService(config.voice)
-    search_service = SearchService(config.search)
-    notes_service = NotesService(memory_service._redis)
+    # Initialize Services (dependencies injected into handlers)
+    deps = create_services(config)
 
     # Initialize Bot
-    bot = Bot(
-        token=config.bot.token, 
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
+    bot = create_bot(config, deps["outbound"])
     
     # Set bot commands menu
     await set_bot_commands(bot)
     logger.info("Bot commands menu set successfully")
     
-    # Initialize Dispatcher
-    dp = Dispatcher()
-    
-    # Register Middleware
-    dp.message.middleware(WhitelistMiddleware(config.bot.admin_ids))
-    
-    # Register Routers (order matters: commands first, then specific, then catch-all)
-    dp.include_router(commands.router)
-    dp.include_router(photos.router)
-    dp.include_router(voice.router)
-    dp.include_router(messages.router)  # catch-all for text should be last
-    
-    # Start polling with dependency injection
-    logger.info("Starting bot...")
+    # Initialize Dispatcher with middlewares and routers
+    dp = create_dispatcher(config)
+
+    # Where received updates go: this process's dispatcher, or Redis Streams for app.workers
+    if config.bot.processing == "stream":
+        update_stream = UpdateStream(deps["memory_service"]._redis, config.stream)
+        process = update_stream.publish
+    else:
+        process = lambda update: dp.feed_update(bot, update, **deps)
+    allowed_updates = dp.resolve_used_update_types()
+
+    # Prometheus scrapes this process on METRICS_PORT
+    metrics_server = None
+    if config.metrics.enabled:
+        metrics_server = MetricsServer(config.metrics)
+        await metrics_server.start()
+
+    # Slow operations queued by handlers are executed here too (and by app.workers)
+    job_worker_task = None
+    if config.jobs.enabled:
+        job_worker_task = asyncio.create_task(create_job_worker(bot, deps).run())
+
+    logger.info(f"Starting bot in {config.bot.mode} mode ({config.bot.processing} processing)...")
     try:
-        await dp.start_polling(
-            bot, 
-            memory_service=memory_service,
-            llm_service=llm_service,
-            voice_service=voice_service,
-            search_service=search_service,
-            notes_service=notes_service,
-            config=config
-        )
+        if config.bot.mode == "webhook":
+            server = WebhookServer(bot, process, config.webhook)
+            await server.serve_forever(allowed_updates=allowed_updates)
+        elif config.bot.processing == "stream":
+            await bot.delete_webhook()
+            await poll_into(bot, update_stream, allowed_updates)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot, **deps)
     except Exception as e:
         logger.error(f"Error occurred: {e}")
     finally:
+        if job_worker_task is not None:
+            job_worker_task.cancel()
+        if metrics_server is not None:
+            await metrics_server.stop()
         await bot.session.close()
-        await memory_service.close()
+        await close_services(deps)
 
 
 if __name__ == "__main__":
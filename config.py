@@ -1,7 +1,7 @@
 import os
-from typing import List
+from typing import Dict, List
 from dotenv import load_dotenv
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 load_dotenv()
 
@@ -9,6 +9,53 @@ load_dotenv()
 class BotConfig:
     token: str
     admin_ids: List[int]
+    mode: str = "polling"  # "polling" or "webhook"
+    processing: str = "inline"  # "inline" or "stream" (hand updates to app.workers via Redis)
+    coalesce_window: float = 0.8  # seconds: text messages closer than this become one turn
+
+@dataclass
+class StreamConfig:
+    prefix: str = "updates"
+    shards: int = 16  # fixed: changing it reshuffles chats between streams
+    group: str = "workers"
+    maxlen: int = 10000  # approximate length cap per stream
+    block_ms: int = 5000
+    claim_idle_ms: int = 60000  # pending entries older than this are taken over
+    concurrency: int = 32  # updates processed at once per worker process
+
+@dataclass
+class WebhookConfig:
+    url: str = ""  # public base URL Telegram posts to, e.g. https://bot.up.railway.app; empty: don't call setWebhook
+    path: str = "/webhook"
+    secret: str = ""
+    host: str = "0.0.0.0"
+    port: int = 8080
+    queue_size: int = 1000  # updates buffered before answering 503 (Telegram retries)
+    workers: int = 8  # updates processed concurrently
+
+@dataclass
+class JobsConfig:
+    enabled: bool = True  # False: slow operations run inline in the handler
+    # Concurrent jobs per type in one worker process
+    limits: Dict[str, int] = field(default_factory=lambda: {"voice": 4, "vision": 4, "think": 2})
+    max_attempts: int = 3
+    backoff: float = 2.0  # seconds before the first retry, doubled each time
+
+@dataclass
+class OutboundConfig:
+    enabled: bool = True  # False: API calls go out directly, as aiogram sends them
+    global_rate: float = 30.0  # messages per second for the whole bot
+    chat_rate: float = 1.0  # per private chat
+    chat_burst: int = 3
+    group_rate: float = 20 / 60  # per group chat
+    group_burst: int = 3
+    max_retries: int = 3  # RetryAfter retries of a reply before it fails
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = True
+    host: str = "127.0.0.1"  # scraped locally (sidecar / agent), not exposed
+    port: int = 9100  # app.workers processes use port + worker index + 1
 
 @dataclass
 class RedisConfig:
@@ -22,23 +69,77 @@ class LLMConfig:
     vision_model: str = "openai/gpt-4o-mini"
     thinker_model: str = "deepseek/deepseek-r1"
     system_prompt_path: str = "persona_prompt.md"
+    stream: bool = True
+    stream_edit_interval: float = 1.0  # seconds between progressive edits
+    context_budget: int = 3000  # prompt tokens: system prompt + history + search
+    context_budgets: Dict[str, int] = field(default_factory=dict)  # per-model overrides
+    search_budget: int = 800  # at most this many prompt tokens of search snippets
+    memory_budget: int = 300  # at most this many prompt tokens of recalled notes/turns
+    history_messages: int = 20  # at most this many past messages; the budget may keep fewer
+
+@dataclass
+class ImageConfig:
+    target_size: int = 1280  # longest side in px sent to the vision model
+    jpeg_quality: int = 80
+    max_workers: int = 2  # process pool for downscaling
+    album_window: float = 1.0  # seconds to wait for more photos of one album
 
 @dataclass
 class VoiceConfig:
     api_key: str
     model: str = "whisper-large-v3-turbo"
+    base_url: str = "https://api.groq.com/openai/v1"
+    preprocess: bool = True  # decode, cut silences, re-encode to low-bitrate Opus
+    bitrate: str = "24k"
+    max_conversions: int = 2  # concurrent ffmpeg processes
+    # Long-audio mode: split at silences and transcribe segments in parallel
+    long_audio_threshold: float = 60.0  # seconds
+    segment_max_seconds: float = 30.0
+    segment_min_seconds: float = 10.0
+    segment_overlap_seconds: float = 1.0  # only where there was no silence to cut at
+    segment_retries: int = 3
+    max_parallel_segments: int = 4
 
 @dataclass
 class SearchConfig:
     api_key: str
+    base_url: str = "https://api.tavily.com"
+    timeout: float = 10.0  # seconds per request
+    pool_size: int = 10  # max open connections
+    cache_size: int = 256  # in-process LRU entries
+
+@dataclass
+class SummaryConfig:
+    enabled: bool = True
+    model: str = "openai/gpt-4o-mini"  # cheap model, runs in the background
+    threshold: int = 14  # fold older turns once history is longer than this
+    keep_recent: int = 6  # messages that always stay verbatim
+    max_tokens: int = 400  # running summary length
+
+@dataclass
+class LongTermConfig:
+    enabled: bool = True
+    dim: int = 256  # hashed embedding size
+    top_k: int = 3
+    min_score: float = 0.2  # cosine; below this a hit is noise
+    max_users: int = 256  # per-user indexes kept in memory per process
+    max_turns: int = 1000  # archived turns kept per user; older ones are dropped at compaction
 
 @dataclass
 class Config:
     bot: BotConfig
+    webhook: WebhookConfig
+    stream: StreamConfig
+    jobs: JobsConfig
+    outbound: OutboundConfig
+    metrics: MetricsConfig
     redis: RedisConfig
     llm: LLMConfig
+    image: ImageConfig
     voice: VoiceConfig
     search: SearchConfig
+    summary: SummaryConfig
+    long_term: LongTermConfig
 
 def load_config() -> Config:
     bot_token = os.getenv("BOT_TOKEN")
@@ -48,22 +149,89 @@ def load_config() -> Config:
     admin_ids_str = os.getenv("ADMIN_IDS", "")
     admin_ids = [int(id_str) for id_str in admin_ids_str.split(",") if id_str.strip()]
 
+    bot_mode = os.getenv("BOT_MODE", "polling").lower()
+    if bot_mode not in ("polling", "webhook"):
+        raise ValueError(f"Unknown BOT_MODE: {bot_mode}")
+
+    bot_processing = os.getenv("BOT_PROCESSING", "inline").lower()
+    if bot_processing not in ("inline", "stream"):
+        raise ValueError(f"Unknown BOT_PROCESSING: {bot_processing}")
+    stream_shards = int(os.getenv("STREAM_SHARDS", "16"))
+    coalesce_window = int(os.getenv("COALESCE_WINDOW_MS", "800")) / 1000
+    jobs_enabled = os.getenv("JOBS_ENABLED", "1").lower() not in ("0", "false", "no")
+    outbound_enabled = os.getenv("OUTBOUND_QUEUE", "1").lower() not in ("0", "false", "no")
+    outbound_global_rate = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+    metrics_enabled = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+    metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+    metrics_port = int(os.getenv("METRICS_PORT", "9100"))
+
+    webhook_url = os.getenv("WEBHOOK_URL", "")
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "")
+    # An empty WEBHOOK_URL skips setWebhook (local runs, see scripts/fake_webhook_update.py)
+    if bot_mode == "webhook" and not webhook_secret:
+        raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+    webhook_port = int(os.getenv("PORT", "8080"))  # Railway provides PORT
+
     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     
     openrouter_key = os.getenv("OPENROUTER_API_KEY")
     if not openrouter_key:
         raise ValueError("OPENROUTER_API_KEY is not set")
         
+    image_target_size = int(os.getenv("IMAGE_TARGET_SIZE", "1280"))
+
     groq_key = os.getenv("GROQ_API_KEY") # Optional check removed to avoid logic conflict if user wants incomplete config locally
+    voice_preprocess = os.getenv("VOICE_PREPROCESS", "1").lower() not in ("0", "false", "no")
+    voice_max_conversions = int(os.getenv("VOICE_MAX_CONVERSIONS", "2"))
+    long_audio_threshold = float(os.getenv("VOICE_LONG_AUDIO_THRESHOLD", "60"))
     
     tavily_key = os.getenv("TAVILY_API_KEY", "")
+    tavily_url = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+    search_timeout = float(os.getenv("SEARCH_TIMEOUT", "10"))
     # Strict check if we want to enforce it
     # if not tavily_key: raise ValueError("TAVILY_API_KEY is not set")
+
+    llm_stream = os.getenv("LLM_STREAM", "1").lower() not in ("0", "false", "no")
+    stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+    context_budget = int(os.getenv("CONTEXT_BUDGET", "3000"))
+    # CONTEXT_BUDGETS=openai/gpt-4o-mini=6000,deepseek/deepseek-chat=4000
+    context_budgets = {
+        model.strip(): int(tokens)
+        for model, _, tokens in (item.rpartition("=") for item in os.getenv("CONTEXT_BUDGETS", "").split(","))
+        if model.strip()
+    }
+    search_budget = int(os.getenv("SEARCH_BUDGET", "800"))
+    history_messages = int(os.getenv("HISTORY_MESSAGES", "20"))
+
+    summary_enabled = os.getenv("SUMMARY_ENABLED", "1").lower() not in ("0", "false", "no")
+    summary_model = os.getenv("SUMMARY_MODEL", "openai/gpt-4o-mini")
+    long_term_enabled = os.getenv("LONG_TERM_MEMORY", "1").lower() not in ("0", "false", "no")
         
     return Config(
-        bot=BotConfig(token=bot_token, admin_ids=admin_ids),
+        bot=BotConfig(token=bot_token, admin_ids=admin_ids, mode=bot_mode, processing=bot_processing, coalesce_window=coalesce_window),
+        stream=StreamConfig(shards=stream_shards),
+        jobs=JobsConfig(enabled=jobs_enabled),
+        outbound=OutboundConfig(enabled=outbound_enabled, global_rate=outbound_global_rate),
+        metrics=MetricsConfig(enabled=metrics_enabled, host=metrics_host, port=metrics_port),
+        webhook=WebhookConfig(url=webhook_url, secret=webhook_secret, port=webhook_port),
         redis=RedisConfig(url=redis_url),
-        llm=LLMConfig(api_key=openrouter_key),
-        voice=VoiceConfig(api_key=groq_key or ""),
-        search=SearchConfig(api_key=tavily_key)
+        llm=LLMConfig(
+            api_key=openrouter_key,
+            stream=llm_stream,
+            stream_edit_interval=stream_edit_interval,
+            context_budget=context_budget,
+            context_budgets=context_budgets,
+            search_budget=search_budget,
+            history_messages=history_messages
+        ),
+        image=ImageConfig(target_size=image_target_size),
+        voice=VoiceConfig(
+            api_key=groq_key or "",
+            preprocess=voice_preprocess,
+            max_conversions=voice_max_conversions,
+            long_audio_threshold=long_audio_threshold
+        ),
+        search=SearchConfig(api_key=tavily_key, base_url=tavily_url, timeout=search_timeout),
+        summary=SummaryConfig(enabled=summary_enabled, model=summary_model),
+        long_term=LongTermConfig(enabled=long_term_enabled)
     )
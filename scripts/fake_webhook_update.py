@@ -0,0 +1,57 @@
+"""
+Post fake Telegram updates to a locally running bot in webhook mode.
+
+    BOT_MODE=webhook WEBHOOK_URL= WEBHOOK_SECRET=dev python bot.py
+    python scripts/fake_webhook_update.py --secret dev --user-id 12345678 --count 20 "Привет!"
+
+WEBHOOK_URL left empty skips setWebhook, so nothing is registered with Telegram.
+The user id must be in ADMIN_IDS, otherwise the whitelist answers instead of the bot.
+Replies are still sent through the real Bot API to that chat.
+"""
+import time
+import asyncio
+import argparse
+import aiohttp
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": "Test"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("text", nargs="?", default="Привет!")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--start-id", type=int, default=int(time.time()))
+    args = parser.parse_args()
+
+    async with aiohttp.ClientSession(headers={SECRET_HEADER: args.secret}) as session:
+        async def post(index: int):
+            started = time.monotonic()
+            update = make_update(args.start_id + index, args.user_id, f"{args.text} #{index}" if args.count > 1 else args.text)
+            async with session.post(args.url, json=update) as response:
+                return response.status, time.monotonic() - started
+
+        results = await asyncio.gather(*(post(i) for i in range(args.count)))
+
+    for index, (status, elapsed) in enumerate(results):
+        print(f"update #{index}: HTTP {status} in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
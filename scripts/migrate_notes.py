@@ -0,0 +1,64 @@
+"""
+One-shot migration of notes from the old JSON list (notes:{user_id}) to the
+hash + sorted set layout used by NotesService.
+
+    REDIS_URL=redis://... python scripts/migrate_notes.py [--dry-run] [--reindex]
+
+Safe to re-run: users already migrated have no list left and are skipped.
+Migrated notes are also written to the long-term memory log and the
+full-text index; --reindex rebuilds that index for notes stored in the new
+layout before /findnote existed, and adds notes missing from the long-term
+memory log (stored before it existed or while it was disabled).
+"""
+import os
+import sys
+import asyncio
+import argparse
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.long_term import LongTermMemory  # noqa: E402
+from app.services.notes import NotesService  # noqa: E402
+from config import LongTermConfig  # noqa: E402
+
+
+async def migrate(url: str, dry_run: bool, reindex: bool):
+    client = redis.from_url(url, decode_responses=True)
+    notes_service = NotesService(client, LongTermMemory(client, LongTermConfig()))
+    users = notes = 0
+    try:
+        async for key in client.scan_iter(match="notes:*", count=500):
+            # New keys (notes:{id}:items / :by_time / ...) share the prefix
+            parts = key.split(":")
+            if reindex and len(parts) == 3 and parts[2] == "items" and parts[1].isdigit():
+                if not dry_run:
+                    print(f"user {parts[1]}: reindexed {await notes_service.reindex(int(parts[1]))} notes")
+                continue
+            user_part = key.split(":", 1)[1]
+            if not user_part.isdigit() or await client.type(key) != "list":
+                continue
+            if dry_run:
+                count = await client.llen(key)
+            else:
+                count = await notes_service.migrate_legacy(int(user_part))
+            users += 1
+            notes += count
+            print(f"user {user_part}: {count} notes")
+    finally:
+        await client.aclose()
+    print(f"{'Would migrate' if dry_run else 'Migrated'} {notes} notes of {users} users")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dry-run", action="store_true", help="only count legacy notes")
+    parser.add_argument("--reindex", action="store_true", help="also rebuild the full-text index and backfill long-term memory of migrated users")
+    args = parser.parse_args()
+    asyncio.run(migrate(os.getenv("REDIS_URL", "redis://localhost:6379/0"), args.dry_run, args.reindex))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import asyncio
+
+from app.services.coalesce import MessageCoalescer, commit_reply
+
+WINDOW = 0.05
+
+
+class _Chat:
+    """Runs handle_text's coalescing for one user and records what happened."""
+
+    def __init__(self, generation_seconds: float = 0.0, commit_after: float = None):
+        self.coalescer = MessageCoalescer(WINDOW)
+        self.generation_seconds = generation_seconds
+        self.commit_after = commit_after
+        self.started = []
+        self.cancelled = []
+        self.replied = []
+
+    async def _generate(self, text: str) -> str:
+        self.started.append(text)
+        try:
+            if self.commit_after is None:
+                await asyncio.sleep(self.generation_seconds)
+            else:
+                await asyncio.sleep(self.commit_after)
+                commit_reply()
+                await asyncio.sleep(self.generation_seconds - self.commit_after)
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        self.replied.append(text)
+        return text
+
+    async def handle(self, text: str):
+        burst = await self.coalescer.collect(1, text)
+        if burst is None:
+            return
+        seq, merged = burst
+        await self.coalescer.run(1, seq, self._generate(merged))
+
+    async def send(self, *timed_texts):
+        """(delay since the previous message, text) pairs, handled concurrently."""
+        handlers = []
+        for delay, text in timed_texts:
+            await asyncio.sleep(delay)
+            handlers.append(asyncio.create_task(self.handle(text)))
+        await asyncio.gather(*handlers)
+
+
+def test_messages_within_the_window_are_merged():
+    chat = _Chat()
+    asyncio.run(chat.send((0, "привет"), (0.01, "как дела"), (0.01, "?")))
+
+    assert chat.replied == ["привет\nкак дела\n?"]
+    assert chat.cancelled == []
+
+
+def test_messages_further_apart_than_the_window_are_separate_turns():
+    chat = _Chat()
+    asyncio.run(chat.send((0, "привет"), (WINDOW * 3, "как дела")))
+
+    assert chat.replied == ["привет", "как дела"]
+
+
+def test_message_during_generation_cancels_it_and_joins_the_burst():
+    chat = _Chat(generation_seconds=0.2)
+    asyncio.run(chat.send((0, "привет"), (WINDOW + 0.05, "как дела")))
+
+    assert chat.started == ["привет", "привет\nкак дела"]
+    assert chat.cancelled == ["привет"]
+    assert chat.replied == ["привет\nкак дела"]
+
+
+def test_message_after_commit_starts_a_new_burst():
+    chat = _Chat(generation_seconds=0.2, commit_after=0.05)
+    # Arrives once the first reply is committed but still going out
+    asyncio.run(chat.send((0, "привет"), (WINDOW + 0.1, "как дела")))
+
+    assert chat.cancelled == []
+    # Each message is answered (and would be stored) exactly once
+    assert chat.replied == ["привет", "как дела"]
@@ -0,0 +1,18 @@
+from app.services.context import ContextBuilder
+from config import LLMConfig
+
+
+def _builder(**config) -> ContextBuilder:
+    return ContextBuilder(LLMConfig(api_key="test", **config))
+
+
+def test_empty_history_gives_only_the_system_prompt():
+    assert _builder().build("system", [], "model") == [{"role": "system", "content": "system"}]
+
+
+def test_history_is_capped_by_message_count():
+    history = [{"role": "user", "content": f"сообщение {number}"} for number in range(10)]
+
+    messages = _builder(history_messages=3).build("system", history, "model")
+
+    assert [message["content"] for message in messages[1:]] == ["сообщение 6", "сообщение 7", "сообщение 8", "сообщение 9"]
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import fakeredis
+from aiogram.methods import SendChatAction, SendMessage
+
+from app.jobs import queue as jobs
+from app.jobs.queue import DELAYED_KEY, JobWorker, processing_key, queue_key
+from app.middlewares.outbound import OutboundScheduler
+from config import JobsConfig, OutboundConfig
+
+
+class _StubBot:
+    """Requests go through the outbound middleware, like with a real session."""
+
+    def __init__(self):
+        self.sent = []
+        self._outbound = OutboundScheduler(OutboundConfig(enabled=False))
+
+    async def call(self, method):
+        async def make_request(bot, method):
+            return True
+        return await self._outbound(make_request, self, method)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+
+def _job(job_type: str = "vision") -> str:
+    return json.dumps({"id": "j1", "type": job_type, "attempts": 0, "payload": {"chat_id": 5}})
+
+
+def _execute(monkeypatch, handler):
+    """Pull one vision job with `handler` as its implementation and run it."""
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "vision", handler)
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        bot = _StubBot()
+        worker = JobWorker(redis, JobsConfig(), bot, {}, name="w1")
+        await redis.rpush(queue_key("vision"), _job())
+        raw = await worker._pull()
+        worker._running["vision"] += 1
+        await worker._execute(raw)
+        delayed = await redis.zrange(DELAYED_KEY, 0, -1)
+        return bot.sent, [json.loads(job)["attempts"] for job in delayed], await redis.llen(processing_key("w1"))
+
+    return asyncio.run(scenario())
+
+
+def test_failure_before_posting_is_retried(monkeypatch):
+    async def handler(bot, deps, payload):
+        await bot.call(SendChatAction(chat_id=5, action="typing"))  # actions don't count
+        raise ConnectionError("upstream down")
+
+    sent, retries, processing = _execute(monkeypatch, handler)
+
+    assert (sent, retries, processing) == ([], [1], 0)
+
+
+def test_failure_after_posting_is_reported_not_retried(monkeypatch):
+    async def handler(bot, deps, payload):
+        await bot.call(SendMessage(chat_id=5, text="половина ответа"))
+        raise ConnectionError("stream broke")
+
+    sent, retries, processing = _execute(monkeypatch, handler)
+
+    assert (sent, retries, processing) == ([jobs.JOB_FAILED_TEXT["vision"]], [], 0)
+
+
+def test_finished_job_leaves_the_processing_list(monkeypatch):
+    async def handler(bot, deps, payload):
+        await bot.call(SendMessage(chat_id=5, text="ответ"))
+
+    assert _execute(monkeypatch, handler) == ([], [], 0)
+
+
+def test_dead_workers_jobs_are_requeued():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        dead = JobWorker(redis, JobsConfig(), _StubBot(), {}, name="dead")
+        await dead._heartbeat()
+        await redis.rpush(queue_key("voice"), _job("voice"))
+        assert await dead._pull() is not None  # taken, then the worker dies
+        await redis.delete("jobs:worker:dead")  # heartbeat expired
+
+        alive = JobWorker(redis, JobsConfig(), _StubBot(), {}, name="alive")
+        await alive._heartbeat()
+        await alive._recover()
+        return await redis.lrange(queue_key("voice"), 0, -1), await redis.exists(processing_key("dead"))
+
+    queued, processing = asyncio.run(scenario())
+
+    assert [json.loads(raw)["type"] for raw in queued] == ["voice"]
+    assert processing == 0
+
+
+def test_restarted_worker_requeues_its_own_jobs():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        before = JobWorker(redis, JobsConfig(), _StubBot(), {}, name="bot-1")
+        await before._heartbeat()
+        await redis.rpush(queue_key("voice"), _job("voice"))
+        assert await before._pull() is not None  # taken, then the container restarts
+
+        # Same hostname and pid 1: same name, and its heartbeat may still be alive
+        after = JobWorker(redis, JobsConfig(), _StubBot(), {}, name="bot-1")
+        await after._reclaim()
+        return await redis.lrange(queue_key("voice"), 0, -1), await redis.llen(processing_key("bot-1"))
+
+    queued, processing = asyncio.run(scenario())
+
+    assert [json.loads(raw)["type"] for raw in queued] == ["voice"]
+    assert processing == 0
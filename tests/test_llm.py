@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.llm import CHAT_ERROR, LLMService, with_error_text
+from config import LLMConfig
+
+
+class _StubCompletions:
+    def __init__(self, deltas):
+        self._deltas = deltas
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            return self._chunks()
+        content = "".join(self._deltas)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def _chunks(self):
+        yield SimpleNamespace(choices=[])  # keep-alive / usage chunk without choices
+        for delta in self._deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+def _service(stream: bool, deltas):
+    service = LLMService(LLMConfig(api_key="test", stream=stream, system_prompt_path="missing.md"))
+    completions = _StubCompletions(deltas)
+    service._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return service, completions
+
+
+async def _collect(iterator):
+    return [delta async for delta in iterator]
+
+
+def test_stream_response_yields_deltas():
+    service, completions = _service(True, ["При", "вет", "!"])
+    history = [{"role": "user", "content": "Привет"}]
+
+    deltas = asyncio.run(_collect(service.stream_response(history)))
+
+    assert deltas == ["При", "вет", "!"]
+    assert completions.calls[0]["stream"] is True
+
+
+def test_stream_response_r1_yields_deltas():
+    service, _ = _service(True, ["Потому что ", "рассеяние"])
+
+    deltas = asyncio.run(_collect(service.stream_response_r1("Почему небо синее?")))
+
+    assert "".join(deltas) == "Потому что рассеяние"
+
+
+def test_stream_disabled_falls_back_to_one_request():
+    service, completions = _service(False, ["Один ", "ответ"])
+    history = [{"role": "user", "content": "Привет"}]
+
+    deltas = asyncio.run(_collect(service.stream_response(history)))
+
+    assert deltas == ["Один ответ"]
+    assert "stream" not in completions.calls[0]
+
+
+def test_with_error_text_ends_a_failed_stream():
+    async def failing():
+        yield "Нач"
+        raise ConnectionError("upstream down")
+
+    deltas = asyncio.run(_collect(with_error_text(failing(), CHAT_ERROR)))
+
+    assert deltas == ["Нач", f"\n\n{CHAT_ERROR}"]
+
+
+def test_stream_timing_ends_at_the_last_chunk():
+    from app.metrics import LLM_SECONDS
+
+    service, _ = _service(True, ["При", "вет"])
+    history = [{"role": "user", "content": "Привет"}]
+    seconds = LLM_SECONDS.labels(service._model, "chat")
+    before = seconds._sum.get()
+
+    async def slow_consumer():
+        async for _ in service.stream_response(history):
+            await asyncio.sleep(0.2)  # Telegram edits, the send queue
+
+    asyncio.run(slow_consumer())
+
+    # The consumer's time after the last chunk isn't the model's
+    assert seconds._sum.get() - before < 0.3
@@ -0,0 +1,71 @@
+import asyncio
+
+import fakeredis
+
+from app.services.long_term import LongTermMemory
+from config import LongTermConfig
+
+
+def _memories(count: int = 2, **config):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return redis, [LongTermMemory(redis, LongTermConfig(min_score=0.0, **config)) for _ in range(count)]
+
+
+def test_clear_removes_turn_text_from_redis():
+    async def scenario():
+        redis, (memory, _) = _memories()
+        await memory.add(1, "note:1", "note", "пароль от вайфая на холодильнике")
+        await memory.add_turns(1, [
+            {"role": "user", "content": "мой секретный рецепт борща"},
+            {"role": "assistant", "content": "записала"},
+        ])
+        await memory.forget_turns(1)
+        log = " ".join(await redis.lrange("ltm_log:1", 0, -1))
+        recalled = await memory.recall(1, "вайфай пароль")
+        return log, [r.item_id for r in recalled]
+
+    log, recalled = asyncio.run(scenario())
+
+    assert "борща" not in log
+    assert "вайфая" in log
+    assert recalled == ["note:1"]
+
+
+def test_other_process_reloads_after_compaction():
+    async def scenario():
+        _, (writer, reader) = _memories()
+        for i in range(5):
+            await writer.add(1, f"note:{i}", "note", f"заметка номер {i} про кошек")
+        assert len(await reader.recall(1, "кошки", k=10)) == 5
+        for i in range(4):
+            await writer.remove(1, f"note:{i}")
+        assert await writer.compact(1)
+        await writer.add(1, "note:9", "note", "новая заметка про кошек")
+        return sorted(r.item_id for r in await reader.recall(1, "кошки", k=10))
+
+    assert asyncio.run(scenario()) == ["note:4", "note:9"]
+
+
+def test_compaction_keeps_newest_turns_and_concurrent_appends():
+    async def scenario():
+        redis, (memory, _) = _memories(max_turns=2)
+        for i in range(4):
+            await memory.add_turns(1, [{"role": "user", "content": f"вопрос {i}"}, {"role": "assistant", "content": "ответ"}])
+        await memory.compact(1)
+        return await redis.lrange("ltm_log:1", 0, -1)
+
+    log = asyncio.run(scenario())
+
+    assert len(log) == 2
+    assert "вопрос 2" in log[0] and "вопрос 3" in log[1]
+
+
+def test_sync_notes_backfills_missing_notes():
+    async def scenario():
+        _, (memory, _) = _memories()
+        await memory.add(1, "note:1", "note", "уже в памяти")
+        added = await memory.sync_notes(1, [(1, "уже в памяти"), (2, "старая заметка про отпуск")])
+        recalled = await memory.recall(1, "отпуск")
+        return added, recalled[0].item_id
+
+    assert asyncio.run(scenario()) == (1, "note:2")
@@ -0,0 +1,28 @@
+import asyncio
+
+import fakeredis
+
+from app.services.media_cache import MediaCache
+
+
+def test_empty_results_are_not_cached():
+    async def scenario():
+        cache = MediaCache(fakeredis.FakeAsyncRedis(decode_responses=True))
+        await cache.set("stt", "file", "model", "  ")
+        return await cache.get("stt", "file", "model")
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_corrupt_entry_is_a_miss():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        cache = MediaCache(redis)
+        await redis.set(cache._key("vision", "file", "model", ""), "{not json")
+        miss = await cache.get("vision", "file", "model")
+
+        await cache.set("vision", "file", "model", "кот на диване")
+        hit = await MediaCache(redis).get("vision", "file", "model")
+        return miss, hit
+
+    assert asyncio.run(scenario()) == (None, "кот на диване")
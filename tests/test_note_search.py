@@ -0,0 +1,27 @@
+import asyncio
+
+import fakeredis
+
+from app.services import note_search
+from app.services.notes import NotesService
+
+
+def test_common_term_reads_only_the_capped_postings(monkeypatch):
+    monkeypatch.setattr(note_search, "MAX_POSTINGS", 3)
+
+    async def scenario():
+        notes = NotesService(fakeredis.FakeAsyncRedis(decode_responses=True))
+        for _ in range(10):
+            await notes.add_note(1, "купить молоко")
+        await notes.add_note(1, "молоко молоко молоко сыр")
+        await notes.add_note(1, "молоко и редкий пароль")
+        return await notes.search(1, "молоко"), await notes.search(1, "молоко пароль")
+
+    (common_total, common), (rare_total, rare) = asyncio.run(scenario())
+
+    # Highest term frequency first, at most MAX_POSTINGS candidates per term
+    assert common_total == 3
+    assert common[0]["text"] == "молоко молоко молоко сыр"
+    # The rare term still finds its note past the cap of the common one
+    assert rare[0]["text"] == "молоко и редкий пароль"
+    assert rare_total <= 4
@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+
+from app.handlers.commands import callback_findnote_page, callback_notes_page, findnote_query_key
+from app.services import notes as notes_module
+from app.services.notes import NotesService
+
+
+def test_pages_cover_notes_created_in_the_same_millisecond(monkeypatch):
+    monkeypatch.setattr(notes_module.time, "time", lambda: 1700000000.0)
+
+    async def scenario():
+        notes = NotesService(fakeredis.FakeAsyncRedis(decode_responses=True))
+        for number in range(25):
+            await notes.add_note(1, f"заметка {number}")
+
+        pages = [await notes.get_page(1, limit=10)]
+        while pages[-1].next_cursor is not None:
+            pages.append(await notes.get_page(1, cursor=pages[-1].next_cursor, limit=10))
+        back = await notes.get_page(1, cursor=pages[-1].prev_cursor, backward=True, limit=10)
+        return pages, back
+
+    pages, back = asyncio.run(scenario())
+
+    seen = [note["id"] for page in pages for note in page.notes]
+    assert sorted(seen) == list(range(1, 26))
+    assert len(seen) == 25
+    assert [len(page.notes) for page in pages] == [10, 10, 5]
+    assert back.notes == pages[1].notes
+
+
+def test_crafted_cursor_is_rejected():
+    answers = []
+
+    async def answer(text=None, **kwargs):
+        answers.append(text)
+
+    async def scenario():
+        notes = NotesService(fakeredis.FakeAsyncRedis(decode_responses=True))
+        for data in ("notes_next:abc", "notes_prev:1700000000000", "notes_next:1:2:3"):
+            callback = SimpleNamespace(from_user=SimpleNamespace(id=1), data=data, answer=answer)
+            await callback_notes_page(callback, notes)
+
+    asyncio.run(scenario())
+
+    assert answers == ["Список устарел, открой /notes заново"] * 3
+
+
+def test_crafted_findnote_offset_is_rejected():
+    answers = []
+
+    async def answer(text=None, **kwargs):
+        answers.append(text)
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        notes = NotesService(redis)
+        await notes.add_note(1, "пароль от wifi")
+        await redis.set(findnote_query_key(1), "пароль")
+        memory = SimpleNamespace(_redis=redis)
+        for data in ("findnote:abc", "findnote:-5", "findnote:"):
+            callback = SimpleNamespace(from_user=SimpleNamespace(id=1), data=data, answer=answer)
+            await callback_findnote_page(callback, notes, memory)
+
+    asyncio.run(scenario())
+
+    assert answers == ["Поиск устарел, повтори /findnote"] * 3
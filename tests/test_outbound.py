@@ -0,0 +1,64 @@
+import asyncio
+
+from aiogram.methods import EditMessageText, SendChatAction, SendMessage
+
+from app.middlewares.outbound import OutboundScheduler, previews
+from config import OutboundConfig
+
+
+def _scheduler(**overrides):
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method)
+        return True
+
+    config = OutboundConfig(**{"chat_rate": 20.0, "chat_burst": 1, **overrides})
+    return OutboundScheduler(config), make_request, sent
+
+
+def test_cancelled_request_is_not_sent_once_dequeued():
+    scheduler, make_request, sent = _scheduler()
+
+    async def scenario():
+        await scheduler(make_request, None, SendMessage(chat_id=1, text="первое"))
+        # The chat's bucket is empty now: the next message waits in the queue
+        waiting = asyncio.create_task(scheduler(make_request, None, SendMessage(chat_id=1, text="черновик")))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.sleep(0.2)
+        await scheduler(make_request, None, SendMessage(chat_id=1, text="последнее"))
+
+    asyncio.run(scenario())
+
+    assert [method.text for method in sent] == ["первое", "последнее"]
+
+
+def test_superseded_edit_is_sent_while_someone_still_waits():
+    scheduler, make_request, sent = _scheduler()
+
+    async def scenario():
+        await scheduler(make_request, None, SendMessage(chat_id=1, text="первое"))
+        with previews():
+            first = asyncio.create_task(scheduler(make_request, None, EditMessageText(chat_id=1, message_id=5, text="a")))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(scheduler(make_request, None, EditMessageText(chat_id=1, message_id=5, text="ab")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) is True
+    assert [method.text for method in sent] == ["первое", "ab"]
+
+
+def test_chat_action_results_are_plain_values():
+    scheduler, make_request, sent = _scheduler()
+
+    async def scenario():
+        first = await scheduler(make_request, None, SendChatAction(chat_id=1, action="typing"))
+        # Still shown: collapsed without a request
+        second = await scheduler(make_request, None, SendChatAction(chat_id=1, action="typing"))
+        return first, second
+
+    assert asyncio.run(scenario()) == (True, True)
+    assert len(sent) == 1
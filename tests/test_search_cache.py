@@ -0,0 +1,11 @@
+from app.services.search_cache import normalize_query
+
+
+def test_equivalent_phrasings_share_a_key():
+    assert normalize_query("Какая погода в Минске?") == normalize_query("погода минск")
+
+
+def test_word_order_repeats_and_negations_are_kept():
+    assert normalize_query("рейс москва берлин") != normalize_query("рейс берлин москва")
+    assert normalize_query("не работает телеграм") != normalize_query("работает телеграм")
+    assert normalize_query("да да") != normalize_query("да")
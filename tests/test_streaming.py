@@ -0,0 +1,36 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
+
+from app.utils.streaming import send_html
+
+
+class _StubBot:
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if parse_mode == "HTML" and text in self.reject:
+            raise TelegramBadRequest(SendMessage(chat_id=chat_id, text=text), "can't parse entities")
+        self.sent.append((text, parse_mode))
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None):
+        self.sent.append((f"edit {message_id}: {text}", parse_mode))
+
+
+def test_rejected_part_is_resent_alone_as_plain_text():
+    bot = _StubBot(reject={"<b>два</b> &amp; три"})
+
+    asyncio.run(send_html(bot, 1, ["<b>один</b>", "<b>два</b> &amp; три", "<i>четыре</i>"]))
+
+    assert bot.sent == [("<b>один</b>", "HTML"), ("два & три", None), ("<i>четыре</i>", "HTML")]
+
+
+def test_first_part_replaces_the_preview():
+    bot = _StubBot()
+
+    asyncio.run(send_html(bot, 1, ["<b>один</b>", "два"], edit_message_id=7))
+
+    assert bot.sent == [("edit 7: <b>один</b>", "HTML"), ("два", "HTML")]
@@ -0,0 +1,85 @@
+import re
+
+from app.utils.text import MESSAGE_LIMIT, format_text_html, html_to_text, split_html
+
+_TAG = re.compile(r"<(/?)([a-z]+)[^>]*>")
+
+
+def _balanced(markup: str) -> bool:
+    stack = []
+    for closing, name in _TAG.findall(markup):
+        if not closing:
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            return False
+    return not stack
+
+
+def test_split_keeps_parts_within_limit_and_balanced():
+    markup = format_text_html(("**Жирный** и *курсив* " + "слово " * 50 + "\n") * 40)
+
+    parts = split_html(markup)
+
+    assert len(parts) > 1
+    assert all(len(part) <= MESSAGE_LIMIT and _balanced(part) for part in parts)
+
+
+def test_split_reopens_tags_across_parts():
+    markup = "<b>" + "слово " * 1000 + "</b>"
+
+    parts = split_html(markup)
+
+    assert len(parts) == 2
+    assert all(part.startswith("<b>") and part.endswith("</b>") for part in parts)
+
+
+def test_split_drops_tag_that_cannot_fit():
+    markup = format_text_html("[поиск](https://www.google.com/search?q=" + "a" * 4100 + ")")
+
+    parts = split_html(markup)
+
+    assert parts == ["поиск"]
+
+
+def test_split_drops_only_the_oversized_tag():
+    markup = format_text_html("**до** [ссылка](https://example.com/" + "a" * 3000 + ") " + "текст " * 800)
+
+    parts = split_html(markup)
+
+    assert parts[0].startswith("<b>до</b> ссылка текст")
+    assert "<a " not in "".join(parts)
+    assert all(len(part) <= MESSAGE_LIMIT and _balanced(part) for part in parts)
+
+
+def _same_text(parts: list, markup: str) -> bool:
+    # Whitespace-only leftovers aren't sent as parts of their own
+    return html_to_text("".join(parts)).split() == html_to_text(markup).split()
+
+
+def test_split_keeps_the_text_after_a_late_line_break():
+    markup = "".join(f"Пункт {i}: " + "текст " * 13 + "\n" for i in range(90)) + "ИТОГ: последняя строка ответа"
+
+    parts = split_html(markup)
+
+    assert len(parts) > 1
+    assert all(len(part) <= MESSAGE_LIMIT for part in parts)
+    assert parts[-1].endswith("ИТОГ: последняя строка ответа")
+    assert _same_text(parts, markup)
+
+
+def test_split_counts_the_closer_of_a_new_tag():
+    markup = "<b>x</b>" * 30
+
+    parts = split_html(markup, limit=20)
+
+    assert all(len(part) <= 20 and _balanced(part) for part in parts)
+    assert _same_text(parts, markup)
+
+
+def test_split_keeps_all_text_with_many_short_tags():
+    markup = "".join(f"<b>{i}</b> <i>слово</i> &amp;\n" if i % 7 else f"строка {i}\n" for i in range(600))
+
+    parts = split_html(markup)
+
+    assert all(len(part) <= MESSAGE_LIMIT and _balanced(part) for part in parts)
+    assert _same_text(parts, markup)
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.memory import TurnContext
+from app.services.turns import Turn, TurnPipeline
+from config import LLMConfig
+
+
+class _Bot:
+    def __init__(self):
+        self.actions = []
+
+    async def send_chat_action(self, chat_id, action):
+        self.actions.append(action)
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None):
+        pass
+
+
+def _pipeline(searching: bool) -> TurnPipeline:
+    async def search(text):
+        return "результаты"
+
+    async def recall(user_id, text):
+        return []
+
+    async def stream_response(history, **kwargs):
+        yield "ответ"
+
+    async def load_turn_context(user_id):
+        return TurnContext()
+
+    async def add_turn(*args):
+        pass
+
+    return TurnPipeline(
+        memory_service=SimpleNamespace(load_turn_context=load_turn_context, add_turn=add_turn),
+        llm_service=SimpleNamespace(stream_response=stream_response),
+        search_service=SimpleNamespace(needs_search=lambda text: searching, search=search),
+        summary_service=SimpleNamespace(schedule=lambda user_id: None),
+        long_term_memory=SimpleNamespace(recall=recall),
+        config=SimpleNamespace(llm=LLMConfig(api_key="test")),
+    )
+
+
+def _actions(searching: bool, context=None):
+    bot = _Bot()
+
+    async def scenario():
+        pipeline = _pipeline(searching)
+        await pipeline.answer(bot, 1, "вопрос", Turn("text", 1), context=context)
+        await asyncio.gather(*pipeline._tasks)
+
+    asyncio.run(scenario())
+    return bot.actions
+
+
+def test_one_chat_action_per_turn():
+    assert _actions(searching=False) == ["typing"]
+    assert _actions(searching=True) == ["find_location"]
+
+
+def test_preloaded_context_sends_an_action_only_for_a_search():
+    assert _actions(searching=False, context=TurnContext()) == []
+    assert _actions(searching=True, context=TurnContext()) == ["find_location"]
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import fakeredis
+from aiogram import Bot
+
+from app.services.albums import MediaGroupCollector
+from app.update_stream import UpdateStream, UpdateWorker, poll_into
+from config import StreamConfig
+
+
+def _photo_update(update_id: int, chat_id: int = 42) -> str:
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "media_group_id": "album",
+            "photo": [{"file_id": f"p{update_id}", "file_unique_id": f"u{update_id}", "width": 1, "height": 1}],
+        },
+    })
+
+
+class _AlbumDispatcher:
+    def __init__(self, collector: MediaGroupCollector):
+        self._collector = collector
+        self.albums = []
+
+    async def feed_update(self, bot, update, **kwargs):
+        album = await self._collector.collect(update.message)
+        if album:
+            self.albums.append([message.message_id for message in album])
+
+
+def test_album_in_one_chat_is_collected_as_one():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        dp = _AlbumDispatcher(MediaGroupCollector(window=0.05))
+        bot = Bot("123456:test")
+        worker = UpdateWorker(redis, StreamConfig(shards=1), dp, bot, {})
+        for update_id in (1, 2, 3):
+            await worker._dispatch("updates:0", f"{update_id}-0", {"update_id": update_id, "chat": "42", "update": _photo_update(update_id)})
+        await asyncio.gather(*worker._tasks)
+        await bot.session.close()
+        return dp.albums
+
+    assert asyncio.run(scenario()) == [[1, 2, 3]]
+
+
+class _FlakyStream(UpdateStream):
+    def __init__(self):
+        self.published = []
+        self.failures = 1
+
+    async def publish(self, update):
+        if update.update_id == 2 and self.failures:
+            self.failures -= 1
+            raise ConnectionError("redis is down")
+        self.published.append(update.update_id)
+
+
+class _PollingBot:
+    def __init__(self, stream: _FlakyStream):
+        self._stream = stream
+        self.offsets = []
+
+    async def get_updates(self, offset=None, **kwargs):
+        from aiogram.types import Update
+        self.offsets.append(offset)
+        if len(self._stream.published) >= 3:
+            raise asyncio.CancelledError
+        start = offset or 1
+        return [Update.model_validate({"update_id": i}) for i in range(start, 4)]
+
+
+def test_failed_publish_does_not_advance_offset(monkeypatch):
+    async def no_sleep(_):
+        pass
+    monkeypatch.setattr("app.update_stream.asyncio.sleep", no_sleep)
+    stream = _FlakyStream()
+    bot = _PollingBot(stream)
+
+    try:
+        asyncio.run(poll_into(bot, stream))
+    except asyncio.CancelledError:
+        pass
+
+    assert stream.published == [1, 2, 3]
+    assert bot.offsets == [None, 2, 4]
@@ -0,0 +1,82 @@
+import asyncio
+
+import numpy as np
+
+from app.services import voice as voice_module
+from app.services.voice import SEGMENT_GAP, VoiceService
+from app.utils.audio import SAMPLE_RATE
+from config import VoiceConfig
+
+_sleep = asyncio.sleep
+
+
+def _noise(seconds: float) -> bytes:
+    rng = np.random.default_rng(0)
+    return rng.integers(-8000, 8000, int(seconds * SAMPLE_RATE), dtype=np.int16).tobytes()
+
+
+def _service(monkeypatch, upload, encode=None, **config) -> VoiceService:
+    service = VoiceService(VoiceConfig(api_key="test", **config))
+    pcm = _noise(100)
+
+    async def decode(audio):
+        return pcm
+
+    async def default_encode(data):
+        return data[:8]  # stands for the Opus bytes
+
+    monkeypatch.setattr(service, "_decode", decode)
+    monkeypatch.setattr(service, "_encode", encode or default_encode)
+    monkeypatch.setattr(service, "_upload", upload)
+    # Backoff without the wait
+    monkeypatch.setattr(voice_module.asyncio, "sleep", lambda seconds: _sleep(0.01))
+    return service
+
+
+def test_encoding_failure_uploads_the_original(monkeypatch):
+    uploads = []
+
+    async def upload(audio, filename):
+        uploads.append((audio, filename))
+        return "текст"
+
+    async def encode(pcm):
+        raise RuntimeError("FFmpeg encoding failed")
+
+    service = _service(monkeypatch, upload, encode)
+    text = asyncio.run(service.transcribe(b"original", duration=100))
+
+    assert text == "текст"
+    assert uploads == [(b"original", "voice.ogg")]
+
+
+def test_retry_backoff_frees_the_slot_and_failed_segments_are_marked(monkeypatch):
+    log = []
+
+    async def upload(audio, filename):
+        log.append(filename)
+        if filename == "segment_0.ogg":
+            raise ConnectionError("upstream down")
+        await _sleep(0.02)
+        return filename.split(".")[0]
+
+    service = _service(monkeypatch, upload, max_parallel_segments=1, segment_retries=2)
+    text = asyncio.run(service.transcribe(b"original", duration=100))
+
+    # Other segments went out while segment 0 waited to retry
+    assert log.index("segment_1.ogg") < len(log) - 1 - log[::-1].index("segment_0.ogg")
+    assert text.split()[0] == SEGMENT_GAP
+    assert "segment_1" in text
+
+
+def test_all_segments_failing_raises(monkeypatch):
+    async def upload(audio, filename):
+        raise ConnectionError("upstream down")
+
+    service = _service(monkeypatch, upload, segment_retries=2)
+    try:
+        asyncio.run(service.transcribe(b"original", duration=100))
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("expected the upload error")